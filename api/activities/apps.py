@@ -8,3 +8,6 @@ class ActivitiesAppConfig(AppConfig):
     """Activities app config."""
     name = 'api.activities'
     verbose_name = 'Activities'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,38 @@
+# Generated by Django 3.0.3 on 2021-04-21 12:37
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+
+
+def copy_activity_status(apps, schema_editor):
+    Activity = apps.get_model('activities', 'Activity')
+    for model_name in ['OfferActivity', 'DeliveryActivity', 'CancelOrderActivity']:
+        model = apps.get_model('activities', model_name)
+        Activity.objects.filter(pk__in=model.objects.values('activity_id')).update(
+            status=Subquery(model.objects.filter(activity_id=OuterRef('pk')).values('status')[:1])
+        )
+    Activity.objects.update(
+        preview=Concat('type', Coalesce('status', Value('')), output_field=models.CharField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0002_auto_20210328_2249'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='status',
+            field=models.CharField(blank=True, max_length=2, null=True),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='preview',
+            field=models.CharField(blank=True, max_length=4, null=True),
+        ),
+        migrations.RunPython(copy_activity_status, migrations.RunPython.noop),
+    ]
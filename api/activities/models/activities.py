@@ -33,9 +33,31 @@ class Activity(CModel):
 
     active = models.BooleanField(default=True)
 
+    # Copied from the activity item by signals.sync_activity_status
+    status = models.CharField(max_length=2, blank=True, null=True)
+    preview = models.CharField(max_length=4, blank=True, null=True)
+
+    @staticmethod
+    def get_preview(type, status=None):
+        """Return the label of the activity shown in the chat list."""
+        if status:
+            return type + status
+        return type
+
+    def save(self, **kwargs):
+        if not self.preview:
+            self.preview = self.get_preview(self.type, self.status)
+        super(Activity, self).save(**kwargs)
+
     def get_activity_item(self):
+        # Set in batch by helpers.prefetch_activity_items
+        if hasattr(self, '_activity_item'):
+            return self._activity_item
+
         from api.utils import helpers
         model, _ = helpers.get_activity_classes(self.type)
+        if not model:
+            return None
 
         return model.objects.filter(activity=self).first()
 
@@ -18,6 +18,15 @@ from .offers_activity import OfferActivityModelSerializer
 from api.utils import helpers
 
 
+class ActivityListSerializer(serializers.ListSerializer):
+    """Load the items of the activities with one query per activity type."""
+
+    def to_representation(self, data):
+        activities = list(data.all() if hasattr(data, 'all') else data)
+        helpers.prefetch_activity_items(activities)
+        return super(ActivityListSerializer, self).to_representation(activities)
+
+
 class ActivityModelSerializer(serializers.ModelSerializer):
     """User model serializer."""
     activity = serializers.SerializerMethodField(read_only=True)
@@ -26,9 +35,12 @@ class ActivityModelSerializer(serializers.ModelSerializer):
         """Meta class."""
 
         model = Activity
+        list_serializer_class = ActivityListSerializer
         fields = (
             "id",
             "type",
+            "status",
+            "preview",
             "activity",
             "created"
         )
@@ -40,9 +52,9 @@ class ActivityModelSerializer(serializers.ModelSerializer):
         model, serializer = helpers.get_activity_classes(obj.type)
 
         if model and serializer:
-            activity_queryset = model.objects.filter(activity=obj)
+            activity_item = obj.get_activity_item()
 
-            if activity_queryset.exists():
+            if activity_item:
 
-                return serializer(activity_queryset.first(), many=False).data
+                return serializer(activity_item, many=False).data
         return None
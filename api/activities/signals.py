@@ -0,0 +1,21 @@
+"""Activities signals."""
+
+# Django
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+# Models
+from api.activities.models import Activity, OfferActivity, DeliveryActivity, CancelOrderActivity
+
+
+@receiver(post_save, sender=OfferActivity)
+@receiver(post_save, sender=DeliveryActivity)
+@receiver(post_save, sender=CancelOrderActivity)
+def sync_activity_status(sender, instance, **kwargs):
+    """Copy the status of an activity item to its activity."""
+    if not instance.activity_id:
+        return
+    preview = Activity.get_preview(instance.activity.type, instance.status)
+    Activity.objects.filter(pk=instance.activity_id).update(status=instance.status, preview=preview)
+    instance.activity.status = instance.status
+    instance.activity.preview = preview
@@ -0,0 +1,51 @@
+# Django
+from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from djmoney.money import Money
+
+# Models
+from api.users.models import User
+from api.orders.models import Order, Revision
+from api.activities.models import Activity, RevisionActivity
+
+# Serializers
+from api.activities.serializers import ActivityModelSerializer
+
+
+class ActivityLoaderTestCase(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        buyer = User.objects.create_user("ivan", "ivan@gmail.com", "admin321")
+        self.order = Order.objects.create(
+            seller=seller,
+            buyer=buyer,
+            title="Logo",
+            description="A logo",
+            unit_amount=Money(10, 'USD')
+        )
+
+    def add_revisions(self, count):
+        for i in range(count):
+            activity = Activity.objects.create(order=self.order, type=Activity.REVISION)
+            revision = Revision.objects.create(order=self.order, reason="Change {}".format(i))
+            RevisionActivity.objects.create(activity=activity, revision=revision)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = ActivityModelSerializer(Activity.objects.filter(order=self.order), many=True).data
+        return len(queries), data
+
+    def test_one_query_per_activity_type(self):
+        """Serializing more activities should not run more queries"""
+        self.add_revisions(2)
+        few_queries, _ = self.count_queries()
+        self.add_revisions(4)
+        many_queries, data = self.count_queries()
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual(len(data), 6)
+        self.assertIsNotNone(data[0]["activity"]["revision"])
+
+    def test_activity_without_serializer(self):
+        activity = Activity.objects.create(order=self.order, type=Activity.INCREASE_AMOUNT)
+        self.assertIsNone(ActivityModelSerializer(activity).data["activity"])
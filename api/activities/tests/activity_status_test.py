@@ -0,0 +1,38 @@
+# Django
+from django.test import TestCase
+
+# Models
+from api.users.models import User
+from api.chats.models import Chat, Message, InboxEntry
+from api.activities.models import Activity, DeliveryActivity
+
+
+class ActivityStatusTestCase(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        self.buyer = User.objects.create_user("ivan", "ivan@gmail.com", "admin321")
+        self.chat, _ = Chat.objects.get_or_create_direct(self.seller, self.buyer)
+
+    def test_item_status_is_copied(self):
+        """The activity should keep the status and preview of its item"""
+        activity = Activity.objects.create(type=Activity.DELIVERY)
+        self.assertEqual(activity.preview, Activity.DELIVERY)
+
+        item = DeliveryActivity.objects.create(activity=activity)
+        activity.refresh_from_db()
+        self.assertEqual(activity.status, DeliveryActivity.PENDENDT)
+        self.assertEqual(activity.preview, "DEPE")
+
+        item.status = DeliveryActivity.ACCEPTED
+        item.save()
+        activity.refresh_from_db()
+        self.assertEqual(activity.preview, "DEAC")
+
+    def test_inbox_preview(self):
+        activity = Activity.objects.create(type=Activity.DELIVERY)
+        DeliveryActivity.objects.create(activity=activity)
+        Message.objects.create(chat=self.chat, activity=activity, sent_by=self.seller)
+
+        entry = InboxEntry.objects.get(user=self.buyer, chat=self.chat)
+        self.assertEqual(entry.last_message_preview, "DEPE")
+        self.assertEqual(entry.last_message_activity_status, DeliveryActivity.PENDENDT)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ChatsConfig(AppConfig):
     name = "api.chats"
+
+    def ready(self):
+        from . import signals
@@ -1,35 +1,83 @@
 # chat/consumers.py
 import json
+import logging
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from .uploads import ChunkedUpload, UploadError, parse_chunk
 from .views.messages import create_message
 
+logger = logging.getLogger(__name__)
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
         self.room_group_name = "chat_%s" % self.room_name
+        self.uploads = {}
         # Join room group
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
 
         await self.accept()
 
     async def disconnect(self, close_code):
+        # Drop the unfinished uploads
+        for upload in self.uploads.values():
+            upload.close()
+        self.uploads = {}
+
         # Leave room group
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
     # Receive message from WebSocket
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            await self.upload_chunk(bytes_data)
+            return
+
         text_data_json = json.loads(text_data)
-        files = text_data_json['files']
+        message_type = text_data_json.get("type")
+        if message_type == "upload_start":
+            await self.upload_start(text_data_json)
+        elif message_type == "upload_abort":
+            await self.upload_abort(text_data_json)
+        else:
+            await self.new_message(text_data_json)
+
+    async def new_message(self, text_data_json):
+        files = text_data_json.get('files', [])
 
         text = text_data_json["text"]
         sent_by = text_data_json["sent_by"]
-        # Send message to room group
 
-        # Create message
+        # Take the finished uploads committed by this message
+        uploads = []
+        for upload_id in text_data_json.get("uploads", []):
+            upload = self.uploads.get(upload_id)
+            if not upload or not upload.complete:
+                await self.send_upload_error(upload_id, "Upload not completed")
+                return
+            uploads.append(upload)
 
-        message, chat__pk, files = await create_message(self, text, sent_by, files)
+        # Move the uploaded files to the storage out of the database thread
+        stored_files = []
+        for upload in uploads:
+            try:
+                name = await sync_to_async(upload.store, thread_sensitive=False)()
+            except Exception as e:
+                # The uploads are kept, so the client can send the message again
+                logger.exception(e)
+                await self.send_upload_error(upload.id, "Unable to store the file")
+                return
+            stored_files.append((name, upload.name))
+        for upload in uploads:
+            del self.uploads[upload.id]
+            upload.close()
 
+        # Create message
+        message, chat__pk, files = await create_message(self, text, sent_by, files, stored_files)
+
+        # Send message to room group
         await self.channel_layer.group_send(
             self.room_group_name,
             {
@@ -43,6 +91,55 @@ class ChatConsumer(AsyncWebsocketConsumer):
             },
         )
 
+    async def upload_start(self, data):
+        if len(self.uploads) >= settings.CHAT_UPLOAD_MAX_PENDING:
+            await self.send_upload_error(None, "Too many uploads in progress")
+            return
+        try:
+            upload = await sync_to_async(ChunkedUpload, thread_sensitive=False)(
+                str(data.get("name", "")), int(data.get("size", 0))
+            )
+        except (UploadError, ValueError) as e:
+            await self.send_upload_error(None, str(e))
+            return
+        self.uploads[upload.id] = upload
+        await self.send(text_data=json.dumps({
+            "type": "upload_ready",
+            "upload_id": upload.id,
+            "name": upload.name,
+            "chunk_size": settings.CHAT_UPLOAD_CHUNK_SIZE,
+        }))
+
+    async def upload_chunk(self, bytes_data):
+        upload_id = None
+        try:
+            upload_id, offset, payload = parse_chunk(bytes_data)
+            upload = self.uploads.get(upload_id)
+            if not upload:
+                raise UploadError("Upload not found")
+            received = await sync_to_async(upload.write, thread_sensitive=False)(offset, payload)
+        except (UploadError, ValueError) as e:
+            await self.send_upload_error(upload_id, str(e))
+            return
+        # The client sends the next chunk once the previous one is acknowledged
+        await self.send(text_data=json.dumps({
+            "type": "upload_progress",
+            "upload_id": upload_id,
+            "received": received,
+        }))
+
+    async def upload_abort(self, data):
+        upload = self.uploads.pop(data.get("upload_id"), None)
+        if upload:
+            upload.close()
+
+    async def send_upload_error(self, upload_id, detail):
+        await self.send(text_data=json.dumps({
+            "type": "upload_error",
+            "upload_id": upload_id,
+            "detail": detail,
+        }))
+
     # Receive message from room group
     async def chat_message(self, event):
         id = event["id"]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2021-04-14 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0004_messagefile_chat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='pair_key',
+            field=models.CharField(blank=True, max_length=73, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.0.3 on 2021-04-15 09:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chats', '0005_chat_pair_key'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='chat',
+            options={'ordering': ['-modified']},
+        ),
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Date time on which the object was created.', verbose_name='created at')),
+                ('modified', models.DateTimeField(auto_now=True, help_text='Date time on which the object was last modified.', verbose_name='modified at')),
+                ('counterpart_username', models.CharField(blank=True, max_length=150, null=True)),
+                ('counterpart_picture', models.CharField(blank=True, max_length=500, null=True)),
+                ('last_message_preview', models.TextField(blank=True, max_length=5000, null=True)),
+                ('last_message_activity_status', models.CharField(blank=True, max_length=2, null=True)),
+                ('last_message_sent_by_username', models.CharField(blank=True, max_length=150, null=True)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='chats.Chat')),
+                ('counterpart', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chats.Message')),
+                ('last_message_sent_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_message_at'],
+                'unique_together': {('user', 'chat')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inboxentry',
+            index=models.Index(fields=['user', '-last_message_at'], name='chats_inbox_user_last_idx'),
+        ),
+    ]
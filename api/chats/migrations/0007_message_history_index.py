@@ -0,0 +1,17 @@
+# Generated by Django 3.0.3 on 2021-04-16 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0006_inboxentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', '-created', '-id'], name='chats_message_history_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.0.3 on 2021-04-18 10:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_seen_by(apps, schema_editor):
+    SeenBy = apps.get_model('chats', 'SeenBy')
+    InboxEntry = apps.get_model('chats', 'InboxEntry')
+    seen = SeenBy.objects.exclude(message=None).values_list('user_id', 'chat_id', 'message_id', 'message__created')
+    for user_id, chat_id, message_id, created in seen.iterator():
+        InboxEntry.objects.filter(user_id=user_id, chat_id=chat_id).update(
+            last_read_message_id=message_id,
+            last_read_at=created
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0007_message_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inboxentry',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chats.Message'),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(copy_seen_by, migrations.RunPython.noop),
+    ]
@@ -2,3 +2,4 @@ from .chats import Chat
 from .messages import Message, MessageFile
 from .participants import Participant
 from .seen_by import SeenBy
+from .inbox_entries import InboxEntry
@@ -1,5 +1,32 @@
 from api.utils.models import CModel
-from django.db import models
+from django.db import models, transaction, IntegrityError
+
+
+def direct_pair_key(user_a, user_b):
+    """Return the canonical key of the direct chat between two users or user ids."""
+    return ":".join(sorted([str(getattr(user_a, "pk", user_a)), str(getattr(user_b, "pk", user_b))]))
+
+
+class ChatManager(models.Manager):
+
+    def get_direct(self, user_a, user_b):
+        """Return the direct chat between two users or None."""
+        return self.filter(pair_key=direct_pair_key(user_a, user_b)).first()
+
+    def get_or_create_direct(self, user_a, user_b):
+        """Return a (chat, created) tuple with the direct chat between two users."""
+        pair_key = direct_pair_key(user_a, user_b)
+        chat = self.filter(pair_key=pair_key).first()
+        if chat:
+            return chat, False
+        try:
+            with transaction.atomic():
+                chat = self.create(pair_key=pair_key)
+                chat.participants.add(user_a, user_b)
+        except IntegrityError:
+            # Created concurrently by another request
+            return self.get(pair_key=pair_key), False
+        return chat, True
 
 
 class Chat(CModel):
@@ -12,7 +39,11 @@ class Chat(CModel):
     last_message = models.ForeignKey(
         "chats.Message", on_delete=models.SET_NULL, null=True, related_name="last_message"
     )
+    # Sorted participant ids, only set on direct (two participant) chats
+    pair_key = models.CharField(max_length=73, unique=True, blank=True, null=True)
+
+    objects = ChatManager()
 
     class Meta:
 
-        ordering = ["-last_message__created"]
+        ordering = ["-modified"]
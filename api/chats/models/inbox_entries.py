@@ -0,0 +1,191 @@
+from api.utils.models import CModel
+from api.chats.models.messages import Message
+from django.db import models, transaction
+from django.db.models import F, Q, Value, Count, Subquery
+from django.db.models.functions import Coalesce
+
+
+def get_message_preview(message):
+    """Return the (preview, activity status) shown in the chat list for a message."""
+    activity = message.activity
+    if not activity:
+        return message.text, None
+    return activity.preview or activity.get_preview(activity.type, activity.status), activity.status
+
+
+class InboxEntryManager(models.Manager):
+
+    def record_message(self, message):
+        """Project a new message into the inbox of every chat participant."""
+        chat = message.chat
+        sent_by = message.sent_by
+        preview, activity_status = get_message_preview(message)
+        values = {
+            "last_message": message,
+            "last_message_preview": preview,
+            "last_message_activity_status": activity_status,
+            "last_message_sent_by": sent_by,
+            "last_message_sent_by_username": sent_by.username if sent_by else None,
+            "last_message_at": message.created,
+        }
+
+        participants = list(chat.participants.all())
+        existing = set(self.filter(chat=chat).values_list("user_id", flat=True))
+        new_entries = []
+        for user in participants:
+            if user.pk in existing:
+                continue
+            counterpart = next((p for p in participants if p.pk != user.pk), None)
+            is_sender = sent_by and user.pk == sent_by.pk
+            new_entries.append(self.model(
+                user=user,
+                chat=chat,
+                counterpart=counterpart,
+                counterpart_username=counterpart.username if counterpart else None,
+                counterpart_picture=counterpart.picture.url if counterpart and counterpart.picture else None,
+                unread_count=0 if is_sender else 1,
+                last_read_message=message if is_sender else None,
+                last_read_at=message.created if is_sender else None,
+                **values
+            ))
+        if new_entries:
+            self.bulk_create(new_entries, ignore_conflicts=True)
+
+        if existing:
+            entries = self.filter(chat=chat, user_id__in=existing)
+            if sent_by:
+                # The sender has read the chat up to its own message
+                entries.exclude(user=sent_by).update(unread_count=F("unread_count") + 1, **values)
+                entries.filter(user=sent_by).update(
+                    unread_count=0,
+                    last_read_message=message,
+                    last_read_at=message.created,
+                    **values
+                )
+            else:
+                entries.update(unread_count=F("unread_count") + 1, **values)
+
+    def mark_read(self, user, chat, message=None):
+        """Move the read watermark of a user in a chat.
+
+        Marks the chat as read up to message, or up to the last message if
+        None is given. The watermark only moves forward and the pending
+        notifications of the chat are cleared in a single statement, so the
+        cost does not depend on the number of unread messages or notifications.
+
+        Return a dict with the new watermark, or None if it did not move.
+        """
+        from api.notifications import outbox
+
+        with transaction.atomic():
+            read = self._move_watermark(user, chat, message)
+            if read:
+                event = {
+                    "type": "chat.read",
+                    "event": "CHAT_READ",
+                    "chat__pk": str(chat.pk),
+                    "user__pk": str(user.pk),
+                    "message__pk": str(read["message_id"]),
+                    "read_at": read["read_at"].isoformat(),
+                }
+                for user_id in self.filter(chat=chat).values_list("user_id", flat=True):
+                    outbox.group_send("user-%s" % user_id, event)
+        return read
+
+    def _move_watermark(self, user, chat, message):
+        from api.notifications.models import NotificationUser
+
+        entries = self.filter(user=user, chat=chat)
+        notifications = NotificationUser.objects.filter(user=user, is_read=False, notification__chat=chat)
+        if message is None:
+            entry = entries.values("last_message_id", "last_message_at", "last_read_message_id").first()
+            if not entry or not entry["last_message_id"] or entry["last_read_message_id"] == entry["last_message_id"]:
+                # Notifications are created after the message, they may still be pending
+                notifications.mark_read()
+                return None
+            message_id, read_at = entry["last_message_id"], entry["last_message_at"]
+            updated = entries.update(
+                last_read_message_id=message_id,
+                last_read_at=read_at,
+                unread_count=0
+            )
+        else:
+            message_id, read_at = message.pk, message.created
+            unread_messages = Message.objects.filter(
+                chat=chat,
+                created__gt=read_at
+            ).exclude(sent_by=user).order_by().values("chat").annotate(count=Count("pk")).values("count")
+            updated = entries.filter(
+                Q(last_read_at__isnull=True) | Q(last_read_at__lt=read_at)
+            ).update(
+                last_read_message_id=message_id,
+                last_read_at=read_at,
+                unread_count=Coalesce(Subquery(unread_messages), Value(0))
+            )
+            # Notifications of the messages past the watermark stay unread
+            notifications = notifications.exclude(
+                notification__messages__created__gt=read_at
+            ).exclude(
+                notification__activity__message__created__gt=read_at
+            )
+        if not updated:
+            return None
+
+        notifications.mark_read()
+
+        read = {
+            "chat_id": chat.pk,
+            "user_id": user.pk,
+            "message_id": message_id,
+            "read_at": read_at,
+        }
+        return read
+
+    def update_counterpart(self, user):
+        """Refresh the denormalized username and picture of a user."""
+        picture = user.picture.url if user.picture else None
+        self.filter(counterpart=user).update(
+            counterpart_username=user.username,
+            counterpart_picture=picture
+        )
+        self.filter(last_message_sent_by=user).update(last_message_sent_by_username=user.username)
+
+
+class InboxEntry(CModel):
+    """Chat list projection, one row per chat participant."""
+
+    user = models.ForeignKey("users.User", on_delete=models.CASCADE, related_name="inbox_entries")
+    chat = models.ForeignKey("chats.Chat", on_delete=models.CASCADE, related_name="inbox_entries")
+
+    counterpart = models.ForeignKey(
+        "users.User", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    counterpart_username = models.CharField(max_length=150, blank=True, null=True)
+    counterpart_picture = models.CharField(max_length=500, blank=True, null=True)
+
+    last_message = models.ForeignKey(
+        "chats.Message", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    last_message_preview = models.TextField(max_length=5000, blank=True, null=True)
+    last_message_activity_status = models.CharField(max_length=2, blank=True, null=True)
+    last_message_sent_by = models.ForeignKey(
+        "users.User", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    last_message_sent_by_username = models.CharField(max_length=150, blank=True, null=True)
+    last_message_at = models.DateTimeField(blank=True, null=True)
+
+    last_read_message = models.ForeignKey(
+        "chats.Message", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    last_read_at = models.DateTimeField(blank=True, null=True)
+
+    unread_count = models.PositiveIntegerField(default=0)
+
+    objects = InboxEntryManager()
+
+    class Meta:
+        ordering = ["-last_message_at"]
+        unique_together = [["user", "chat"]]
+        indexes = [
+            models.Index(fields=["user", "-last_message_at"], name="chats_inbox_user_last_idx"),
+        ]
@@ -12,6 +12,9 @@ class Message(CModel):
 
     class Meta:
         ordering = ["-created"]
+        indexes = [
+            models.Index(fields=["chat", "-created", "-id"], name="chats_message_history_idx"),
+        ]
 
 
 class MessageFile(CModel):
@@ -3,3 +3,4 @@ from .messages import *
 from .message_files import *
 from .participants import *
 from .seen_by import *
+from .inbox_entries import *
@@ -7,8 +7,7 @@ from rest_framework import serializers
 
 # Models
 from api.users.models import User
-from api.chats.models import Chat, SeenBy, MessageFile
-from api.notifications.models import NotificationUser
+from api.chats.models import Chat, MessageFile, InboxEntry
 
 # Serializers
 from api.users.serializers import UserModelSerializer
@@ -65,15 +64,7 @@ class ChatModelSerializer(serializers.ModelSerializer):
 
         if obj.last_message:
             if obj.last_message.activity:
-
-                activity = obj.last_message.activity
-                activity_item = activity.get_activity_item()
-                if not activity_item:
-                    return None
-                if hasattr(activity_item, 'status'):
-                    return activity.type+activity_item.status
-                else:
-                    return activity.type
+                return obj.last_message.activity.preview
             return obj.last_message.text
 
         return None
@@ -84,12 +75,11 @@ class ChatModelSerializer(serializers.ModelSerializer):
             if obj.last_message.sent_by == user:
                 return True
 
-            seen_by = SeenBy.objects.filter(chat=obj, user=user)
-            if seen_by.exists():
-                seen_by = seen_by[0]
-
-                return seen_by.message == obj.last_message
-            return False
+            return InboxEntry.objects.filter(
+                chat=obj,
+                user=user,
+                last_read_message=obj.last_message
+            ).exists()
         else:
             return True
 
@@ -153,16 +143,7 @@ class RetrieveChatModelSerializer(serializers.ModelSerializer):
 
         if obj.last_message:
             if obj.last_message.activity:
-                activity = obj.last_message.activity
-                activity_item = activity.get_activity_item()
-
-                if not activity_item:
-                    return None
-                if hasattr(activity_item, 'status'):
-                    return activity.type+activity_item.status
-                else:
-                    return activity.type
-
+                return obj.last_message.activity.preview
             return obj.last_message.text
 
         return None
@@ -174,10 +155,11 @@ class RetrieveChatModelSerializer(serializers.ModelSerializer):
             to_user = to_users[0]
 
             if obj.last_message and obj.last_message.sent_by == to_user:
-                seen_by = SeenBy.objects.filter(chat=obj, user=to_user)
-                if seen_by.exists():
-                    seen_by = seen_by[0]
-                    return seen_by.message == obj.last_message
+                return InboxEntry.objects.filter(
+                    chat=obj,
+                    user=to_user,
+                    last_read_message=obj.last_message
+                ).exists()
 
         return False
 
@@ -201,42 +183,11 @@ class CreateChatSerializer(serializers.Serializer):
         to_user = get_object_or_404(User, pk=data["to_user"])
         from_user = self.context["request"].user
 
-        chats = Chat.objects.filter(participants=from_user)
-        chats = chats.filter(participants=to_user)
-
-        if chats.exists():
-            for chat in chats:
-                if chat.participants.all().count() == 2:
-                    return {"chat": chat}
-            raise serializers.ValidationError("Chat not found")
         return {"to_user": to_user, "from_user": from_user}
 
     def create(self, validated_data):
-        if "chat" in validated_data:
-            return {"chat": validated_data["chat"], "status": "retrieved"}
-
-        to_user = validated_data["to_user"]
-        from_user = validated_data["from_user"]
-        chat = Chat.objects.create()
-
-        chat.participants.add(to_user)
-        chat.participants.add(from_user)
-        chat.save()
-
-        return {"chat": chat, "status": "created"}
-
-
-class ClearChatNotification(serializers.Serializer):
-
-    def update(self, instance, validated_data):
-        user = self.context['request'].user
-        notifications = NotificationUser.objects.filter(notification__chat=instance, is_read=False, user=user)
-
-        for notification in notifications:
-            notification.is_read = True
-            notification.save()
-
-        user.have_messages_notificatoin = False
-        user.save()
-
-        return instance
+        chat, created = Chat.objects.get_or_create_direct(
+            validated_data["from_user"],
+            validated_data["to_user"]
+        )
+        return {"chat": chat, "status": "created" if created else "retrieved"}
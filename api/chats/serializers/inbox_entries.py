@@ -0,0 +1,47 @@
+# Django REST Framework
+from rest_framework import serializers
+
+# Models
+from api.chats.models import InboxEntry
+
+
+class InboxEntryModelSerializer(serializers.ModelSerializer):
+    """Inbox entry model serializer.
+
+    Renders the same payload as ChatModelSerializer from the denormalized row.
+    """
+
+    id = serializers.UUIDField(source="chat_id", read_only=True)
+    room_name = serializers.SerializerMethodField(read_only=True)
+    picture = serializers.CharField(source="counterpart_picture", read_only=True)
+    last_message = serializers.CharField(source="last_message_preview", read_only=True)
+    created = serializers.DateTimeField(source="chat.created", read_only=True)
+    last_message_seen = serializers.SerializerMethodField(read_only=True)
+    last_message_sent_by = serializers.UUIDField(source="last_message_sent_by_id", read_only=True)
+
+    class Meta:
+        """Meta class."""
+
+        model = InboxEntry
+        fields = (
+            "id",
+            "room_name",
+            "picture",
+            "last_message",
+            "created",
+            "last_message_seen",
+            "last_message_sent_by",
+            "last_message_sent_by_username",
+            "last_message_at",
+            "unread_count",
+        )
+
+        read_only_fields = fields
+
+    def get_room_name(self, obj):
+        return obj.chat.room_name or obj.counterpart_username
+
+    def get_last_message_seen(self, obj):
+        if not obj.last_message_id:
+            return True
+        return obj.last_message_sent_by_id == obj.user_id or obj.unread_count == 0
@@ -7,8 +7,11 @@ from api.chats.models import Message, Chat, MessageFile
 # Serializers
 from api.activities.serializers import ActivityModelSerializer
 
+# Utils
+from api.utils.serializers.dynamic_fields import DynamicFieldsMixin
 
-class MessageModelSerializer(serializers.ModelSerializer):
+
+class MessageModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """User model serializer."""
 
     sent_by = serializers.SerializerMethodField(read_only=True)
@@ -31,14 +34,21 @@ class MessageModelSerializer(serializers.ModelSerializer):
         read_only_fields = ("id",)
 
     def get_sent_by(self, obj):
-        from api.users.serializers import UserModelSerializer
+        from api.users.serializers import UserModelSerializer, UserSummarySerializer
 
-        return UserModelSerializer(obj.sent_by, many=False).data
+        serializer_class = UserModelSerializer if self.is_expanded("sent_by") else UserSummarySerializer
+        # Pages share the serialized senders through the context
+        senders = self.context.get("senders")
+        if senders is None:
+            return serializer_class(obj.sent_by, many=False).data
+        if obj.sent_by_id not in senders:
+            senders[obj.sent_by_id] = serializer_class(obj.sent_by, many=False).data
+        return senders[obj.sent_by_id]
 
     def get_files(self, obj):
 
         from api.chats.serializers import MessageFileModelSerializer
-        files = MessageFile.objects.filter(message=obj.id)
+        files = obj.messagefile_set.all()
         return MessageFileModelSerializer(files, many=True).data
 
 
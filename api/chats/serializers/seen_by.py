@@ -2,7 +2,7 @@
 from rest_framework import serializers
 
 # Models
-from api.chats.models import SeenBy
+from api.chats.models import SeenBy, Message, InboxEntry
 
 # Serializers
 from api.users.serializers import UserModelSerializer
@@ -33,9 +33,21 @@ class CreateSeenBySerializer(serializers.Serializer):
         user = self.context["request"].user
         chat = self.context["chat"]
 
-        seen_by, created = SeenBy.objects.get_or_create(chat=chat, user=user)
-        if seen_by.message != chat.last_message:
+        return InboxEntry.objects.mark_read(user, chat)
 
-            seen_by.message = chat.last_message
-            seen_by.save()
-        return seen_by
\ No newline at end of file
+
+class MarkChatReadSerializer(serializers.Serializer):
+    message = serializers.UUIDField(required=False)
+
+    def validate_message(self, data):
+        chat = self.context["chat"]
+        message = Message.objects.filter(chat=chat, pk=data).first()
+        if not message:
+            raise serializers.ValidationError("Message not found")
+        return message
+
+    def create(self, validated_data):
+        user = self.context["request"].user
+        chat = self.context["chat"]
+
+        return InboxEntry.objects.mark_read(user, chat, validated_data.get("message"))
\ No newline at end of file
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+# Models
+from api.chats.models import Message, InboxEntry
+
+
+@receiver(post_save, sender=Message)
+def update_inbox_entries(sender, instance, created, **kwargs):
+    if created:
+        InboxEntry.objects.record_message(instance)
@@ -1,3 +1,236 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 
-# Create your tests here.
+# Django REST Framework
+from rest_framework.test import APITestCase
+
+# Models
+from api.users.models import User
+from api.chats.models import Chat, Message, InboxEntry
+from api.notifications.models import Notification, NotificationUser
+
+# Channels
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+# Utilities
+from api.chats import routing
+from api.chats.uploads import ChunkedUpload, UploadError, parse_chunk
+from unittest import mock
+import tempfile
+import shutil
+import struct
+import uuid
+
+
+class DirectChatTestCase(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        self.buyer = User.objects.create_user("ivan", "ivan@gmail.com", "admin321")
+
+    def test_get_or_create_direct_is_symmetric(self):
+        """Both participant orders should resolve the same chat"""
+        chat, created = Chat.objects.get_or_create_direct(self.seller, self.buyer)
+        same_chat, same_created = Chat.objects.get_or_create_direct(self.buyer, self.seller)
+        self.assertTrue(created)
+        self.assertFalse(same_created)
+        self.assertEqual(chat, same_chat)
+        self.assertEqual(chat.participants.count(), 2)
+
+    def test_get_direct(self):
+        """get_direct should not create chats"""
+        self.assertIsNone(Chat.objects.get_direct(self.seller, self.buyer))
+        chat, _ = Chat.objects.get_or_create_direct(self.seller, self.buyer)
+        self.assertEqual(Chat.objects.get_direct(self.buyer, self.seller), chat)
+
+
+class InboxEntryTestCase(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        self.buyer = User.objects.create_user("ivan", "ivan@gmail.com", "admin321")
+        self.chat, _ = Chat.objects.get_or_create_direct(self.seller, self.buyer)
+
+    def test_messages_update_inbox(self):
+        """Each participant should get an entry with the last message and unread count"""
+        Message.objects.create(chat=self.chat, text="Hello", sent_by=self.seller)
+        Message.objects.create(chat=self.chat, text="Are you there?", sent_by=self.seller)
+
+        seller_entry = InboxEntry.objects.get(user=self.seller, chat=self.chat)
+        buyer_entry = InboxEntry.objects.get(user=self.buyer, chat=self.chat)
+        self.assertEqual(seller_entry.unread_count, 0)
+        self.assertEqual(buyer_entry.unread_count, 2)
+        self.assertEqual(buyer_entry.last_message_preview, "Are you there?")
+        self.assertEqual(buyer_entry.counterpart_username, "alex")
+
+        InboxEntry.objects.mark_read(self.buyer, self.chat)
+        buyer_entry.refresh_from_db()
+        self.assertEqual(buyer_entry.unread_count, 0)
+
+    def test_read_watermark(self):
+        """The watermark should only move forward and derive the unread count"""
+        first = Message.objects.create(chat=self.chat, text="Hello", sent_by=self.seller)
+        Message.objects.create(chat=self.chat, text="Are you there?", sent_by=self.seller)
+        last = Message.objects.create(chat=self.chat, text="Ping", sent_by=self.seller)
+
+        seller_entry = InboxEntry.objects.get(user=self.seller, chat=self.chat)
+        self.assertEqual(seller_entry.last_read_message, last)
+
+        read = InboxEntry.objects.mark_read(self.buyer, self.chat, first)
+        self.assertEqual(read["message_id"], first.pk)
+        buyer_entry = InboxEntry.objects.get(user=self.buyer, chat=self.chat)
+        self.assertEqual(buyer_entry.last_read_message, first)
+        self.assertEqual(buyer_entry.unread_count, 2)
+
+        InboxEntry.objects.mark_read(self.buyer, self.chat)
+        buyer_entry.refresh_from_db()
+        self.assertEqual(buyer_entry.last_read_message, last)
+        self.assertEqual(buyer_entry.unread_count, 0)
+
+        self.assertIsNone(InboxEntry.objects.mark_read(self.buyer, self.chat, first))
+        self.assertIsNone(InboxEntry.objects.mark_read(self.buyer, self.chat))
+
+    def test_read_watermark_notifications(self):
+        """Only the notifications up to the watermark should be marked read"""
+        first = Message.objects.create(chat=self.chat, text="Hello", sent_by=self.seller)
+        last = Message.objects.create(chat=self.chat, text="Ping", sent_by=self.seller)
+        user_notifications = []
+        for message in (first, last):
+            notification = Notification.objects.create(type=Notification.MESSAGES, chat=self.chat, actor=self.seller)
+            notification.messages.add(message)
+            user_notifications.append(NotificationUser.objects.create(notification=notification, user=self.buyer))
+
+        InboxEntry.objects.mark_read(self.buyer, self.chat, first)
+        for user_notification in user_notifications:
+            user_notification.refresh_from_db()
+        self.assertTrue(user_notifications[0].is_read)
+        self.assertFalse(user_notifications[1].is_read)
+
+        InboxEntry.objects.mark_read(self.buyer, self.chat)
+        user_notifications[1].refresh_from_db()
+        self.assertTrue(user_notifications[1].is_read)
+
+
+class MessageHistoryAPITestCase(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        self.buyer = User.objects.create_user("ivan", "ivan@gmail.com", "admin321")
+        self.chat, _ = Chat.objects.get_or_create_direct(self.seller, self.buyer)
+        self.messages = [
+            Message.objects.create(chat=self.chat, text=str(i), sent_by=self.seller)
+            for i in range(10)
+        ]
+        self.client.force_authenticate(self.buyer)
+        self.url = "/api/chats/{}/messages/history/".format(self.chat.id)
+
+    def test_latest_page(self):
+        """The first page should hold the newest messages"""
+        response = self.client.get(self.url, {"limit": 4})
+        self.assertEqual([m["text"] for m in response.data["results"]], ["9", "8", "7", "6"])
+        self.assertTrue(response.data["has_older"])
+        self.assertFalse(response.data["has_newer"])
+
+    def test_before_and_after(self):
+        """Cursors should page without gaps or duplicates"""
+        response = self.client.get(self.url, {"limit": 4, "before": str(self.messages[6].id)})
+        self.assertEqual([m["text"] for m in response.data["results"]], ["5", "4", "3", "2"])
+        response = self.client.get(self.url, {"limit": 4, "after": str(self.messages[6].id)})
+        self.assertEqual([m["text"] for m in response.data["results"]], ["9", "8", "7"])
+        self.assertFalse(response.data["has_newer"])
+
+    def test_around(self):
+        """Around should center the page on the message"""
+        response = self.client.get(self.url, {"limit": 4, "around": str(self.messages[5].id)})
+        self.assertEqual([m["text"] for m in response.data["results"]], ["7", "6", "5", "4"])
+
+
+@override_settings(CHAT_UPLOAD_CHUNK_SIZE=4)
+class ChunkedUploadTestCase(TestCase):
+    def setUp(self):
+        self.upload = ChunkedUpload("notes.txt", 6)
+
+    def tearDown(self):
+        self.upload.close()
+
+    def test_parse_chunk(self):
+        upload_id = uuid.uuid4()
+        parsed_id, offset, payload = parse_chunk(upload_id.bytes + struct.pack(">Q", 4) + b"ef")
+        self.assertEqual((parsed_id, offset, bytes(payload)), (str(upload_id), 4, b"ef"))
+
+    def test_short_frame(self):
+        with self.assertRaises(UploadError):
+            parse_chunk(b"short")
+
+    def test_resent_chunk(self):
+        self.assertEqual(self.upload.write(0, b"abcd"), 4)
+        self.assertEqual(self.upload.write(0, b"abcd"), 4)
+        self.assertEqual(self.upload.write(4, b"ef"), 6)
+        self.assertTrue(self.upload.complete)
+
+    def test_out_of_order_chunk(self):
+        with self.assertRaises(UploadError):
+            self.upload.write(4, b"ef")
+
+    def test_oversize_chunk(self):
+        with self.assertRaises(UploadError):
+            self.upload.write(0, b"abcde")
+
+    def test_overrun_past_size(self):
+        self.upload.write(0, b"abcd")
+        with self.assertRaises(UploadError):
+            self.upload.write(4, b"efgh")
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class ChatConsumerUploadTestCase(TransactionTestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        self.buyer = User.objects.create_user("ivan", "ivan@gmail.com", "admin321")
+        self.chat, _ = Chat.objects.get_or_create_direct(self.seller, self.buyer)
+        self.media_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    async def upload(self, communicator, content):
+        await communicator.send_json_to({"type": "upload_start", "name": "notes.txt", "size": len(content)})
+        ready = await communicator.receive_json_from()
+        self.assertEqual(ready["type"], "upload_ready")
+        await communicator.send_to(bytes_data=uuid.UUID(ready["upload_id"]).bytes + struct.pack(">Q", 0) + content)
+        progress = await communicator.receive_json_from()
+        self.assertEqual((progress["type"], progress["received"]), ("upload_progress", len(content)))
+        return ready["upload_id"]
+
+    async def send_message(self, communicator, upload_id):
+        await communicator.send_json_to({
+            "text": "Here it is",
+            "sent_by": {"id": str(self.seller.pk)},
+            "uploads": [upload_id],
+        })
+        return await communicator.receive_json_from(timeout=5)
+
+    async def upload_and_send(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(routing.websocket_urlpatterns), "/ws/chat/{}/".format(self.chat.pk)
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        upload_id = await self.upload(communicator, b"hello")
+
+        with mock.patch.object(ChunkedUpload, "store", side_effect=OSError("Storage unavailable")):
+            error = await self.send_message(communicator, upload_id)
+        self.assertEqual((error["type"], error["upload_id"]), ("upload_error", upload_id))
+
+        # The upload was kept, so the message can be sent again
+        message = await self.send_message(communicator, upload_id)
+        await communicator.disconnect()
+        return message
+
+    def test_upload_then_message(self):
+        with self.settings(
+                DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+                MEDIA_ROOT=self.media_root
+        ):
+            message = async_to_sync(self.upload_and_send)()
+        self.assertEqual(message["text"], "Here it is")
+        self.assertEqual([file["name"] for file in message["files"]], ["notes.txt"])
+        self.assertEqual(Message.objects.get(pk=message["id"]).messagefile_set.count(), 1)
@@ -0,0 +1,79 @@
+"""Chunked chat attachment uploads.
+
+Attachments are streamed over the chat websocket in binary frames with the
+layout:
+
+    16 bytes upload id (UUID) | 8 bytes offset (unsigned big endian) | payload
+
+Chunks are written straight to a spool file on disk, so a connection only
+holds one chunk in memory at a time, and the file is moved to the storage
+once the message that commits it is sent.
+"""
+
+# Django
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+# Utilities
+import tempfile
+import struct
+import uuid
+import os
+
+HEADER = struct.Struct(">16sQ")
+
+
+class UploadError(Exception):
+    pass
+
+
+def parse_chunk(data):
+    """Return the (upload_id, offset, payload) of a binary frame."""
+    if len(data) < HEADER.size:
+        raise UploadError("Invalid chunk")
+    upload_id, offset = HEADER.unpack_from(data)
+    return str(uuid.UUID(bytes=upload_id)), offset, memoryview(data)[HEADER.size:]
+
+
+class ChunkedUpload:
+    """Attachment being received in chunks into a spool file."""
+
+    def __init__(self, name, size):
+        if size <= 0 or size > settings.CHAT_UPLOAD_MAX_SIZE:
+            raise UploadError("File size not allowed")
+        self.id = str(uuid.uuid4())
+        self.name = os.path.basename(name) or self.id
+        self.size = size
+        self.received = 0
+        self.file = tempfile.NamedTemporaryFile(
+            dir=settings.FILE_UPLOAD_TEMP_DIR,
+            suffix=".upload"
+        )
+
+    @property
+    def complete(self):
+        return self.received == self.size
+
+    def write(self, offset, payload):
+        """Write a chunk. Chunks are sent in order but may be resent."""
+        if len(payload) > settings.CHAT_UPLOAD_CHUNK_SIZE:
+            raise UploadError("Chunk too large")
+        if offset > self.received or offset + len(payload) > self.size:
+            raise UploadError("Unexpected chunk offset")
+        self.file.seek(offset)
+        self.file.write(payload)
+        self.received = max(self.received, offset + len(payload))
+        return self.received
+
+    def store(self):
+        """Copy the spooled file to the storage and return its name."""
+        self.file.flush()
+        self.file.seek(0)
+        return default_storage.save(
+            os.path.join("messages/files/", self.name),
+            File(self.file, name=self.name)
+        )
+
+    def close(self):
+        self.file.close()
@@ -26,16 +26,16 @@ from api.users.permissions import IsAccountOwner
 
 # Models
 from api.users.models import User
-from api.chats.models import Chat
+from api.chats.models import Chat, InboxEntry
 
 # Serializers
 from api.users.serializers import UserModelSerializer
 from api.chats.serializers import (
     ChatModelSerializer,
+    InboxEntryModelSerializer,
     CreateChatSerializer,
     RetrieveChatModelSerializer,
-    CreateSeenBySerializer,
-    ClearChatNotification
+    MarkChatReadSerializer
 )
 
 # Filters
@@ -59,9 +59,9 @@ class ChatViewSet(
     filter_backends = (SearchFilter, DjangoFilterBackend)
     pagination_class = None
     search_fields = (
-        "participants__first_name",
-        "participants__last_name",
-        "participants__username",
+        "counterpart__first_name",
+        "counterpart__last_name",
+        "counterpart_username",
     )
 
     def get_permissions(self):
@@ -76,37 +76,24 @@ class ChatViewSet(
             return CreateChatSerializer
         elif self.action == "retrieve":
             return RetrieveChatModelSerializer
+        elif self.action in ["list", "last_messages"]:
+            return InboxEntryModelSerializer
         return ChatModelSerializer
 
     def get_queryset(self):
         user = self.request.user
-        if self.action == "list":
-            return Chat.objects.filter(participants=user).exclude(last_message=None)
-        if self.action == "last_messages":
-            return Chat.objects.filter(participants=user).exclude(last_message=None)[:5]
+        if self.action in ["list", "last_messages"]:
+            return InboxEntry.objects.filter(
+                user=user,
+                last_message_at__isnull=False
+            ).select_related("chat").order_by("-last_message_at")
 
         return Chat.objects.all()
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        # Create seen by
-        createSeenSerializer = CreateSeenBySerializer(
-            data={}, context={"request": request, "chat": instance}
-        )
-        is_valid = createSeenSerializer.is_valid(raise_exception=False)
-        if is_valid:
-            createSeenSerializer.save()
-
-        # Clear chat notifications
-        clearChatNotification = ClearChatNotification(
-            instance,
-            data={},
-            context={"request": request, "chat": instance},
-            partial=True
-        )
-        is_valid = clearChatNotification.is_valid(raise_exception=False)
-        if is_valid:
-            clearChatNotification.update(instance, request)
+        # Move the read watermark to the last message
+        InboxEntry.objects.mark_read(request.user, instance)
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
@@ -128,6 +115,27 @@ class ChatViewSet(
 
         return Response(chat_data, status=current_status, headers=headers)
 
+    @action(detail=True, methods=['post'])
+    def mark_read(self, request, *args, **kwargs):
+        instance = self.get_object()
+        if not instance.participants.filter(pk=request.user.pk).exists():
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        serializer = MarkChatReadSerializer(
+            data=request.data, context={"request": request, "chat": instance}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        entry = InboxEntry.objects.filter(user=request.user, chat=instance).values(
+            "last_read_message", "last_read_at", "unread_count"
+        ).first() or {}
+        return Response({
+            "chat": str(instance.pk),
+            "last_read_message": entry.get("last_read_message"),
+            "last_read_at": entry.get("last_read_at"),
+            "unread_count": entry.get("unread_count", 0),
+        }, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['get'])
     def retrieve_chat_feed(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -136,7 +144,7 @@ class ChatViewSet(
 
     @action(detail=False, methods=['get'])
     def last_messages(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
+        queryset = self.filter_queryset(self.get_queryset())[:5]
 
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -12,7 +12,9 @@ import json
 import uuid
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Q
 from rest_framework import status, viewsets, mixins
+from rest_framework.exceptions import NotFound
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.generics import get_object_or_404
@@ -49,7 +51,7 @@ import base64
 
 # Consumer methods
 @sync_to_async
-def create_message(self, text, sent_by, files):
+def create_message(self, text, sent_by, files, stored_files=()):
     chat = Chat.objects.get(pk=self.room_name)
     user = User.objects.get(pk=sent_by["id"])
     new_message = Message.objects.create(chat=chat, text=text, sent_by=user)
@@ -65,6 +67,11 @@ def create_message(self, text, sent_by, files):
         except:
             files.pop(i)
 
+    # Files already uploaded in chunks
+    for file_name, name in stored_files:
+        message_file = MessageFile.objects.create(message=new_message, chat=chat, file=file_name, name=name)
+        files.append({"id": str(message_file.id), "name": name, "file": message_file.file.url})
+
     chat.last_message = new_message
     chat.save()
     return new_message, chat.pk, files
@@ -72,6 +79,9 @@ def create_message(self, text, sent_by, files):
 
 # Message ViewSet
 
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 100
+
 
 class MessageViewSet(
     mixins.ListModelMixin,
@@ -107,8 +117,88 @@ class MessageViewSet(
             "format": self.format_kwarg,
             "view": self,
             "chat": self.chat,
+            "senders": {},
         }
 
     def get_queryset(self):
 
-        return Message.objects.filter(chat=self.chat)
+        return Message.objects.filter(chat=self.chat).select_related(
+            "sent_by",
+            "activity"
+        ).prefetch_related("messagefile_set")
+
+    def get_history_anchor(self, param):
+        """Return the message used as cursor by a history query param."""
+        message_id = self.request.query_params.get(param)
+        if not message_id:
+            return None
+        try:
+            uuid.UUID(message_id)
+        except ValueError:
+            raise NotFound("Message not found")
+        return get_object_or_404(Message.objects.filter(chat=self.chat).only("id", "created"), pk=message_id)
+
+    @action(detail=False, methods=["get"])
+    def history(self, request, *args, **kwargs):
+        """Keyset paginated chat history.
+
+        Pages are ordered newest first and jump with the before, after or
+        around query params, each one a message id. The cursors of the
+        response are the ids to use in the next before or after query.
+        """
+        try:
+            limit = int(request.query_params.get("limit", HISTORY_PAGE_SIZE))
+        except ValueError:
+            limit = HISTORY_PAGE_SIZE
+        limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+        queryset = self.get_queryset()
+        older = queryset.order_by("-created", "-id")
+        newer = queryset.order_by("created", "id")
+
+        before = self.get_history_anchor("before")
+        after = self.get_history_anchor("after")
+        around = self.get_history_anchor("around")
+
+        if before:
+            messages = list(older.filter(
+                Q(created__lt=before.created) | Q(created=before.created, id__lt=before.id)
+            )[:limit + 1])
+            has_older = len(messages) > limit
+            has_newer = True
+            messages = messages[:limit]
+        elif after:
+            messages = list(newer.filter(
+                Q(created__gt=after.created) | Q(created=after.created, id__gt=after.id)
+            )[:limit + 1])
+            has_newer = len(messages) > limit
+            has_older = True
+            messages = messages[:limit][::-1]
+        elif around:
+            newer_limit = limit // 2
+            older_limit = limit - newer_limit
+            older_messages = list(older.filter(
+                Q(created__lt=around.created) | Q(created=around.created, id__lte=around.id)
+            )[:older_limit + 1])
+            newer_messages = list(newer.filter(
+                Q(created__gt=around.created) | Q(created=around.created, id__gt=around.id)
+            )[:newer_limit + 1])
+            has_older = len(older_messages) > older_limit
+            has_newer = len(newer_messages) > newer_limit
+            messages = newer_messages[:newer_limit][::-1] + older_messages[:older_limit]
+        else:
+            messages = list(older[:limit + 1])
+            has_older = len(messages) > limit
+            has_newer = False
+            messages = messages[:limit]
+
+        helpers.prefetch_activity_items([message.activity for message in messages])
+
+        serializer = self.get_serializer(messages, many=True)
+        return Response({
+            "results": serializer.data,
+            "has_older": has_older,
+            "has_newer": has_newer,
+            "older_cursor": str(messages[-1].id) if messages and has_older else None,
+            "newer_cursor": str(messages[0].id) if messages and has_newer else None,
+        })
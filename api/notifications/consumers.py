@@ -1,4 +1,6 @@
 import asyncio
+import logging
+from django.conf import settings
 from django.core import serializers
 from django.http.response import JsonResponse
 import json
@@ -6,10 +8,16 @@ import json
 # Channels
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
 
 # Models
 from api.users.models import User
 
+# Utils
+from api.notifications import presence
+
+logger = logging.getLogger(__name__)
+
 
 class NoseyConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
@@ -17,14 +25,26 @@ class NoseyConsumer(AsyncJsonWebsocketConsumer):
         self.user_id = self.scope["url_route"]["kwargs"]["user_id"]
 
         self.room_group_name = "user-%s" % self.user_id
-        await self.update_user_status(True)
+        await sync_to_async(presence.connect, thread_sensitive=False)(self.user_id, self.channel_name)
+        self.heartbeat_task = asyncio.ensure_future(self.heartbeat())
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
 
     async def disconnect(self, message, **kwargs):
-        await self.update_user_status(False)
+        if getattr(self, "heartbeat_task", None):
+            self.heartbeat_task.cancel()
+        await sync_to_async(presence.disconnect, thread_sensitive=False)(self.user_id, self.channel_name)
 
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
+    async def heartbeat(self):
+        """Keep the connection alive in the presence service."""
+        while True:
+            await asyncio.sleep(settings.PRESENCE_HEARTBEAT_INTERVAL)
+            try:
+                await sync_to_async(presence.heartbeat, thread_sensitive=False)(self.user_id, self.channel_name)
+            except Exception as e:
+                logger.warning("Presence heartbeat failed: %s", e)
+
     async def message_sent(self, event):
 
         await self.send_json(event)
@@ -33,6 +53,10 @@ class NoseyConsumer(AsyncJsonWebsocketConsumer):
 
         await self.send_json(event)
 
-    @database_sync_to_async
-    def update_user_status(self, is_online):
-        return User.objects.filter(id=self.user_id) .update(is_online=is_online)
+    async def chat_read(self, event):
+
+        await self.send_json(event)
+
+    async def plan_updated(self, event):
+
+        await self.send_json(event)
@@ -0,0 +1,72 @@
+"""Digest of the new messages emails.
+
+The first unread message a user gets from someone schedules a digest for
+them in the sorted set mail:digest, scored with the time it is due, so the
+messages of several senders collapse into one entry. send_messages_digests
+pops the due users in chunks and emails each of them that is offline a
+single digest of the chats still unread, with the messages of each.
+"""
+
+# Django
+from django.conf import settings
+from django.db.models import Count
+
+# Models
+from api.notifications.models import Notification, NotificationUser
+
+# Utilities
+from api.utils import mail_spool
+import time
+
+DIGEST_KEY = 'mail:digest'
+
+
+def schedule(user_id):
+    """Schedule the digest of a user, unless one is already scheduled."""
+    mail_spool.get_client().zadd(
+        DIGEST_KEY,
+        {str(user_id): time.time() + settings.MESSAGES_DIGEST_DELAY},
+        nx=True
+    )
+
+
+def pop_due(now, limit):
+    """Take up to limit users whose digest is due."""
+    client = mail_spool.get_client()
+    user_ids = client.zrangebyscore(DIGEST_KEY, 0, now, start=0, num=limit)
+    if not user_ids:
+        return []
+    pipe = client.pipeline()
+    for user_id in user_ids:
+        pipe.zrem(DIGEST_KEY, user_id)
+    # The users removed meanwhile by another worker are left to it
+    return [user_id.decode() for user_id, removed in zip(user_ids, pipe.execute()) if removed]
+
+
+def unread_chats(user_ids):
+    """Return the digest of each user with unread messages, in a single grouped query."""
+    rows = NotificationUser.objects.filter(
+        user_id__in=user_ids,
+        is_read=False,
+        notification__type=Notification.MESSAGES,
+        notification__actor__isnull=False,
+    ).order_by().values(
+        'user_id',
+        'user__email',
+        'user__username',
+        'notification__chat_id',
+        'notification__actor__username',
+    ).annotate(count=Count('notification__messages')).filter(count__gt=0)
+
+    digests = {}
+    for row in rows:
+        digest = digests.setdefault(row['user_id'], {
+            'user_id': row['user_id'],
+            'email': row['user__email'],
+            'username': row['user__username'],
+            'chats': [],
+            'count': 0,
+        })
+        digest['chats'].append({'username': row['notification__actor__username'], 'count': row['count']})
+        digest['count'] += row['count']
+    return list(digests.values())
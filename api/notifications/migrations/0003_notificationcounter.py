@@ -0,0 +1,48 @@
+# Generated by Django 3.0.3 on 2021-04-19 09:41
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+import uuid
+
+
+def count_unread_notifications(apps, schema_editor):
+    NotificationUser = apps.get_model('notifications', 'NotificationUser')
+    NotificationCounter = apps.get_model('notifications', 'NotificationCounter')
+    counts = NotificationUser.objects.filter(is_read=False).order_by().values('user_id').annotate(
+        messages=Count('pk', filter=Q(notification__type='ME')),
+        activity=Count('pk', filter=Q(notification__type='AC')),
+    )
+    NotificationCounter.objects.bulk_create([
+        NotificationCounter(user_id=row['user_id'], messages=row['messages'], activity=row['activity'])
+        for row in counts
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notifications', '0002_auto_20210328_2249'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Date time on which the object was created.', verbose_name='created at')),
+                ('modified', models.DateTimeField(auto_now=True, help_text='Date time on which the object was last modified.', verbose_name='modified at')),
+                ('messages', models.PositiveIntegerField(default=0)),
+                ('activity', models.PositiveIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='notification_counter', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created', '-modified'],
+                'get_latest_by': 'created',
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(count_unread_notifications, migrations.RunPython.noop),
+    ]
@@ -1 +1,3 @@
 from .notifications import Notification, NotificationUser
+from .counters import NotificationCounter
+from .outbox import OutboxEvent
@@ -0,0 +1,47 @@
+from api.utils.models import CModel
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .notifications import Notification
+
+
+class NotificationCounterManager(models.Manager):
+
+    FIELDS = {
+        Notification.MESSAGES: "messages",
+        Notification.ACTIVITY: "activity",
+    }
+
+    def increment(self, user_id, type, count=1):
+        """Add unread notifications of a type to the counter of a user."""
+        field = self.FIELDS[type]
+        if self.filter(user_id=user_id).update(**{field: F(field) + count}):
+            return
+        try:
+            with transaction.atomic():
+                self.create(user_id=user_id, **{field: count})
+        except IntegrityError:
+            self.filter(user_id=user_id).update(**{field: F(field) + count})
+
+    def decrement(self, user_id, type, count=1):
+        """Remove read notifications of a type from the counter of a user."""
+        field = self.FIELDS[type]
+        self.filter(user_id=user_id).update(**{field: Greatest(F(field) - count, 0)})
+
+    def reset(self, user_id):
+        self.filter(user_id=user_id).exclude(messages=0, activity=0).update(messages=0, activity=0)
+
+
+class NotificationCounter(CModel):
+    """Unread notifications of a user, kept in sync with NotificationUser."""
+
+    user = models.OneToOneField("users.User", on_delete=models.CASCADE, related_name="notification_counter")
+    messages = models.PositiveIntegerField(default=0)
+    activity = models.PositiveIntegerField(default=0)
+
+    objects = NotificationCounterManager()
+
+    @property
+    def total(self):
+        return self.messages + self.activity
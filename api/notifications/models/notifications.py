@@ -1,5 +1,33 @@
 from api.utils.models import CModel
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count
+
+
+class NotificationUserQuerySet(models.QuerySet):
+
+    def mark_read(self):
+        """Mark the unread notifications read and update the users counters.
+
+        The counters of the affected users are locked first, so notifications
+        created meanwhile are counted after this update.
+        Return the number of notifications marked read.
+        """
+        from .counters import NotificationCounter
+
+        unread = self.filter(is_read=False)
+        with transaction.atomic():
+            list(NotificationCounter.objects.select_for_update().filter(
+                user__in=unread.values("user")
+            ).values_list("pk", flat=True))
+            counts = list(
+                unread.order_by().values("user_id", "notification__type").annotate(count=Count("pk"))
+            )
+            if not counts:
+                return 0
+            updated = unread.update(is_read=True)
+            for row in counts:
+                NotificationCounter.objects.decrement(row["user_id"], row["notification__type"], row["count"])
+        return updated
 
 
 class NotificationUser(CModel):
@@ -8,6 +36,8 @@ class NotificationUser(CModel):
     notification = models.ForeignKey("notifications.Notification", on_delete=models.CASCADE)
     is_read = models.BooleanField(default=False)
 
+    objects = NotificationUserQuerySet.as_manager()
+
 
 class Notification(CModel):
 
@@ -0,0 +1,29 @@
+from api.utils.models import CModel
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxEvent(CModel):
+    """Side effect of a domain write, relayed once the write is committed."""
+
+    GROUP_SEND = 'GS'
+    TASK = 'TA'
+    KIND_CHOICES = [
+        (GROUP_SEND, 'Channel layer group send'),
+        (TASK, 'Celery task'),
+    ]
+    kind = models.CharField(max_length=2, choices=KIND_CHOICES)
+
+    # Events with the same key are only published once
+    key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    payload = models.TextField()
+
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["available_at"]
+        indexes = [
+            models.Index(fields=["available_at"], name="notif_outbox_available_idx"),
+        ]
@@ -0,0 +1,131 @@
+"""Transactional outbox.
+
+Websocket events and tasks emitted by domain writes are stored as
+OutboxEvent rows in the same transaction as the write, so they are never
+published for a rolled back request and the request does not wait for
+Redis. The relay (relayoutbox command, relay_outbox task as a fallback)
+drains the table in batches: group sends are sent concurrently and tasks
+are published through one broker connection. Events are deleted once
+published and retried with backoff otherwise, so delivery is at least once.
+After OUTBOX_MAX_ATTEMPTS an error is logged: group sends are dropped, as a
+late websocket event is of no use, and tasks are kept until they are
+published again with relayoutbox --retry-failed.
+"""
+
+# Django
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+# Channels
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+
+# Models
+from api.notifications.models import OutboxEvent
+
+# Utilities
+from datetime import timedelta
+import asyncio
+import logging
+import json
+
+logger = logging.getLogger(__name__)
+
+
+def publish(kind, payload, key=None):
+    event = OutboxEvent(kind=kind, key=key, payload=json.dumps(payload, default=str))
+    if key:
+        OutboxEvent.objects.bulk_create([event], ignore_conflicts=True)
+    else:
+        event.save()
+
+
+def group_send(group, event, key=None):
+    """Send an event to a channel layer group once the transaction commits."""
+    publish(OutboxEvent.GROUP_SEND, {"group": group, "event": event}, key)
+
+
+def enqueue(task_name, *args, key=None):
+    """Publish a celery task once the transaction commits."""
+    publish(OutboxEvent.TASK, {"task": task_name, "args": list(args)}, key)
+
+
+async def _group_send_all(events):
+    channel_layer = get_channel_layer()
+    return await asyncio.gather(*[
+        channel_layer.group_send(payload["group"], payload["event"])
+        for payload in events
+    ], return_exceptions=True)
+
+
+def _enqueue_all(events):
+    from api.taskapp.celery import app
+
+    results = []
+    if app.conf.task_always_eager:
+        for payload in events:
+            app.tasks[payload["task"]].apply(args=payload["args"])
+            results.append(None)
+        return results
+    with app.producer_or_acquire() as producer:
+        for payload in events:
+            try:
+                app.send_task(payload["task"], args=payload["args"], producer=producer)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+    return results
+
+
+def relay(batch_size=None):
+    """Publish a batch of pending events. Return the number published."""
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True).filter(
+                available_at__lte=timezone.now(),
+                attempts__lt=settings.OUTBOX_MAX_ATTEMPTS
+            )[:batch_size]
+        )
+        if not events:
+            return 0
+
+        payloads = {event.pk: json.loads(event.payload) for event in events}
+        group_events = [event for event in events if event.kind == OutboxEvent.GROUP_SEND]
+        task_events = [event for event in events if event.kind == OutboxEvent.TASK]
+        errors = {}
+        if group_events:
+            results = async_to_sync(_group_send_all)([payloads[event.pk] for event in group_events])
+            errors.update(zip([event.pk for event in group_events], results))
+        if task_events:
+            results = _enqueue_all([payloads[event.pk] for event in task_events])
+            errors.update(zip([event.pk for event in task_events], results))
+
+        published = [pk for pk, error in errors.items() if error is None]
+        OutboxEvent.objects.filter(pk__in=published).delete()
+        for event in events:
+            error = errors.get(event.pk)
+            if error is None:
+                continue
+            if event.attempts + 1 >= settings.OUTBOX_MAX_ATTEMPTS:
+                logger.error('Outbox event %s gave up after %s attempts: %s %s', event.pk,
+                             event.attempts + 1, error, event.payload)
+                if event.kind == OutboxEvent.GROUP_SEND:
+                    OutboxEvent.objects.filter(pk=event.pk).delete()
+                    continue
+            else:
+                logger.warning('Outbox event %s failed: %s', event.pk, error)
+            OutboxEvent.objects.filter(pk=event.pk).update(
+                attempts=event.attempts + 1,
+                available_at=timezone.now() + timedelta(seconds=2 ** event.attempts),
+                last_error=repr(error)
+            )
+    return len(published)
+
+
+def retry_failed():
+    """Make the events that gave up available again. Return their number."""
+    return OutboxEvent.objects.filter(attempts__gte=settings.OUTBOX_MAX_ATTEMPTS).update(
+        attempts=0, available_at=timezone.now()
+    )
@@ -0,0 +1,113 @@
+"""Users presence.
+
+Each websocket connection of a user is a member of the sorted set
+presence:user:<id>, scored with the time its heartbeat expires. A user is
+online while any of their connections has not expired, so several tabs or
+ASGI workers are counted independently and the connections of a crashed
+process simply time out. User.is_online is only a copy for the admin, kept
+up to date in batches by flush().
+"""
+
+# Django
+from django.conf import settings
+
+# Models
+from api.users.models import User
+
+# Utilities
+import threading
+import logging
+import time
+import redis
+
+logger = logging.getLogger(__name__)
+
+DIRTY_KEY = 'presence:dirty'
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(settings.PRESENCE_REDIS_URL)
+    return _client
+
+
+def user_key(user_id):
+    return 'presence:user:{}'.format(user_id)
+
+
+def connect(user_id, channel_name):
+    """Register a connection of a user."""
+    key = user_key(user_id)
+    pipe = get_client().pipeline()
+    pipe.zadd(key, {channel_name: time.time() + settings.PRESENCE_TTL})
+    pipe.expire(key, settings.PRESENCE_TTL)
+    pipe.sadd(DIRTY_KEY, str(user_id))
+    pipe.execute()
+
+
+def heartbeat(user_id, channel_name):
+    """Extend the expiration of a live connection."""
+    key = user_key(user_id)
+    pipe = get_client().pipeline()
+    pipe.zadd(key, {channel_name: time.time() + settings.PRESENCE_TTL}, xx=True)
+    pipe.expire(key, settings.PRESENCE_TTL)
+    pipe.execute()
+
+
+def disconnect(user_id, channel_name):
+    """Remove a connection of a user."""
+    pipe = get_client().pipeline()
+    pipe.zrem(user_key(user_id), channel_name)
+    pipe.sadd(DIRTY_KEY, str(user_id))
+    pipe.execute()
+
+
+def is_online(user_ids):
+    """Return a dict with the online status of every user id."""
+    user_ids = [str(user_id) for user_id in user_ids]
+    if not user_ids:
+        return {}
+    try:
+        now = time.time()
+        pipe = get_client().pipeline()
+        for user_id in user_ids:
+            pipe.zcount(user_key(user_id), now, '+inf')
+        counts = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning('Presence unavailable, using the stored status: %s', e)
+        online = set(
+            str(pk) for pk in User.objects.filter(pk__in=user_ids, is_online=True).values_list('pk', flat=True)
+        )
+        return {user_id: user_id in online for user_id in user_ids}
+    return {user_id: count > 0 for user_id, count in zip(user_ids, counts)}
+
+
+def is_user_online(user_id):
+    return is_online([user_id])[str(user_id)]
+
+
+def flush(batch_size=1000):
+    """Copy the presence of the changed users to User.is_online.
+
+    Users stored as online are always checked, so the ones left behind by a
+    crashed process are turned offline once their connections expire.
+    """
+    client = get_client()
+    user_ids = set(
+        user_id.decode() for user_id in client.spop(DIRTY_KEY, batch_size) or []
+    )
+    user_ids.update(
+        str(pk) for pk in User.objects.filter(is_online=True).values_list('pk', flat=True)
+    )
+    statuses = is_online(user_ids)
+    online = [user_id for user_id, status in statuses.items() if status]
+    offline = [user_id for user_id, status in statuses.items() if not status]
+    went_online = User.objects.filter(pk__in=online, is_online=False).update(is_online=True)
+    went_offline = User.objects.filter(pk__in=offline, is_online=True).update(is_online=False)
+    return went_online, went_offline
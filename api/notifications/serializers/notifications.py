@@ -10,7 +10,8 @@ from django.core.validators import RegexValidator
 from django.shortcuts import get_object_or_404
 
 # Serializers
-from api.users.serializers import UserModelSerializer
+from api.users.serializers import UserModelSerializer, UserSummarySerializer
+from api.utils.serializers.dynamic_fields import DynamicFieldsMixin
 from api.chats.serializers import MessageModelSerializer
 from api.activities.serializers import ActivityModelSerializer
 
@@ -20,10 +21,10 @@ from api.notifications.models import NotificationUser, Notification
 from api.activities.models import Activity
 
 
-class NotificationModelSerializer(serializers.ModelSerializer):
+class NotificationModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """User model serializer."""
 
-    actor = UserModelSerializer(read_only=True)
+    actor = UserSummarySerializer(read_only=True)
     activity = ActivityModelSerializer(read_only=True)
     messages = serializers.SerializerMethodField(read_only=True)
     is_chat_notification = serializers.SerializerMethodField(read_only=True)
@@ -41,11 +42,14 @@ class NotificationModelSerializer(serializers.ModelSerializer):
             "activity",
             "is_chat_notification"
         )
+        expandable_fields = {
+            "actor": UserModelSerializer,
+        }
 
         read_only_fields = ("id",)
 
     def get_messages(self, obj):
-        return MessageModelSerializer(obj.messages, many=True).data
+        return MessageModelSerializer(obj.messages, many=True, context=self.context).data
 
     def get_is_chat_notification(self, obj):
         if obj.type == Notification.MESSAGES or obj.activity.type in [
@@ -60,10 +64,10 @@ class NotificationModelSerializer(serializers.ModelSerializer):
         return False
 
 
-class NotificationUserModelSerializer(serializers.ModelSerializer):
+class NotificationUserModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """User model serializer."""
 
-    user = UserModelSerializer(read_only=True)
+    user = UserSummarySerializer(read_only=True)
     notification = NotificationModelSerializer(read_only=True)
 
     class Meta:
@@ -76,5 +80,8 @@ class NotificationUserModelSerializer(serializers.ModelSerializer):
             "notification",
             "is_read",
         )
+        expandable_fields = {
+            "user": UserModelSerializer,
+        }
 
         read_only_fields = ("id",)
@@ -1,3 +1,232 @@
-from django.test import TestCase
+# Django
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+# Django REST Framework
+from rest_framework.test import APITestCase
+
+# Models
+from api.users.models import User
+from api.chats.models import Chat, Message
+from api.notifications.models import Notification, NotificationUser, NotificationCounter, OutboxEvent
+
+# Utilities
+from api.notifications import outbox, digest, presence
+from api.taskapp.tasks import fan_out_message
+from unittest import mock
+import json
+import time
+import redis
+
+
+class NotificationCountersAPITestCase(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        self.buyer = User.objects.create_user("ivan", "ivan@gmail.com", "admin321")
+        self.chat, _ = Chat.objects.get_or_create_direct(self.seller, self.buyer)
+        for user in [self.seller, self.buyer]:
+            notification = Notification.objects.create(type=Notification.MESSAGES, chat=self.chat)
+            NotificationUser.objects.create(notification=notification, user=user)
+            NotificationCounter.objects.increment(user.pk, Notification.MESSAGES)
+        self.client.force_authenticate(self.buyer)
+
+    def test_counters(self):
+        response = self.client.get("/api/notifications/counters/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["notifications"], 1)
+        self.assertEqual(response.data["messages"], 1)
+        self.assertEqual(response.data["activity"], 0)
+
+    def test_set_all_notifications_read_is_scoped(self):
+        """Only the notifications of the request user should be read"""
+        response = self.client.get("/api/notifications/set_all_notifications_read/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(NotificationUser.objects.filter(user=self.buyer, is_read=False).exists())
+        self.assertTrue(NotificationUser.objects.filter(user=self.seller, is_read=False).exists())
+        self.assertEqual(NotificationCounter.objects.get(user=self.buyer).messages, 0)
+        self.assertEqual(NotificationCounter.objects.get(user=self.seller).messages, 1)
+
+    def test_mark_read_updates_counters(self):
+        NotificationUser.objects.filter(user=self.seller).mark_read()
+        self.assertEqual(NotificationCounter.objects.get(user=self.seller).messages, 0)
+        self.assertEqual(NotificationCounter.objects.get(user=self.buyer).messages, 1)
+
+
+class OutboxTestCase(TestCase):
+    def test_events_with_the_same_key_are_stored_once(self):
+        outbox.enqueue("fan_out_message", "1", key="fan_out_message:1")
+        outbox.enqueue("fan_out_message", "1", key="fan_out_message:1")
+        outbox.group_send("user-1", {"type": "chat.read"})
+        self.assertEqual(OutboxEvent.objects.filter(kind=OutboxEvent.TASK).count(), 1)
+        event = OutboxEvent.objects.get(kind=OutboxEvent.TASK)
+        self.assertEqual(json.loads(event.payload), {"task": "fan_out_message", "args": ["1"]})
+        self.assertEqual(OutboxEvent.objects.filter(kind=OutboxEvent.GROUP_SEND).count(), 1)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class OutboxRelayTestCase(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        self.buyer = User.objects.create_user("ivan", "ivan@gmail.com", "admin321")
+        self.chat, _ = Chat.objects.get_or_create_direct(self.seller, self.buyer)
+        patcher = mock.patch.object(digest, "schedule")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_relay_publishes_and_deletes(self):
+        """Tasks run inline in eager mode and the events they publish are relayed next"""
+        Message.objects.create(chat=self.chat, text="Hi", sent_by=self.seller)
+        self.assertEqual(outbox.relay(), 1)
+        self.assertEqual(NotificationUser.objects.filter(user=self.buyer).count(), 1)
+        self.assertEqual(OutboxEvent.objects.filter(kind=OutboxEvent.GROUP_SEND).count(), 1)
+        self.assertEqual(outbox.relay(), 1)
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(outbox.relay(), 0)
+
+    def test_failed_events_are_retried_with_backoff(self):
+        outbox.enqueue("take_balance_snapshots")
+        with mock.patch.object(outbox, "_enqueue_all", return_value=[ConnectionError("Broker down")]):
+            self.assertEqual(outbox.relay(), 0)
+            event = OutboxEvent.objects.get()
+            self.assertEqual(event.attempts, 1)
+            self.assertIn("Broker down", event.last_error)
+            self.assertGreater(event.available_at, event.created)
+            # Not available again until the backoff has passed
+            self.assertEqual(outbox.relay(), 0)
+        self.assertEqual(OutboxEvent.objects.get().attempts, 1)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=1)
+    def test_exhausted_events(self):
+        """Exhausted group sends are dropped and tasks kept for --retry-failed"""
+        outbox.enqueue("take_balance_snapshots")
+        outbox.group_send("user-1", {"type": "chat.read"})
+        error = mock.AsyncMock(return_value=[ConnectionError("Redis down")])
+        with mock.patch.object(outbox, "_enqueue_all", return_value=[ConnectionError("Broker down")]), \
+                mock.patch.object(outbox, "_group_send_all", error), \
+                self.assertLogs("api.notifications.outbox", "ERROR") as logs:
+            self.assertEqual(outbox.relay(), 0)
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(list(OutboxEvent.objects.values_list("kind", flat=True)), [OutboxEvent.TASK])
+        self.assertEqual(outbox.relay(), 0)
+
+        self.assertEqual(outbox.retry_failed(), 1)
+        self.assertEqual(outbox.relay(), 1)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_redelivered_message_is_notified_once(self):
+        message = Message.objects.create(chat=self.chat, text="Hi", sent_by=self.seller)
+        fan_out_message(str(message.pk))
+        fan_out_message(str(message.pk))
+        self.assertEqual(NotificationUser.objects.filter(user=self.buyer).count(), 1)
+        self.assertEqual(Notification.objects.get().messages.count(), 1)
+        self.assertEqual(NotificationCounter.objects.get(user=self.buyer).messages, 1)
+
+
+class FakeRedis:
+    """The few sorted set and set commands used by the presence module."""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def zadd(self, key, mapping, xx=False):
+        members = self.data.setdefault(key, {})
+        for member, score in mapping.items():
+            if member in members or not xx:
+                members[member] = score
+
+    def zrem(self, key, member):
+        self.data.get(key, {}).pop(member, None)
+
+    def zcount(self, key, minimum, maximum):
+        return len([score for score in self.data.get(key, {}).values() if score >= minimum])
+
+    def expire(self, key, seconds):
+        return True
+
+    def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member.encode())
+
+    def spop(self, key, count):
+        return list(self.data.pop(key, set()))
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class PresenceTestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username, "{}@gmail.com".format(username), "admin321")
+            for username in ["alex", "ivan", "maria"]
+        ]
+        self.redis = FakeRedis()
+        patcher = mock.patch.object(presence, "get_client", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_is_online(self):
+        """Users are online while a connection has not expired"""
+        live, expired, missing = [str(user.pk) for user in self.users]
+        self.redis.data[presence.user_key(live)] = {"live": time.time() + 60, "expired": time.time() - 60}
+        self.redis.data[presence.user_key(expired)] = {"expired": time.time() - 60}
+        self.assertEqual(presence.is_online([live, expired, missing]), {live: True, expired: False, missing: False})
+
+    def test_connections_are_counted_independently(self):
+        user_id = self.users[0].pk
+        presence.connect(user_id, "first")
+        presence.connect(user_id, "second")
+        presence.disconnect(user_id, "first")
+        self.assertTrue(presence.is_user_online(user_id))
+        presence.disconnect(user_id, "second")
+        self.assertFalse(presence.is_user_online(user_id))
+
+    def test_stored_status_is_used_without_redis(self):
+        User.objects.filter(pk=self.users[0].pk).update(is_online=True)
+        client = mock.Mock()
+        client.pipeline.return_value.execute.side_effect = redis.ConnectionError("Connection refused")
+        with mock.patch.object(presence, "get_client", return_value=client):
+            statuses = presence.is_online([user.pk for user in self.users])
+        self.assertEqual(statuses, {str(user.pk): user == self.users[0] for user in self.users})
+
+    def test_flush(self):
+        """Connected users are stored online and stale online users offline"""
+        connected, stale, offline = self.users
+        User.objects.filter(pk=stale.pk).update(is_online=True)
+        presence.connect(connected.pk, "connected")
+        self.assertEqual(presence.flush(), (1, 1))
+        self.assertEqual(
+            set(User.objects.filter(is_online=True).values_list("username", flat=True)),
+            {connected.username}
+        )
+        self.assertEqual(presence.flush(), (0, 0))
+
+
+class MessagesDigestTestCase(TestCase):
+    def test_unread_chats_are_counted_per_recipient(self):
+        user = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        for username, count, is_read in [("ivan", 2, False), ("marc", 1, False), ("joan", 1, True)]:
+            sent_by = User.objects.create_user(username, "{}@gmail.com".format(username), "admin321")
+            chat, _ = Chat.objects.get_or_create_direct(user, sent_by)
+            notification = Notification.objects.create(type=Notification.MESSAGES, chat=chat, actor=sent_by)
+            NotificationUser.objects.create(notification=notification, user=user, is_read=is_read)
+            for _ in range(count):
+                notification.messages.add(Message.objects.create(chat=chat, sent_by=sent_by, text="Hi"))
+
+        [user_digest] = digest.unread_chats([user.pk])
+        self.assertEqual(user_digest["email"], "alex@gmail.com")
+        self.assertEqual(user_digest["count"], 3)
+        self.assertEqual(
+            sorted((chat["username"], chat["count"]) for chat in user_digest["chats"]),
+            [("ivan", 2), ("marc", 1)]
+        )
@@ -4,6 +4,7 @@
 import pdb
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
+from django.db import transaction
 from django.db.models import F
 
 # Django REST Framework
@@ -25,7 +26,8 @@ from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from api.users.permissions import IsAccountOwner
 
 # Models
-from api.notifications.models import NotificationUser
+from api.notifications.models import NotificationUser, NotificationCounter
+from api.chats.models import InboxEntry
 
 # Serializers
 from api.notifications.serializers import NotificationUserModelSerializer
@@ -63,12 +65,32 @@ class NotificationViewSet(
     def get_queryset(self):
         """Restrict list to public-only."""
         user = self.request.user
-        queryset = NotificationUser.objects.filter(user=user, is_read=False)
+        queryset = NotificationUser.objects.filter(user=user, is_read=False).select_related(
+            "user", "notification__actor", "notification__activity"
+        )
 
         return queryset
 
     @action(detail=False, methods=['get'])
     def set_all_notifications_read(self, request):
         """Set read all my notifications."""
-        self.queryset.update(is_read=True)
+        user = request.user
+        with transaction.atomic():
+            list(NotificationCounter.objects.select_for_update().filter(user=user).values_list("pk", flat=True))
+            NotificationUser.objects.filter(user=user, is_read=False).update(is_read=True)
+            NotificationCounter.objects.reset(user.pk)
         return Response(status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def counters(self, request):
+        """Unread notifications by type and unread messages by chat."""
+        user = request.user
+        counter = NotificationCounter.objects.filter(user=user).values("messages", "activity").first()
+        counter = counter or {"messages": 0, "activity": 0}
+        chats = InboxEntry.objects.filter(user=user, unread_count__gt=0).values_list("chat_id", "unread_count")
+        return Response({
+            "notifications": counter["messages"] + counter["activity"],
+            "messages": counter["messages"],
+            "activity": counter["activity"],
+            "chats": {str(chat_id): unread_count for chat_id, unread_count in chats},
+        }, status=status.HTTP_200_OK)
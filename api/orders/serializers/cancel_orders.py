@@ -12,7 +12,6 @@ from django.shortcuts import get_object_or_404
 from api.orders.models import CancelOrder, Order
 from api.activities.models import Activity, CancelOrderActivity
 from api.users.models import User, Earning
-from api.chats.models import Message, Chat, SeenBy
 from djmoney.models.fields import Money
 
 
@@ -20,9 +19,13 @@ from djmoney.models.fields import Money
 from api.orders.serializers import OrderModelSerializer
 from api.users.serializers import UserModelSerializer
 
-# Utils
-from datetime import timedelta
-from django.utils import timezone
+# Services
+from api.orders.unit_of_work import OrderUnitOfWork
+
+
+def get_counterpart(order, user):
+    """Return the other party of an order."""
+    return order.buyer if user == order.seller else order.seller
 
 
 class CancelOrderModelSerializer(serializers.ModelSerializer):
@@ -49,54 +52,16 @@ class CancelOrderModelSerializer(serializers.ModelSerializer):
         validated_data['issued_by'] = user
         order = self.context['order']
         validated_data['order'] = order
-        cancel_order = CancelOrder.objects.create(**validated_data)
-        activity = Activity.objects.create(
-            type=Activity.CANCEL,
-            order=order
-        )
-        CancelOrderActivity.objects.create(
-            activity=activity,
-            cancel_order=cancel_order
-        )
-
-        seller = order.seller
-        buyer = order.buyer
-
-        issued_by = user
-        issued_to = None
-        if issued_by == seller:
-            issued_to = buyer
-        else:
-            issued_to = seller
-
-        chats = Chat.objects.filter(participants=issued_by)
-        chats = chats.filter(participants=issued_to)
-
-        chat_instance = None
-        if chats.exists():
-            for chat in chats:
-                if chat.participants.all().count() == 2:
-                    chat_instance = chat
-
-        if not chat_instance:
-
-            chat_instance = Chat.objects.create()
-
-            chat_instance.participants.add(issued_to)
-            chat_instance.participants.add(issued_by)
-            chat_instance.save()
-
-        # Create the message
-
-        message = Message.objects.create(chat=chat_instance, activity=activity, sent_by=issued_by)
-        chat_instance.last_message = message
-        chat_instance.save()
-        # Set message seen
-        seen_by, created = SeenBy.objects.get_or_create(chat=chat_instance, user=issued_by)
-        if seen_by.message != chat_instance.last_message:
-
-            seen_by.message = chat_instance.last_message
-            seen_by.save()
+        with OrderUnitOfWork() as uow:
+            cancel_order = CancelOrder.objects.create(**validated_data)
+            uow.post_activity(
+                order,
+                Activity.CANCEL,
+                CancelOrderActivity,
+                sent_by=user,
+                sent_to=get_counterpart(order, user),
+                cancel_order=cancel_order
+            )
         return cancel_order
 
 
@@ -138,57 +103,18 @@ class CancelOrderCancelationModelSerializer(serializers.ModelSerializer):
 
     def update(self, instance,  validated_data):
         order = instance.order
-        activity = Activity.objects.create(
-            type=Activity.CANCEL,
-            order=order
-        )
-        CancelOrderActivity.objects.create(
-            activity=activity,
-            cancel_order=instance,
-            status=CancelOrderActivity.CANCELLED
-        )
-
-        seller = order.seller
-        buyer = order.buyer
-
-        issued_by = instance.issued_by
-        issued_to = None
-        if issued_by == seller:
-            issued_to = buyer
-        else:
-            issued_to = seller
-
-        chats = Chat.objects.filter(participants=issued_by)
-        chats = chats.filter(participants=issued_to)
-
-        chat_instance = None
-        if chats.exists():
-            for chat in chats:
-                if chat.participants.all().count() == 2:
-                    chat_instance = chat
-
-        if not chat_instance:
-
-            chat_instance = Chat.objects.create()
-
-            chat_instance.participants.add(issued_to)
-            chat_instance.participants.add(issued_by)
-            chat_instance.save()
-
-        # Create the message
-
-        message = Message.objects.create(chat=chat_instance, activity=activity, sent_by=issued_by)
-        chat_instance.last_message = message
-        chat_instance.save()
-        # Set message seen
-        seen_by, created = SeenBy.objects.get_or_create(chat=chat_instance, user=issued_by)
-        if seen_by.message != chat_instance.last_message:
-
-            seen_by.message = chat_instance.last_message
-            seen_by.save()
-
-        instance.status = CancelOrder.CANCELLED
-        instance.save()
+        with OrderUnitOfWork() as uow:
+            uow.post_activity(
+                order,
+                Activity.CANCEL,
+                CancelOrderActivity,
+                sent_by=instance.issued_by,
+                sent_to=get_counterpart(order, instance.issued_by),
+                cancel_order=instance,
+                status=CancelOrderActivity.CANCELLED
+            )
+            instance.status = CancelOrder.CANCELLED
+            uow.save(instance, 'status')
         return instance
 
 
@@ -238,74 +164,24 @@ class AcceptOrderCancelationModelSerializer(serializers.ModelSerializer):
 
         order = instance.order
 
-        order.status = Order.CANCELLED
-        if order.type == Order.HOLDING_PAYMENT_ORDER:
-            # Return de money to user as credits
-            buyer = order.buyer
-            buyer.net_income = buyer.net_income + order.due_to_seller
-            Earning.objects.create(
-                user=buyer,
-                amount=order.due_to_seller,
-                type=Earning.REFUND,
-                available_for_withdrawn_date=timezone.now() + timedelta(days=14)
+        with OrderUnitOfWork() as uow:
+            order.status = Order.CANCELLED
+            uow.save(order, 'status')
+            if order.type == Order.HOLDING_PAYMENT_ORDER:
+                # Return de money to user as credits
+                Earning.objects.refund(order.buyer, order.due_to_seller, used_credits=order.used_credits)
+
+            uow.post_activity(
+                order,
+                Activity.CANCEL,
+                CancelOrderActivity,
+                sent_by=instance.issued_by,
+                sent_to=get_counterpart(order, instance.issued_by),
+                cancel_order=instance,
+                status=CancelOrderActivity.ACCEPTED
             )
-
-            buyer.pending_clearance = buyer.pending_clearance + order.due_to_seller
-            buyer.used_for_purchases = buyer.used_for_purchases - order.used_credits
-            buyer.save()
-        order.save()
-
-        activity = Activity.objects.create(
-            type=Activity.CANCEL,
-            order=order
-        )
-        CancelOrderActivity.objects.create(
-            activity=activity,
-            cancel_order=instance,
-            status=CancelOrderActivity.ACCEPTED
-        )
-
-        seller = order.seller
-        buyer = order.buyer
-
-        issued_by = instance.issued_by
-        issued_to = None
-        if issued_by == seller:
-            issued_to = buyer
-        else:
-            issued_to = seller
-
-        chats = Chat.objects.filter(participants=issued_by)
-        chats = chats.filter(participants=issued_to)
-
-        chat_instance = None
-        if chats.exists():
-            for chat in chats:
-                if chat.participants.all().count() == 2:
-                    chat_instance = chat
-
-        if not chat_instance:
-
-            chat_instance = Chat.objects.create()
-
-            chat_instance.participants.add(issued_to)
-            chat_instance.participants.add(issued_by)
-            chat_instance.save()
-
-        # Create the message
-
-        message = Message.objects.create(chat=chat_instance, activity=activity, sent_by=issued_by)
-        chat_instance.last_message = message
-        chat_instance.save()
-        # Set message seen
-        seen_by, created = SeenBy.objects.get_or_create(chat=chat_instance, user=issued_by)
-        if seen_by.message != chat_instance.last_message:
-
-            seen_by.message = chat_instance.last_message
-            seen_by.save()
-
-        instance.status = CancelOrder.ACCEPTED
-        instance.save()
+            instance.status = CancelOrder.ACCEPTED
+            uow.save(instance, 'status')
         return instance
 
 
@@ -351,68 +227,24 @@ class UnsubscribeOrderModelSerializer(serializers.ModelSerializer):
         validated_data['order'] = order
 
         stripe.Subscription.delete(order.subscription_id)
-        order.status = Order.CANCELLED
-        buyer = order.buyer
-
-        if order.used_credits > Money(amount=0, currency="USD"):
-            buyer.reserved_for_subscriptions -= order.used_credits
-            buyer.pending_clearance -= order.pending_clearance
-            Earning.objects.create(
-                user=buyer,
-                amount=order.used_credits,
-                type=Earning.REFUND,
-                available_for_withdrawn_date=timezone.now() + timedelta(days=14)
-            )
-            buyer.save()
-        order.cancelled = True
-        order.save()
-
-        cancel_order = CancelOrder.objects.create(**validated_data)
-        activity = Activity.objects.create(
-            type=Activity.CANCEL,
-            order=order
-        )
-        CancelOrderActivity.objects.create(
-            activity=activity,
-            cancel_order=cancel_order,
-            status=CancelOrderActivity.ACCEPTED
-        )
-
-        seller = order.seller
-
-        issued_by = user
-        issued_to = None
-        if issued_by == seller:
-            issued_to = buyer
-        else:
-            issued_to = seller
-
-        chats = Chat.objects.filter(participants=issued_by)
-        chats = chats.filter(participants=issued_to)
 
-        chat_instance = None
-        if chats.exists():
-            for chat in chats:
-                if chat.participants.all().count() == 2:
-                    chat_instance = chat
-
-        if not chat_instance:
-
-            chat_instance = Chat.objects.create()
-
-            chat_instance.participants.add(issued_to)
-            chat_instance.participants.add(issued_by)
-            chat_instance.save()
-
-        # Create the message
-
-        message = Message.objects.create(chat=chat_instance, activity=activity, sent_by=issued_by)
-        chat_instance.last_message = message
-        chat_instance.save()
-        # Set message seen
-        seen_by, created = SeenBy.objects.get_or_create(chat=chat_instance, user=issued_by)
-        if seen_by.message != chat_instance.last_message:
+        with OrderUnitOfWork() as uow:
+            order.status = Order.CANCELLED
+            buyer = order.buyer
 
-            seen_by.message = chat_instance.last_message
-            seen_by.save()
+            if order.used_credits > Money(amount=0, currency="USD"):
+                Earning.objects.refund(buyer, order.used_credits)
+            order.cancelled = True
+            uow.save(order, 'status', 'cancelled')
+
+            cancel_order = CancelOrder.objects.create(**validated_data)
+            uow.post_activity(
+                order,
+                Activity.CANCEL,
+                CancelOrderActivity,
+                sent_by=user,
+                sent_to=get_counterpart(order, user),
+                cancel_order=cancel_order,
+                status=CancelOrderActivity.ACCEPTED
+            )
         return cancel_order
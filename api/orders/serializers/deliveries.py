@@ -7,18 +7,18 @@ from rest_framework import serializers
 
 
 # Models
-from api.orders.models import Delivery, Order, OrderPayment
+from api.orders.models import Delivery, Order
 from api.activities.models import Activity, DeliveryActivity
 from api.users.models import User, Earning
-from api.chats.models import Message, Chat, SeenBy
-from djmoney.models.fields import Money
 
 # Serializers
 from api.orders.serializers import OrderModelSerializer
 
+# Services
+from api.orders.unit_of_work import OrderUnitOfWork
+
 # Utils
-from datetime import datetime, timedelta
-from django.utils import timezone
+from datetime import datetime
 from api.utils import helpers
 
 
@@ -57,47 +57,16 @@ class DeliveryModelSerializer(serializers.ModelSerializer):
 
         order = self.context['order']
         validated_data['order'] = order
-        delivery = Delivery.objects.create(**validated_data)
-        activity = Activity.objects.create(
-            type=Activity.DELIVERY,
-            order=order
-        )
-        DeliveryActivity.objects.create(
-            activity=activity,
-            delivery=delivery
-        )
-
-        seller = order.seller
-        buyer = order.buyer
-
-        chats = Chat.objects.filter(participants=seller)
-        chats = chats.filter(participants=buyer)
-
-        chat_instance = None
-        if chats.exists():
-            for chat in chats:
-                if chat.participants.all().count() == 2:
-                    chat_instance = chat
-
-        if not chat_instance:
-
-            chat_instance = Chat.objects.create()
-
-            chat_instance.participants.add(buyer)
-            chat_instance.participants.add(seller)
-            chat_instance.save()
-
-        # Create the message
-
-        message = Message.objects.create(chat=chat_instance, activity=activity, sent_by=seller)
-        chat_instance.last_message = message
-        chat_instance.save()
-        # Set message seen
-        seen_by, created = SeenBy.objects.get_or_create(chat=chat_instance, user=seller)
-        if seen_by.message != chat_instance.last_message:
-
-            seen_by.message = chat_instance.last_message
-            seen_by.save()
+        with OrderUnitOfWork() as uow:
+            delivery = Delivery.objects.create(**validated_data)
+            uow.post_activity(
+                order,
+                Activity.DELIVERY,
+                DeliveryActivity,
+                sent_by=order.seller,
+                sent_to=order.buyer,
+                delivery=delivery
+            )
 
         return delivery
 
@@ -149,8 +118,9 @@ class AcceptDeliveryModelSerializer(serializers.ModelSerializer):
             currencyRate, _ = helpers.get_currency_rate(user.currency, offer_object.rate_date)
             subtotal = float(offer_object.payment_at_delivery.amount) * currencyRate
 
-            available_for_withdrawal = (float(user.available_for_withdrawal.amount) +
-                                        float(user.pending_clearance.amount)) * currencyRate
+            balance = Earning.objects.balance(user)
+            available_for_withdrawal = (float(balance['available_for_withdrawal'].amount) +
+                                        float(balance['pending_clearance'].amount)) * currencyRate
             used_credits = 0
             if available_for_withdrawal > 0:
                 if available_for_withdrawal > subtotal:
@@ -181,22 +151,8 @@ class AcceptDeliveryModelSerializer(serializers.ModelSerializer):
 
         seller = order.seller
 
-        if order.type == Order.HOLDING_PAYMENT_ORDER:
-
-            # Return de money to user as credits
-            seller.net_income += order.due_to_seller
-
-            Earning.objects.create(
-                user=seller,
-                type=Earning.ORDER_REVENUE,
-                amount=order.due_to_seller,
-                available_for_withdrawn_date=timezone.now() + timedelta(days=14)
-            )
-            seller.pending_clearance = seller.pending_clearance + order.due_to_seller
-
-            seller.save()
-
-        elif order.type == Order.TWO_PAYMENTS_ORDER:
+        if order.type == Order.TWO_PAYMENTS_ORDER:
+            # Charge the payment at delivery before writing anything
             if not user.stripe_customer_id:
 
                 new_customer = stripe.Customer.create(
@@ -205,7 +161,7 @@ class AcceptDeliveryModelSerializer(serializers.ModelSerializer):
                     email=user.email,
                 )
                 user.stripe_customer_id = new_customer['id']
-                user.save()
+                user.save(update_fields=['stripe_customer_id'])
 
             stripe.Customer.modify(
                 user.stripe_customer_id,
@@ -230,105 +186,37 @@ class AcceptDeliveryModelSerializer(serializers.ModelSerializer):
                 customer=user.stripe_customer_id,
             )
             user.default_payment_method = payment_method_id
-            user.save()
+            user.save(update_fields=['default_payment_method'])
             invoice_paid = stripe.Invoice.pay(invoice['id'])
-            invoice_id = invoice_paid['id']
-            currency = invoice_paid['currency']
-            charge_id = invoice_paid['charge']
-            amount_paid = invoice_paid['amount_paid']
-            status = invoice_paid['status']
-            invoice_pdf = invoice_paid['invoice_pdf']
-            OrderPayment.objects.create(
-                order=order,
-                invoice_id=invoice_id,
-                invoice_pdf=invoice_pdf,
-                charge_id=charge_id,
-                amount_paid=float(amount_paid) / 100,
-                currency=currency,
-                status=status,
-            )
-
-            # If used credits pay with credits
-            used_credits, _ = helpers.convert_currency(
-                "USD", user.currency, order_checkout['used_credits'], order.rate_date)
-
-            if used_credits > 0:
-                Earning.objects.create(
-                    user=user,
-                    type=Earning.SPENT,
-                    amount=Money(amount=used_credits, currency="USD")
-                )
-
-                # Substract in pending_clearance and available_for_withdrawal the used credits amount
-                pending_clearance = user.pending_clearance - Money(amount=used_credits, currency="USD")
-
-                if pending_clearance < Money(amount=0, currency="USD"):
-                    user.pending_clearance = Money(amount=0, currency="USD")
-                    available_money_payed = abs(pending_clearance)
-                    available_for_withdrawal = user.available_for_withdrawal - available_money_payed
-                    if available_for_withdrawal < Money(amount=0, currency="USD"):
-                        available_for_withdrawal = Money(amount=0, currency="USD")
-                    user.available_for_withdrawal = available_for_withdrawal
-                else:
-
-                    user.pending_clearance = pending_clearance
-                user.used_for_purchases += Money(amount=used_credits, currency="USD")
-                user.save()
-
-            seller.net_income = seller.net_income + order.payment_at_delivery
-
-            Earning.objects.create(
-                user=seller,
-                type=Earning.ORDER_REVENUE,
-                amount=order.payment_at_delivery,
-                available_for_withdrawn_date=timezone.now() + timedelta(days=14)
 
+        with OrderUnitOfWork() as uow:
+            if order.type == Order.HOLDING_PAYMENT_ORDER:
+                # Release the held payment to the seller
+                uow.credit_seller(seller, order.due_to_seller)
+
+            elif order.type == Order.TWO_PAYMENTS_ORDER:
+                uow.add_payment(order, invoice_paid)
+
+                # If used credits pay with credits
+                used_credits, _ = helpers.convert_currency(
+                    "USD", user.currency, order_checkout['used_credits'], order.rate_date)
+                if used_credits > 0:
+                    uow.spend_credits(user, used_credits)
+
+                uow.credit_seller(seller, order.payment_at_delivery)
+                order.payment_at_delivery_price_id = price['id']
+                uow.save(order, 'payment_at_delivery_price_id')
+
+            order.status = Order.DELIVERED
+            uow.save(order, 'status')
+
+            uow.post_activity(
+                order,
+                Activity.DELIVERY,
+                DeliveryActivity,
+                sent_by=order.buyer,
+                sent_to=seller,
+                delivery=instance,
+                status=DeliveryActivity.ACCEPTED
             )
-            seller.pending_clearance = seller.pending_clearance + order.payment_at_delivery
-
-            order.payment_at_delivery_price_id = price['id']
-            seller.save()
-
-        order.status = Order.DELIVERED
-        order.save()
-        issued_to = order.seller
-        issued_by = order.buyer
-
-        chats = Chat.objects.filter(participants=issued_by)
-        chats = chats.filter(participants=issued_to)
-        activity = Activity.objects.create(
-            type=Activity.DELIVERY,
-            order=order
-        )
-        DeliveryActivity.objects.create(
-            activity=activity,
-            delivery=instance,
-            status=DeliveryActivity.ACCEPTED
-        )
-
-        chat_instance = None
-        if chats.exists():
-            for chat in chats:
-                if chat.participants.all().count() == 2:
-                    chat_instance = chat
-
-            if not chat_instance:
-
-                chat_instance = Chat.objects.create()
-
-                chat_instance.participants.add(issued_to)
-                chat_instance.participants.add(issued_by)
-                chat_instance.save()
-
-            # Create the message
-
-            message = Message.objects.create(chat=chat_instance, activity=activity, sent_by=issued_by)
-            chat_instance.last_message = message
-            chat_instance.save()
-            # Set message seen
-            seen_by, created = SeenBy.objects.get_or_create(chat=chat_instance, user=issued_by)
-            if seen_by.message != chat_instance.last_message:
-
-                seen_by.message = chat_instance.last_message
-                seen_by.save()
         return instance
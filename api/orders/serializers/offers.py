@@ -12,10 +12,11 @@ from django.shortcuts import get_object_or_404
 from api.orders.models import Offer, Order
 from api.activities.models import Activity, OfferActivity
 from api.users.models import User
-from api.chats.models import Message, Chat, SeenBy
+from api.chats.models import Message, Chat
 
 # Serializers
-from api.users.serializers import UserModelSerializer
+from api.users.serializers import UserModelSerializer, UserSummarySerializer
+from api.utils.serializers.dynamic_fields import DynamicFieldsMixin
 
 # Utils
 from datetime import timedelta
@@ -23,10 +24,10 @@ import re
 from django.utils import timezone
 
 
-class OfferModelSerializer(serializers.ModelSerializer):
+class OfferModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Offer model serializer."""
-    seller = UserModelSerializer(read_only=True)
-    buyer = UserModelSerializer(read_only=True)
+    seller = UserSummarySerializer(read_only=True)
+    buyer = UserSummarySerializer(read_only=True)
 
     class Meta:
         """Meta class."""
@@ -53,6 +54,10 @@ class OfferModelSerializer(serializers.ModelSerializer):
         )
 
         read_only_fields = ("id", "seller", "delivery_date", "accepted")
+        expandable_fields = {
+            "seller": UserModelSerializer,
+            "buyer": UserModelSerializer,
+        }
         extra_kwargs = {"first_payment": {"required": False, "allow_null": True},
                         "buyer": {"required": False, "allow_null": True},
                         "buyer_email": {"required": False, "allow_null": True},
@@ -89,7 +94,7 @@ class OfferModelSerializer(serializers.ModelSerializer):
         return super().validate(data)
 
     def create(self, validated_data):
-        from api.taskapp.tasks import send_offer
+        from api.notifications import outbox
         request = self.context['request']
         send_offer_by_email = validated_data['send_offer_by_email']
 
@@ -145,29 +150,17 @@ class OfferModelSerializer(serializers.ModelSerializer):
                 user_exists = False
 
         if not user_exists:
-            send_offer(seller, buyer_email, user_exists, offer.id)
+            outbox.enqueue('send_offer', str(seller.pk), buyer_email, user_exists, str(offer.id),
+                           key='send_offer:%s' % offer.id)
 
         else:
 
-            send_offer(seller, buyer.email, True, offer.id, buyer.id)
+            outbox.enqueue('send_offer', str(seller.pk), buyer.email, True, str(offer.id), str(buyer.id),
+                           key='send_offer:%s' % offer.id)
 
             # Get or create the chat
 
-            chats = Chat.objects.filter(participants=seller)
-            chats = chats.filter(participants=buyer)
-            chat_instance = None
-            if chats.exists():
-                for chat in chats:
-                    if chat.participants.all().count() == 2:
-                        chat_instance = chat
-
-            if not chat_instance:
-
-                chat_instance = Chat.objects.create()
-
-                chat_instance.participants.add(buyer)
-                chat_instance.participants.add(seller)
-                chat_instance.save()
+            chat_instance, _ = Chat.objects.get_or_create_direct(seller, buyer)
 
             # Create the message
 
@@ -175,11 +168,4 @@ class OfferModelSerializer(serializers.ModelSerializer):
             chat_instance.last_message = message
             chat_instance.save()
 
-            # Set message seen
-            seen_by, created = SeenBy.objects.get_or_create(chat=chat_instance, user=seller)
-            if seen_by.message != chat_instance.last_message:
-
-                seen_by.message = chat_instance.last_message
-                seen_by.save()
-
         return offer
@@ -12,23 +12,23 @@ from django.shortcuts import get_object_or_404
 from api.orders.models import Order
 from api.users.models import User, Earning
 from api.activities.models import OfferActivity, Activity, CancelOrderActivity
-from api.orders.models import Offer, OrderPayment
-from api.chats.models import Message, Chat, SeenBy
-from djmoney.models.fields import Money
+from api.orders.models import Offer
 
 # Serializers
-from api.users.serializers import UserModelSerializer
+from api.users.serializers import UserModelSerializer, UserSummarySerializer
+from api.utils.serializers.dynamic_fields import DynamicFieldsMixin
+
+# Services
+from api.orders.unit_of_work import OrderUnitOfWork
 
 # Utils
 from api.utils import helpers
-from datetime import timedelta
-from django.utils import timezone
 
 
-class OrderModelSerializer(serializers.ModelSerializer):
+class OrderModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """User model serializer."""
-    seller = UserModelSerializer()
-    buyer = UserModelSerializer()
+    seller = UserSummarySerializer(read_only=True)
+    buyer = UserSummarySerializer(read_only=True)
 
     class Meta:
         """Meta class."""
@@ -36,6 +36,10 @@ class OrderModelSerializer(serializers.ModelSerializer):
         model = Order
         fields = (
             "__all__")
+        expandable_fields = {
+            "seller": UserModelSerializer,
+            "buyer": UserModelSerializer,
+        }
 
         read_only_fields = ("id",)
 
@@ -67,8 +71,9 @@ class AcceptOrderSerializer(serializers.Serializer):
             currencyRate, _ = helpers.get_currency_rate(user.currency, offer_object.rate_date)
             subtotal = float(offer_object.unit_amount.amount) * currencyRate
 
-            available_for_withdrawal = (float(user.available_for_withdrawal.amount) +
-                                        float(user.pending_clearance.amount)) * currencyRate
+            balance = Earning.objects.balance(user)
+            available_for_withdrawal = (float(balance['available_for_withdrawal'].amount) +
+                                        float(balance['pending_clearance'].amount)) * currencyRate
             used_credits = 0
             if available_for_withdrawal > 0:
                 if available_for_withdrawal > subtotal:
@@ -94,8 +99,9 @@ class AcceptOrderSerializer(serializers.Serializer):
             first_payment = subtotal
             payment_at_delivery = float(offer_object.payment_at_delivery.amount) * currencyRate
 
-            available_for_withdrawal = (float(user.available_for_withdrawal.amount) +
-                                        float(user.pending_clearance.amount)) * currencyRate
+            balance = Earning.objects.balance(user)
+            available_for_withdrawal = (float(balance['available_for_withdrawal'].amount) +
+                                        float(balance['pending_clearance'].amount)) * currencyRate
             used_credits = 0
             if available_for_withdrawal > 0:
                 if available_for_withdrawal > subtotal:
@@ -121,7 +127,7 @@ class AcceptOrderSerializer(serializers.Serializer):
                 email=user.email,
             )
             user.stripe_customer_id = new_customer['id']
-            user.save()
+            user.save(update_fields=['stripe_customer_id'])
         stripe.Customer.modify(
             user.stripe_customer_id,
             invoice_settings={
@@ -166,7 +172,7 @@ class AcceptOrderSerializer(serializers.Serializer):
 
             )
             user.default_payment_method = payment_method_id
-            user.save()
+            user.save(update_fields=['default_payment_method'])
             invoice_paid = stripe.Invoice.pay(invoice['id'])
             self.context['price'] = price
             self.context['product'] = product
@@ -189,7 +195,7 @@ class AcceptOrderSerializer(serializers.Serializer):
                 default_payment_method=payment_method_id
             )
             user.default_payment_method = payment_method_id
-            user.save()
+            user.save(update_fields=['default_payment_method'])
             invoice_paid = stripe.Invoice.pay(invoice['id'])
 
             # Invoice paid succesfully, do actions
@@ -215,7 +221,7 @@ class AcceptOrderSerializer(serializers.Serializer):
 
             )
             user.default_payment_method = payment_method_id
-            user.save()
+            user.save(update_fields=['default_payment_method'])
             invoice_paid = stripe.Invoice.pay(invoice['id'])
             self.context['price'] = price
             self.context['product'] = product
@@ -234,7 +240,7 @@ class AcceptOrderSerializer(serializers.Serializer):
                 raise serializers.ValidationError(
                     "Interval not valid")
             user.default_payment_method = payment_method_id
-            user.save()
+            user.save(update_fields=['default_payment_method'])
             price = stripe.Price.create(
                 unit_amount=int(unit_amount_with_discount * 100),
                 currency=user.currency,
@@ -257,6 +263,7 @@ class AcceptOrderSerializer(serializers.Serializer):
         user = request.user
         stripe = self.context['stripe']
         product = self.context['product']
+        price = self.context['price']
 
         offer_object = self.context['offer_object']
 
@@ -264,250 +271,9 @@ class AcceptOrderSerializer(serializers.Serializer):
         unit_amount, _ = helpers.convert_currency('USD', user.currency, offer['unit_amount'], offer_object.rate_date)
         used_credits, _ = helpers.convert_currency("USD", user.currency, offer['used_credits'], offer_object.rate_date)
 
-        new_order = Order.objects.create(
-            offer=offer_object,
-            buyer=offer_object.buyer,
-            seller=offer_object.seller,
-            title=offer_object.title,
-            description=offer_object.description,
-            unit_amount=unit_amount,
-            used_credits=used_credits,
-            service_fee=service_fee,
-            first_payment=offer_object.first_payment,
-            payment_at_delivery=offer_object.payment_at_delivery,
-            delivery_date=offer_object.delivery_date,
-            delivery_time=offer_object.delivery_time,
-            interval_subscription=offer_object.interval_subscription,
-            type=offer_object.type,
-            rate_date=offer_object.rate_date,
-            product_id=product['id']
-        )
-
-        offer_activity_queryset = OfferActivity.objects.filter(offer=offer_object, status=OfferActivity.PENDENDT)
-        offer_activity = None
-        if offer_activity_queryset.exists():
-            offer_activity = offer_activity_queryset.first()
-        activity = offer_activity.activity
-        activity.closed = True
-        activity.active = False
-        activity = Activity.objects.create(
-            type=Activity.OFFER,
-            order=new_order,
-            closed=True,
-            active=False
-        )
-        OfferActivity.objects.create(
-            activity=activity,
-            offer=offer_object,
-            status=OfferActivity.ACCEPTED
-        )
-
-        chats = Chat.objects.filter(participants=new_order.seller)
-        chats = chats.filter(participants=new_order.buyer)
-        chat_instance = None
-        if chats.exists():
-            for chat in chats:
-                if chat.participants.all().count() == 2:
-                    chat_instance = chat
-
-        if not chat_instance:
-
-            chat_instance = Chat.objects.create()
-
-            chat_instance.participants.add(new_order.buyer)
-            chat_instance.participants.add(new_order.seller)
-            chat_instance.save()
-
-        # Create the message
-
-        message = Message.objects.create(chat=chat_instance, activity=activity, sent_by=new_order.buyer)
-        chat_instance.last_message = message
-        chat_instance.save()
-
-        # Set message seen
-        seen_by, _ = SeenBy.objects.get_or_create(chat=chat_instance, user=new_order.buyer)
-        if seen_by.message != chat_instance.last_message:
-
-            seen_by.message = chat_instance.last_message
-            seen_by.save()
-
-        if offer['type'] == Order.ONE_PAYMENT_ORDER:
-            price = self.context['price']
-
-            # user.available_for_withdrawal = user.available_for_withdrawal - \
-            #     Money(amount=used_credits, currency="USD")
-            if used_credits:
-
-                Earning.objects.create(
-                    user=user,
-                    type=Earning.SPENT,
-                    amount=Money(amount=used_credits, currency="USD")
-                )
-
-                # Substract in pending_clearance and available_for_withdrawal the used credits amount
-
-                pending_clearance = user.pending_clearance - Money(amount=used_credits, currency="USD")
-
-                if pending_clearance < Money(amount=0, currency="USD"):
-                    user.pending_clearance = Money(amount=0, currency="USD")
-                    available_money_payed = abs(pending_clearance)
-                    available_for_withdrawal = user.available_for_withdrawal - available_money_payed
-                    if available_for_withdrawal < Money(amount=0, currency="USD"):
-                        available_for_withdrawal = Money(amount=0, currency="USD")
-                    user.available_for_withdrawal = available_for_withdrawal
-                else:
-                    user.pending_clearance = pending_clearance
-
-                user.used_for_purchases = user.used_for_purchases + Money(amount=used_credits, currency="USD")
-                user.save()
-
-            invoice_paid = self.context['invoice_paid']
-            invoice_id = invoice_paid['id']
-            currency = invoice_paid['currency']
-            charge_id = invoice_paid['charge']
-            amount_paid = invoice_paid['amount_paid']
-            status = invoice_paid['status']
-            invoice_pdf = invoice_paid['invoice_pdf']
-
-            new_order.price_id = price['id']
-            new_order.save()
-
-            OrderPayment.objects.create(
-                order=new_order,
-                invoice_id=invoice_id,
-                invoice_pdf=invoice_pdf,
-                charge_id=charge_id,
-                amount_paid=float(amount_paid) / 100,
-                currency=currency,
-                status=status,
-            )
-
-            seller = new_order.seller
-            seller.net_income = seller.net_income + offer_object.unit_amount
-            seller.save()
-            Earning.objects.create(
-                user=seller,
-                amount=offer_object.unit_amount,
-                available_for_withdrawn_date=timezone.now() + timedelta(days=14)
-            )
-            seller.pending_clearance += offer_object.unit_amount
-
-        elif offer['type'] == Order.HOLDING_PAYMENT_ORDER:
-
-            # user.available_for_withdrawal = user.available_for_withdrawal - \
-            #     Money(amount=used_credits, currency="USD")
-
-            if used_credits > 0:
-                Earning.objects.create(
-                    user=user,
-                    type=Earning.SPENT,
-                    amount=Money(amount=used_credits, currency="USD")
-                )
-
-                # Substract in pending_clearance and available_for_withdrawal the used credits amount
-                pending_clearance = user.pending_clearance - Money(amount=used_credits, currency="USD")
-
-                if pending_clearance < Money(amount=0, currency="USD"):
-                    user.pending_clearance = Money(amount=0, currency="USD")
-                    available_money_payed = abs(pending_clearance)
-                    available_for_withdrawal = user.available_for_withdrawal - available_money_payed
-                    if available_for_withdrawal < Money(amount=0, currency="USD"):
-                        available_for_withdrawal = Money(amount=0, currency="USD")
-                    user.available_for_withdrawal = available_for_withdrawal
-                else:
-
-                    user.pending_clearance = pending_clearance
-                user.used_for_purchases += Money(amount=used_credits, currency="USD")
-                user.save()
-
-            price = self.context['price']
-
-            invoice_paid = self.context['invoice_paid']
-            invoice_id = invoice_paid['id']
-            currency = invoice_paid['currency']
-            charge_id = invoice_paid['charge']
-            amount_paid = invoice_paid['amount_paid']
-            status = invoice_paid['status']
-            invoice_pdf = invoice_paid['invoice_pdf']
-
-            new_order.price_id = price['id']
-            new_order.due_to_seller = offer_object.unit_amount
-            new_order.save()
-
-            OrderPayment.objects.create(
-                order=new_order,
-                invoice_id=invoice_id,
-                invoice_pdf=invoice_pdf,
-                charge_id=charge_id,
-                amount_paid=float(amount_paid) / 100,
-                currency=currency,
-                status=status,
-            )
-
-        elif offer['type'] == Order.TWO_PAYMENTS_ORDER:
-            price = self.context['price']
-
-            # user.available_for_withdrawal = user.available_for_withdrawal - \
-            #     Money(amount=used_credits, currency="USD")
-            if used_credits:
-
-                Earning.objects.create(
-                    user=user,
-                    type=Earning.SPENT,
-                    amount=Money(amount=used_credits, currency="USD")
-                )
-
-                # Substract in pending_clearance and available_for_withdrawal the used credits amount
-
-                pending_clearance = user.pending_clearance - Money(amount=used_credits, currency="USD")
-
-                if pending_clearance < Money(amount=0, currency="USD"):
-                    user.pending_clearance = Money(amount=0, currency="USD")
-                    available_money_payed = abs(pending_clearance)
-                    available_for_withdrawal = user.available_for_withdrawal - available_money_payed
-                    if available_for_withdrawal < Money(amount=0, currency="USD"):
-                        available_for_withdrawal = Money(amount=0, currency="USD")
-                    user.available_for_withdrawal = available_for_withdrawal
-                else:
-                    user.pending_clearance = pending_clearance
-
-                user.used_for_purchases = user.used_for_purchases + Money(amount=used_credits, currency="USD")
-                user.save()
-
-            invoice_paid = self.context['invoice_paid']
-            invoice_id = invoice_paid['id']
-            currency = invoice_paid['currency']
-            charge_id = invoice_paid['charge']
-            amount_paid = invoice_paid['amount_paid']
-            status = invoice_paid['status']
-            invoice_pdf = invoice_paid['invoice_pdf']
-
-            new_order.price_id = price['id']
-            new_order.payment_at_delivery = offer_object.payment_at_delivery
-            new_order.save()
-
-            OrderPayment.objects.create(
-                order=new_order,
-                invoice_id=invoice_id,
-                invoice_pdf=invoice_pdf,
-                charge_id=charge_id,
-                amount_paid=float(amount_paid) / 100,
-                currency=currency,
-                status=status,
-            )
-
-            seller = new_order.seller
-            seller.net_income = seller.net_income + offer_object.first_payment
-            seller.save()
-            Earning.objects.create(
-                user=seller,
-                amount=offer_object.first_payment,
-                available_for_withdrawn_date=timezone.now() + timedelta(days=14)
-            )
-            seller.pending_clearance += offer_object.first_payment
-
-        elif offer['type'] == Order.RECURRENT_ORDER:
-            price = self.context['price']
+        # Subscribe before the transaction opens, so a failed subscription writes nothing
+        subscription = None
+        if offer['type'] == Order.RECURRENT_ORDER:
             try:
                 subscription = stripe.Subscription.create(
                     customer=user.stripe_customer_id,
@@ -516,20 +282,84 @@ class AcceptOrderSerializer(serializers.Serializer):
                     ],
                     expand=["latest_invoice.payment_intent"],
                 )
-                subscription_id = subscription['id']
-
-                new_order.price_id = price['id']
-                new_order.subscription_id = subscription_id
-                new_order.save()
-
             except Exception as e:
-                new_order.delete()
-                offer_object.save()
                 print(e)
                 raise serializers.ValidationError(
                     'Something went wrong')
-        offer_object.accepted = True
-        offer_object.save()
-        new_order.seller.active_month = True
-        new_order.seller.save()
+
+        try:
+            new_order = self.accept_offer(offer, user, offer_object, product, price, subscription,
+                                          service_fee, unit_amount, used_credits)
+        except Exception:
+            # The order was rolled back, do not charge a subscription without it
+            if subscription:
+                stripe.Subscription.delete(subscription['id'])
+            raise
+        return new_order
+
+    def accept_offer(self, offer, user, offer_object, product, price, subscription,
+                     service_fee, unit_amount, used_credits):
+        """Create the order of the offer and its activity in one unit of work."""
+        with OrderUnitOfWork() as uow:
+            new_order = Order(
+                offer=offer_object,
+                buyer=offer_object.buyer,
+                seller=offer_object.seller,
+                title=offer_object.title,
+                description=offer_object.description,
+                unit_amount=unit_amount,
+                used_credits=used_credits,
+                service_fee=service_fee,
+                first_payment=offer_object.first_payment,
+                payment_at_delivery=offer_object.payment_at_delivery,
+                delivery_date=offer_object.delivery_date,
+                delivery_time=offer_object.delivery_time,
+                interval_subscription=offer_object.interval_subscription,
+                type=offer_object.type,
+                rate_date=offer_object.rate_date,
+                product_id=product['id'],
+                price_id=price['id']
+            )
+            seller = new_order.seller
+
+            if offer['type'] == Order.HOLDING_PAYMENT_ORDER:
+                new_order.due_to_seller = offer_object.unit_amount
+            elif offer['type'] == Order.RECURRENT_ORDER:
+                new_order.subscription_id = subscription['id']
+            new_order.save()
+
+            offer_activity = OfferActivity.objects.filter(
+                offer=offer_object,
+                status=OfferActivity.PENDENDT
+            ).select_related('activity').first()
+            if offer_activity:
+                activity = offer_activity.activity
+                activity.closed = True
+                activity.active = False
+                uow.save(activity, 'closed', 'active')
+            uow.post_activity(
+                new_order,
+                Activity.OFFER,
+                OfferActivity,
+                sent_by=new_order.buyer,
+                sent_to=seller,
+                closed=True,
+                offer=offer_object,
+                status=OfferActivity.ACCEPTED
+            )
+
+            if offer['type'] != Order.RECURRENT_ORDER:
+                if used_credits:
+                    uow.spend_credits(user, used_credits)
+                uow.add_payment(new_order, self.context['invoice_paid'])
+
+            if offer['type'] == Order.ONE_PAYMENT_ORDER:
+                uow.credit_seller(seller, offer_object.unit_amount)
+            elif offer['type'] == Order.TWO_PAYMENTS_ORDER:
+                uow.credit_seller(seller, offer_object.first_payment)
+
+            offer_object.accepted = True
+            uow.save(offer_object, 'accepted')
+            seller.active_month = True
+            uow.save(seller, 'active_month')
         return new_order
@@ -12,7 +12,7 @@ from django.shortcuts import get_object_or_404
 from api.orders.models import Revision, Order
 from api.activities.models import Activity, RevisionActivity
 from api.users.models import User
-from api.chats.models import Message, Chat, SeenBy
+from api.chats.models import Message, Chat
 
 # Serializers
 from api.orders.serializers import OrderModelSerializer
@@ -58,32 +58,11 @@ class RevisionModelSerializer(serializers.ModelSerializer):
         issued_by = order.buyer
         issued_to = order.seller
 
-        chats = Chat.objects.filter(participants=issued_by)
-        chats = chats.filter(participants=issued_to)
-
-        chat_instance = None
-        if chats.exists():
-            for chat in chats:
-                if chat.participants.all().count() == 2:
-                    chat_instance = chat
-
-        if not chat_instance:
-
-            chat_instance = Chat.objects.create()
-
-            chat_instance.participants.add(issued_to)
-            chat_instance.participants.add(issued_by)
-            chat_instance.save()
+        chat_instance, _ = Chat.objects.get_or_create_direct(issued_by, issued_to)
 
         # Create the message
 
         message = Message.objects.create(chat=chat_instance, activity=activity, sent_by=issued_by)
         chat_instance.last_message = message
         chat_instance.save()
-        # Set message seen
-        seen_by, created = SeenBy.objects.get_or_create(chat=chat_instance, user=issued_by)
-        if seen_by.message != chat_instance.last_message:
-
-            seen_by.message = chat_instance.last_message
-            seen_by.save()
         return revision
@@ -0,0 +1,36 @@
+"""Order unit of work tests."""
+
+# Django
+from django.test import TestCase
+
+# Model
+from api.users.models import User, Earning
+from djmoney.money import Money
+
+# Services
+from api.orders.unit_of_work import OrderUnitOfWork
+
+
+class OrderUnitOfWorkTestCase(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+
+    def test_writes_are_committed_on_exit(self):
+        with OrderUnitOfWork() as uow:
+            uow.credit_seller(self.seller, Money(amount=20, currency="USD"))
+
+        seller = User.objects.get(pk=self.seller.pk)
+        self.assertEqual(seller.net_income, Money(amount=20, currency="USD"))
+        self.assertEqual(seller.pending_clearance, Money(amount=20, currency="USD"))
+        self.assertEqual(Earning.objects.filter(user=self.seller).count(), 1)
+
+    def test_nothing_is_written_if_the_flow_fails(self):
+        with self.assertRaises(ValueError):
+            with OrderUnitOfWork() as uow:
+                uow.credit_seller(self.seller, Money(amount=20, currency="USD"))
+                raise ValueError("Card declined")
+
+        seller = User.objects.get(pk=self.seller.pk)
+        self.assertEqual(seller.net_income, Money(amount=0, currency="USD"))
+        self.assertFalse(Earning.objects.filter(user=self.seller).exists())
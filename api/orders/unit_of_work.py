@@ -0,0 +1,108 @@
+"""Order flows unit of work.
+
+Accepting an offer, delivering or cancelling an order write the order, its
+activity and chat message, the payments, the earnings and the balances of
+both users. OrderUnitOfWork runs those writes in a single transaction:
+payments are queued and inserted with one bulk_create per model, changed
+fields are collected per instance and saved once with update_fields, balances
+are moved through the Earning ledger, and nothing is committed if the flow
+raises, e.g. when a Stripe call fails.
+"""
+
+# Django
+from django.db import transaction
+
+# Models
+from api.activities.models import Activity
+from api.chats.models import Chat, Message
+from api.orders.models import OrderPayment
+from api.users.models import Earning
+from djmoney.models.fields import MoneyField
+
+# Utilities
+import sys
+
+
+class OrderUnitOfWork:
+    """Writes of an order flow, committed once when the with block exits."""
+
+    def __init__(self):
+        self.inserts = {}
+        self.updates = {}
+
+    def __enter__(self):
+        self.atomic = transaction.atomic()
+        self.atomic.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            try:
+                self.flush()
+            except Exception:
+                self.atomic.__exit__(*sys.exc_info())
+                raise
+        return self.atomic.__exit__(exc_type, exc_value, traceback)
+
+    def add(self, instance):
+        """Queue a new instance, inserted in bulk with the ones of its model."""
+        self.inserts.setdefault(type(instance), []).append(instance)
+        return instance
+
+    def save(self, instance, *fields):
+        """Mark fields of an instance as changed, saved once on flush."""
+        _, changed = self.updates.setdefault(id(instance), (instance, set()))
+        for name in fields:
+            changed.add(name)
+            if isinstance(instance._meta.get_field(name), MoneyField):
+                changed.add('{}_currency'.format(name))
+        return instance
+
+    def flush(self):
+        for model, instances in self.inserts.items():
+            model.objects.bulk_create(instances)
+        for instance, fields in self.updates.values():
+            if 'modified' not in fields and hasattr(instance, 'modified'):
+                fields.add('modified')
+            instance.save(update_fields=fields)
+        self.inserts = {}
+        self.updates = {}
+
+    def add_payment(self, order, invoice_paid):
+        """Queue the payment of a paid Stripe invoice."""
+        return self.add(OrderPayment(
+            order=order,
+            invoice_id=invoice_paid['id'],
+            invoice_pdf=invoice_paid['invoice_pdf'],
+            charge_id=invoice_paid['charge'],
+            amount_paid=float(invoice_paid['amount_paid']) / 100,
+            currency=invoice_paid['currency'],
+            status=invoice_paid['status'],
+        ))
+
+    def credit_seller(self, seller, amount):
+        """Add an order revenue to the seller, pending clearance."""
+        return Earning.objects.credit(seller, amount)
+
+    def spend_credits(self, user, used_credits):
+        """Pay with the credits of a user, pending clearance first."""
+        return Earning.objects.spend(user, used_credits)
+
+    def post_activity(self, order, activity_type, item_model, sent_by, sent_to, closed=False, **item):
+        """Create an order activity and the chat message that shows it.
+
+        The activity item and the message are saved right away, their
+        post_save handlers keep the activity status and the inboxes.
+        """
+        activity = Activity.objects.create(
+            type=activity_type,
+            order=order,
+            closed=closed,
+            active=not closed
+        )
+        item_model.objects.create(activity=activity, **item)
+
+        chat, _ = Chat.objects.get_or_create_direct(sent_by, sent_to)
+        chat.last_message = Message.objects.create(chat=chat, activity=activity, sent_by=sent_by)
+        self.save(chat, 'last_message')
+        return activity
@@ -4,6 +4,7 @@
 import pdb
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
+from django.db.models import Prefetch
 
 
 # Django REST Framework
@@ -25,8 +26,12 @@ from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 
 # Models
 from api.orders.models import Order
+from api.users.models import User
 from api.activities.models import Activity
 
+# Utils
+from api.utils.serializers.dynamic_fields import is_expanded
+
 # Serializers
 from api.orders.serializers import OrderModelSerializer, AcceptOrderSerializer
 from api.activities.serializers import ActivityModelSerializer
@@ -83,6 +88,14 @@ class OrderViewSet(
             queryset = Order.objects.filter(seller=user)
         else:
             queryset = Order.objects.filter(buyer=user)
+        # Embeds are compact unless expanded to the full profile
+        for field in ["seller", "buyer"]:
+            if is_expanded(self.request, field):
+                queryset = queryset.prefetch_related(
+                    Prefetch(field, queryset=User.objects.with_profile_annotations())
+                )
+            else:
+                queryset = queryset.select_related(field)
 
         if self.action == "active_orders":
             return queryset.filter(status=Order.ACTIVE)[:10]
@@ -8,3 +8,6 @@ class PlansAppConfig(AppConfig):
     """Plans app config."""
     name = 'api.plans'
     verbose_name = 'Plans'
+
+    def ready(self):
+        from . import signals
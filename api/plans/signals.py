@@ -0,0 +1,18 @@
+"""Plans signals."""
+
+# Django
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+# Models
+from api.plans.models import Plan
+
+# Utils
+from api.utils import geoip
+
+
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+def clear_plan_currencies(sender, instance, **kwargs):
+    """Drop the cached plan currencies used by the GeoIP resolver."""
+    geoip.clear_cache()
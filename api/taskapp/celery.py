@@ -20,12 +20,91 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+# Queue -> (priority, acks_late, rate limit per worker, tasks)
+# Email waits on SMTP and runs on an I/O pool, so a burst of it never holds
+# the prefork workers of billing. Billing and maintenance tasks are safe to
+# run twice and are only acked once done.
+TASK_QUEUES = {
+    'realtime': (0, False, None, [
+        'fan_out_message',
+        'relay_outbox',
+        'flush_presence',
+    ]),
+    'billing': (3, True, None, [
+        'check_if_pending_clearance_has_ended',
+        'take_balance_snapshots',
+        'sweep_subscriptions',
+        'process_stripe_events',
+        'refresh_payment_methods',
+    ]),
+    'email': (6, False, settings.CELERY_EMAIL_RATE_LIMIT, [
+        'send_feedback_email',
+        'send_confirmation_email',
+        'send_change_email_email',
+        'send_reset_password',
+        'send_invitation_email',
+        'send_offer',
+        'send_messages_digests',
+        'send_activity_notification',
+        'send_spooled_mail',
+    ]),
+    'maintenance': (9, True, None, [
+        'update_exchange_rates',
+    ]),
+}
+
+app.conf.task_routes = {
+    task: {'queue': queue, 'priority': priority}
+    for queue, (priority, _, _, tasks) in TASK_QUEUES.items()
+    for task in tasks
+}
+app.conf.task_annotations = {
+    task: {'acks_late': acks_late, 'rate_limit': rate_limit}
+    for queue, (_, acks_late, rate_limit, tasks) in TASK_QUEUES.items()
+    for task in tasks
+}
+
 app.conf.beat_schedule = {
 
     'check_if_pending_clearance_has_ended': {
         'task': 'check_if_pending_clearance_has_ended',
         'schedule': timedelta(days=1),
     },
+    'sweep_subscriptions': {
+        'task': 'sweep_subscriptions',
+        'schedule': timedelta(minutes=15),
+    },
+    'take_balance_snapshots': {
+        'task': 'take_balance_snapshots',
+        'schedule': timedelta(hours=1),
+    },
+    'update_exchange_rates': {
+        'task': 'update_exchange_rates',
+        'schedule': timedelta(hours=1),
+    },
+    # Fallback for the flushes scheduled by spool_mail, sends the retries
+    'send_spooled_mail': {
+        'task': 'send_spooled_mail',
+        'schedule': timedelta(minutes=1),
+    },
+    'send_messages_digests': {
+        'task': 'send_messages_digests',
+        'schedule': timedelta(minutes=1),
+    },
+    # Retries of the Stripe events that failed
+    'process_stripe_events': {
+        'task': 'process_stripe_events',
+        'schedule': timedelta(minutes=1),
+    },
+    'flush_presence': {
+        'task': 'flush_presence',
+        'schedule': timedelta(seconds=30),
+    },
+    # Fallback for the relayoutbox process
+    'relay_outbox': {
+        'task': 'relay_outbox',
+        'schedule': timedelta(seconds=30),
+    },
 }
 app.conf.timezone = 'UTC'
 
@@ -2,15 +2,16 @@
 
 # Django
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.module_loading import import_string
 
 # Models
-from api.users.models import User, Earning
+from api.users.models import User, Earning, BalanceSnapshot, PlanSubscription
 from rest_framework.authtoken.models import Token
-from api.notifications.models import NotificationUser, notifications
+from api.notifications.models import Notification, NotificationUser, NotificationCounter, notifications
+from api.chats.models import Message
 from api.activities.models import Activity, OfferActivity, DeliveryActivity, CancelOrderActivity
 from api.orders.models import Order
 from djmoney.money import Money
@@ -20,38 +21,40 @@ from celery.decorators import task
 
 # Utilities
 import jwt
+from datetime import timedelta
 import time
+import logging
 from django.utils import timezone
-from api.utils import helpers
+from api.utils import helpers, exchange_rates, mail_spool
+from api.notifications import presence, outbox, digest
+from api.users import webhooks
 import re
+import uuid
+import stripe
 
+logger = logging.getLogger(__name__)
 
-def send_mass_html_mail(datatuple, fail_silently=False, user=None, password=None,
-                        connection=None):
-    """
-    Given a datatuple of (subject, text_content, html_content, from_email,
-    recipient_list), sends each message to each recipient list. Returns the
-    number of emails sent.
 
-    If from_email is None, the DEFAULT_FROM_EMAIL setting is used.
-    If auth_user and auth_password are set, they're used to log in.
-    If auth_user is None, the EMAIL_HOST_USER setting is used.
-    If auth_password is None, the EMAIL_HOST_PASSWORD setting is used.
+def enqueue_on_commit(task, *args):
+    """Queue a task once the current transaction commits, right away outside of one.
 
+    Tasks take primary keys and plain values only, so they are serialized as
+    JSON and the worker loads fresh rows, never the state the request had.
     """
-    connection = connection or get_connection(
-        username=user, password=password, fail_silently=fail_silently)
-    messages = []
-    for subject, html, from_email, recipient in datatuple:
-        message = EmailMultiAlternatives(subject, html, from_email, recipient)
-        message.attach_alternative(html, 'text/html')
-        messages.append(message)
-    return connection.send_messages(messages)
+    args = [str(arg) if isinstance(arg, uuid.UUID) else arg for arg in args]
+    transaction.on_commit(lambda: task.apply_async(args=args))
+
+
+def spool_mail(subject, content, from_email, recipient_list):
+    """Spool a rendered html email, sent in a batch by send_spooled_mail."""
+    if mail_spool.spool(subject, content, from_email, recipient_list):
+        send_spooled_mail.apply_async(countdown=settings.MAIL_SPOOL_FLUSH_DELAY)
 
 
 @task(name='send_feedback_email', max_retries=3)
-def send_feedback_email(user, message):
-    """Check if the free trial has ended and turn off"""
+def send_feedback_email(user_id, message):
+    """Send the feedback left by a user to the team."""
+    user = User.objects.get(pk=user_id)
 
     subject = 'Feedback from @{}'.format(
         user.email)
@@ -63,15 +66,13 @@ def send_feedback_email(user, message):
     )
     recipient_list = ["iherms@freelanium.com", "freelanium@gmail.com"]
 
-    messages = [(subject, content, from_email, [recipient])
-                for recipient in recipient_list]
-
-    send_mass_html_mail(messages)
+    spool_mail(subject, content, from_email, recipient_list)
 
 
 @task(name='send_confirmation_email', max_retries=3)
-def send_confirmation_email(user):
+def send_confirmation_email(user_id):
     """Send account verification link to given user."""
+    user = User.objects.get(pk=user_id)
 
     verification_token = helpers.gen_verification_token(user)
     subject = 'Welcome @{}! Verify your account to start using Freelanium'.format(
@@ -81,14 +82,13 @@ def send_confirmation_email(user):
         'emails/users/account_verification.html',
         {'token': verification_token, 'user': user}
     )
-    msg = EmailMultiAlternatives(subject, content, from_email, [user.email])
-    msg.attach_alternative(content, "text/html")
-    msg.send()
+    spool_mail(subject, content, from_email, [user.email])
 
 
 @task(name='send_change_email_email', max_retries=3)
-def send_change_email_email(user, new_email):
+def send_change_email_email(user_id, new_email):
     """Send account verification link to given user."""
+    user = User.objects.get(pk=user_id)
 
     verification_token = helpers.gen_new_email_token(user, new_email)
     subject = 'Welcome @{}! Change your email'.format(
@@ -98,9 +98,7 @@ def send_change_email_email(user, new_email):
         'emails/users/change_email.html',
         {'token': verification_token, 'user': user}
     )
-    msg = EmailMultiAlternatives(subject, content, from_email, [user.email])
-    msg.attach_alternative(content, "text/html")
-    msg.send()
+    spool_mail(subject, content, from_email, [user.email])
 
 
 @task(name='send_reset_password', max_retries=3)
@@ -115,14 +113,13 @@ def send_reset_password_email(user_email):
         'emails/users/reset_password.html',
         {'token': verification_token, 'user': user}
     )
-    msg = EmailMultiAlternatives(subject, content, from_email, [user.email])
-    msg.attach_alternative(content, "text/html")
-    msg.send()
+    spool_mail(subject, content, from_email, [user.email])
 
 
 @task(name='send_invitation_email', max_retries=3)
-def send_invitation_email(user, email, message, type):
+def send_invitation_email(user_id, email, message, type):
     """Send account verification link to given user."""
+    user = User.objects.get(pk=user_id)
 
     verification_token = helpers.get_invitation_token(user, email)
     subject = 'Welcome! @{} has invited you '.format(
@@ -132,14 +129,13 @@ def send_invitation_email(user, email, message, type):
         'emails/users/user_invitation.html',
         {'token': verification_token, 'user': user, 'message': message, 'type': type}
     )
-    msg = EmailMultiAlternatives(subject, content, from_email, [email])
-    msg.attach_alternative(content, "text/html")
-    msg.send()
+    spool_mail(subject, content, from_email, [email])
 
 
 @task(name='send_offer', max_retries=3)
-def send_offer(user, email, user_exists, offer_id, buyer_id=None):
+def send_offer(user_id, email, user_exists, offer_id, buyer_id=None):
     """Send account verification link to given user."""
+    user = User.objects.get(pk=user_id)
     user_token = None
     verification_token = None
 
@@ -154,57 +150,89 @@ def send_offer(user, email, user_exists, offer_id, buyer_id=None):
         'emails/users/order_offer.html',
         {'token': verification_token, 'user': user, 'user_exists': user_exists, 'offer': offer_id}
     )
-    msg = EmailMultiAlternatives(subject, content, from_email, [email])
-    msg.attach_alternative(content, "text/html")
-    msg.send()
-
+    spool_mail(subject, content, from_email, [email])
 
-# @task(name='check_if_free_trial_have_ended')
-# def check_if_free_trial_have_ended():
-#     """Check if the free trial has ended and turn off"""
-#     now = timezone.now()
 
-#     # Update rides that have already finished
-#     users = User.objects.filter(
-#         free_trial_expiration__gte=now,
-#         is_free_trial=True
-#     )
-#     users.update(is_free_trial=False, passed_free_trial_once=True)
-#     print("Users that has been updated")
-#     print("Total: "+str(users.count()))
-#     for user in users:
-#         print("---------------------------------")
-#         print(user.username)
+@task(name='sweep_subscriptions', max_retries=3)
+def sweep_subscriptions():
+    """Expire the free trials and the plan subscriptions that ended.
 
+    Online users whose plan changed are told through their websocket.
+    """
+    started = time.monotonic()
+    now = timezone.now()
+    chunk_size = settings.SUBSCRIPTIONS_SWEEP_CHUNK_SIZE
+
+    expired_trials = User.objects.expire_free_trials(now, chunk_size=chunk_size)
+    cancelled_users = PlanSubscription.objects.cancel_ended(now, chunk_size=chunk_size)
+    without_plan = list(User.objects.filter(pk__in=cancelled_users).without_plan().values_list('pk', flat=True))
+    User.objects.filter(pk__in=without_plan).update(have_active_plan=False)
+
+    affected = set(expired_trials) | set(without_plan)
+    online = [user_id for user_id, is_online in presence.is_online(affected).items() if is_online]
+    with transaction.atomic():
+        users = User.objects.filter(pk__in=online).values('pk', 'is_free_trial', 'have_active_plan')
+        for user in users:
+            outbox.group_send("user-%s" % user['pk'], {
+                "type": "plan.updated",
+                "event": "PLAN_UPDATED",
+                "is_free_trial": user['is_free_trial'],
+                "have_active_plan": user['have_active_plan'],
+            })
+
+    metrics = {
+        'expired_trials': len(expired_trials),
+        'cancelled_subscription_users': len(cancelled_users),
+        'plans_deactivated': len(without_plan),
+        'notified': len(online),
+        'duration': round(time.monotonic() - started, 3),
+    }
+    logger.info('Subscriptions sweep: %s', metrics)
+    return metrics
 
-@task(name='send_have_messages_from_email', max_retries=3)
-def send_have_messages_from_email(sent_to, sent_by):
-    """Check if the free trial has ended and turn off"""
-
-    subject = 'New messages from @{}'.format(
-        sent_by.username)
 
+@task(name='send_messages_digests', max_retries=3)
+def send_messages_digests():
+    """Email the offline users whose digest is due the messages they have not read."""
     from_email = 'Freelanium <no-reply@freelanium.com>'
-    content = render_to_string(
-        'emails/users/new_messages.html',
-        {'user': sent_by}
-    )
-    msg = EmailMultiAlternatives(subject, content, from_email, [sent_to.email])
-    msg.attach_alternative(content, "text/html")
-    msg.send()
+    sent = 0
+    while True:
+        user_ids = digest.pop_due(time.time(), settings.MESSAGES_DIGEST_CHUNK_SIZE)
+        if not user_ids:
+            break
+        digests = digest.unread_chats(user_ids)
+        online = presence.is_online([user_digest['user_id'] for user_digest in digests])
+        for user_digest in digests:
+            if online.get(str(user_digest['user_id'])):
+                continue
+            if len(user_digest['chats']) == 1:
+                subject = 'New messages from @{}'.format(user_digest['chats'][0]['username'])
+            else:
+                subject = 'New messages from {} people'.format(len(user_digest['chats']))
+            content = render_to_string('emails/users/new_messages_digest.html', user_digest)
+            spool_mail(subject, content, from_email, [user_digest['email']])
+            sent += 1
+    logger.info('Sent %s messages digests', sent)
+    return sent
 
 
 @task(name='send_activity_notification', max_retries=3)
-def send_activity_notification(activity, type):
-    """send_activity_notification."""
-    print(type)
+def send_activity_notification(activity_id, type):
+    """Email the counterpart of an order about one of its activities."""
+    activity = Activity.objects.filter(pk=activity_id).first()
+    if not activity:
+        return
+    helpers.prefetch_activity_items([activity])
+    activity = activity.get_activity_item()
+    if not activity:
+        return
 
     def offer_accepted_email():
-        order = Order.objects.get(offer=activity.offer)
+        order = Order.objects.select_related('buyer', 'seller').get(offer=activity.offer)
         return render_to_string(
             'emails/users/order_offer.html',
             {'user': order.buyer, 'order': order.id}
-        ), order.seller, '@{} has accepted the offer '.format(
+        ), order.seller.email, '@{} has accepted the offer '.format(
             order.buyer.username)
 
     def order_delivery_email():
@@ -296,41 +324,172 @@ def send_activity_notification(activity, type):
     }
 
     get_email_data_function = switcher.get(type, None)
+    if not get_email_data_function:
+        return
 
     content, email, subject = get_email_data_function()
 
     if content and email and subject:
+        spool_mail(subject, content, from_email, [email])
 
-        msg = EmailMultiAlternatives(subject, content, from_email, [email])
-        msg.attach_alternative(content, "text/html")
-        msg.send()
+
+@task(name='send_spooled_mail', max_retries=3)
+def send_spooled_mail():
+    """Send the spooled email in batches over one connection each."""
+    return mail_spool.drain()
 
 
 @task(name='check_if_pending_clearance_has_ended', max_retries=3)
 def check_if_pending_clearance_has_ended():
-    """Check if pending clearance has ended."""
-    today = timezone.now()
+    """Make the earnings whose pending clearance has ended available for withdrawal."""
+    settled = Earning.objects.settle_due(timezone.now(), chunk_size=settings.SETTLEMENT_CHUNK_SIZE)
+    logger.info('Settled %s earnings', settled)
+    return settled
+
+
+@task(name='process_stripe_events', max_retries=3)
+def process_stripe_events(event_id=None):
+    """Process a stored Stripe event and the ones after it, or every pending event."""
+    if event_id:
+        return webhooks.process(event_id)
+    return webhooks.process_pending()
+
+
+@task(name='refresh_payment_methods', max_retries=3)
+def refresh_payment_methods(stripe_customer_id):
+    """Mirror the card payment methods of a Stripe customer."""
+    webhooks.set_api_key()
+    helpers.refresh_payment_methods(stripe, stripe_customer_id)
 
-    earnings = Earning.objects.filter(
-        type__in=[Earning.ORDER_REVENUE, Earning.REFUND],
-        available_for_withdrawn_date__lt=today, setted_to_available_for_withdrawn=False)
 
-    for earning in earnings:
-        print(earning.amount)
-        user = earning.user
-        if user:
-            pending_clearance_substracted = user.pending_clearance - earning.amount
-            available_for_withdrawn_add = earning.amount
-            if pending_clearance_substracted < Money(amount=0, currency="USD"):
-                available_for_withdrawn_add = earning.amount + pending_clearance_substracted
-                pending_clearance_substracted = 0
+@task(name='take_balance_snapshots', max_retries=3)
+def take_balance_snapshots():
+    """Fold the ledger entries of the users into new balance snapshots."""
+    until = timezone.now() - timedelta(seconds=settings.BALANCE_SNAPSHOT_LAG)
+    return BalanceSnapshot.objects.take(until)
 
-            user.pending_clearance = pending_clearance_substracted
 
-            user.available_for_withdrawal += available_for_withdrawn_add
+@task(name='update_exchange_rates', max_retries=3)
+def update_exchange_rates():
+    """Store the latest exchange rates and the missing dates queued by lookups."""
+    rate_date = exchange_rates.update_rates()
+    if settings.EXCHANGE_RATES_HTTP_FALLBACK:
+        exchange_rates.fetch_missing_rates()
+    return rate_date
 
-            user.save()
 
-            earning.setted_to_available_for_withdrawn = True
-            earning.save()
-            return available_for_withdrawn_add.amount
+def claim_message(message, notifications):
+    """Lock a message in the current transaction. Return False if its notifications exist.
+
+    The outbox delivers fan_out_message at least once, so a redelivered
+    message must not be notified nor counted twice.
+    """
+    Message.objects.select_for_update().get(pk=message.pk)
+    if notifications.exists():
+        logger.info('fan_out_message %s already done', message.pk)
+        return False
+    return True
+
+
+@task(name='fan_out_message', max_retries=3)
+def fan_out_message(message_id):
+    """Create the notifications of a new message and push them to the participants."""
+    started = time.monotonic()
+    message = Message.objects.select_related('chat', 'sent_by', 'activity').filter(pk=message_id).first()
+    if not message or not message.sent_by:
+        return
+
+    chat = message.chat
+    sent_by = message.sent_by
+    sent_to = chat.participants.exclude(pk=sent_by.pk).first()
+    if not sent_to:
+        return
+
+    event = {
+        "type": "new.activity",
+        "chat__pk": str(chat.pk),
+        "message__pk": str(message.pk),
+        "message__text": message.text,
+        "message__created": str(message.created),
+        "sent_by__pk": str(sent_by.pk),
+        "sent_by__username": sent_by.username,
+    }
+
+    if message.activity:
+        with transaction.atomic():
+            if not claim_message(message, Notification.objects.filter(activity=message.activity, chat=chat)):
+                return
+            notification = Notification.objects.create(
+                type=Notification.ACTIVITY,
+                activity=message.activity,
+                chat=chat,
+                actor=sent_by,
+            )
+            user_notification = NotificationUser.objects.create(
+                notification=notification,
+                user=sent_to
+            )
+            NotificationCounter.objects.increment(sent_to.pk, Notification.ACTIVITY)
+            outbox.group_send("user-%s" % sent_to.id, dict(
+                event,
+                event=message.activity.preview,
+                notification__pk=str(user_notification.pk),
+            ), key="fan_out_message:%s:%s" % (message.pk, sent_to.pk))
+            outbox.group_send("user-%s" % sent_by.id, dict(
+                event,
+                event=message.activity.preview,
+                notification__pk=str(notification.pk),
+            ), key="fan_out_message:%s:%s" % (message.pk, sent_by.pk))
+
+        if message.activity.status and not presence.is_user_online(sent_to.pk):
+            enqueue_on_commit(send_activity_notification, message.activity.pk, message.activity.preview)
+    else:
+        with transaction.atomic():
+            if not claim_message(message, Notification.objects.filter(messages=message)):
+                return
+            user_notification = NotificationUser.objects.filter(
+                user=sent_to,
+                is_read=False,
+                notification__type=Notification.MESSAGES,
+                notification__chat=chat,
+                notification__actor=sent_by,
+            ).select_related('notification').first()
+
+            if not user_notification:
+                # Emailed in the digest of sent_to if still unread once it is due
+                digest.schedule(sent_to.pk)
+                notification = Notification.objects.create(
+                    type=Notification.MESSAGES,
+                    chat=chat,
+                    actor=sent_by,
+                )
+
+                user_notification = NotificationUser.objects.create(
+                    notification=notification,
+                    user=sent_to
+                )
+                NotificationCounter.objects.increment(sent_to.pk, Notification.MESSAGES)
+
+            user_notification.notification.messages.add(message)
+            user_notification.notification.save()
+
+            # Send the event of message to user websocket
+            outbox.group_send("user-%s" % sent_to.id, dict(
+                event,
+                event="MESSAGE_RECEIVED",
+                notification__pk=str(user_notification.pk),
+            ), key="fan_out_message:%s:%s" % (message.pk, sent_to.pk))
+
+    logger.info('fan_out_message %s done in %.3fs', message_id, time.monotonic() - started)
+
+
+@task(name='flush_presence', max_retries=3)
+def flush_presence():
+    """Copy the users presence to User.is_online."""
+    return presence.flush()
+
+
+@task(name='relay_outbox', max_retries=3)
+def relay_outbox():
+    """Publish the pending outbox events."""
+    return outbox.relay()
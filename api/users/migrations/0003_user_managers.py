@@ -0,0 +1,20 @@
+# Generated by Django 3.0.3 on 2021-04-20 16:02
+
+import api.users.models.users
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_plansubscription_coupon'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', api.users.models.users.UserManager()),
+            ],
+        ),
+    ]
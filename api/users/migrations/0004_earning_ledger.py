@@ -0,0 +1,70 @@
+# Generated by Django 3.0.3 on 2021-04-26 10:14
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import djmoney.models.fields
+import uuid
+
+
+def snapshot_current_balances(apps, schema_editor):
+    """Start the ledger of every user from the balances stored on User."""
+    User = apps.get_model('users', 'User')
+    BalanceSnapshot = apps.get_model('users', 'BalanceSnapshot')
+    taken_until = django.utils.timezone.now()
+    fields = ['net_income', 'pending_clearance', 'available_for_withdrawal', 'withdrawn']
+    snapshots = (
+        BalanceSnapshot(user_id=row['id'], taken_until=taken_until, **{field: row[field] for field in fields})
+        for row in User.objects.values('id', *fields).iterator()
+    )
+    BalanceSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0003_user_managers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='earning',
+            name='type',
+            field=models.CharField(choices=[('OR', 'Order revenue'), ('WI', 'Withdrawn'), ('RE', 'Refund'), ('SP', 'Spent'), ('CL', 'Cleared')], default='OR', max_length=2),
+        ),
+        migrations.AddIndex(
+            model_name='earning',
+            index=models.Index(fields=['user', 'created'], name='users_earning_user_created_idx'),
+        ),
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Date time on which the object was created.', verbose_name='created at')),
+                ('modified', models.DateTimeField(auto_now=True, help_text='Date time on which the object was last modified.', verbose_name='modified at')),
+                ('taken_until', models.DateTimeField()),
+                ('net_income_currency', djmoney.models.fields.CurrencyField(choices=[('EUR', 'Euro'), ('USD', 'US Dollar')], default='USD', editable=False, max_length=3)),
+                ('net_income', djmoney.models.fields.MoneyField(decimal_places=2, default=Decimal('0'), default_currency='USD', max_digits=14)),
+                ('withdrawn_currency', djmoney.models.fields.CurrencyField(choices=[('EUR', 'Euro'), ('USD', 'US Dollar')], default='USD', editable=False, max_length=3)),
+                ('withdrawn', djmoney.models.fields.MoneyField(decimal_places=2, default=Decimal('0'), default_currency='USD', max_digits=14)),
+                ('available_for_withdrawal_currency', djmoney.models.fields.CurrencyField(choices=[('EUR', 'Euro'), ('USD', 'US Dollar')], default='USD', editable=False, max_length=3)),
+                ('available_for_withdrawal', djmoney.models.fields.MoneyField(decimal_places=2, default=Decimal('0'), default_currency='USD', max_digits=14)),
+                ('pending_clearance_currency', djmoney.models.fields.CurrencyField(choices=[('EUR', 'Euro'), ('USD', 'US Dollar')], default='USD', editable=False, max_length=3)),
+                ('pending_clearance', djmoney.models.fields.MoneyField(decimal_places=2, default=Decimal('0'), default_currency='USD', max_digits=14)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created', '-modified'],
+                'get_latest_by': 'created',
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='balancesnapshot',
+            index=models.Index(fields=['user', '-taken_until'], name='users_balance_user_taken_idx'),
+        ),
+        migrations.RunPython(snapshot_current_balances, migrations.RunPython.noop),
+    ]
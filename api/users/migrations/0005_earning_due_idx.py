@@ -0,0 +1,17 @@
+# Generated by Django 3.0.3 on 2021-04-27 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_earning_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='earning',
+            index=models.Index(condition=models.Q(setted_to_available_for_withdrawn=False, type__in=['OR', 'RE']), fields=['available_for_withdrawn_date', 'id'], name='users_earning_due_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.0.3 on 2021-04-28 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_earning_due_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(is_free_trial=True), fields=['free_trial_expiration'], name='users_user_free_trial_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plansubscription',
+            index=models.Index(condition=models.Q(cancelled=False, to_be_cancelled=True), fields=['current_period_end'], name='users_plansub_to_cancel_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.0.3 on 2021-04-30 10:14
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_subscription_sweep_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Date time on which the object was created.', verbose_name='created at')),
+                ('modified', models.DateTimeField(auto_now=True, help_text='Date time on which the object was last modified.', verbose_name='modified at')),
+                ('event_id', models.CharField(max_length=100, unique=True)),
+                ('type', models.CharField(max_length=100)),
+                ('subscription_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('stripe_created', models.PositiveIntegerField(default=0)),
+                ('payload', models.TextField()),
+                ('status', models.CharField(choices=[('PE', 'Pending'), ('PR', 'Processed'), ('FA', 'Failed'), ('IG', 'Ignored')], default='PE', max_length=2)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created', '-modified'],
+                'get_latest_by': 'created',
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(condition=models.Q(status='PE'), fields=['subscription_id', 'stripe_created'], name='users_stripeevent_pending_idx'),
+        ),
+    ]
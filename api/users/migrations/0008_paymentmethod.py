@@ -0,0 +1,35 @@
+# Generated by Django 3.0.3 on 2021-05-03 09:41
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_stripeevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentMethod',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Date time on which the object was created.', verbose_name='created at')),
+                ('modified', models.DateTimeField(auto_now=True, help_text='Date time on which the object was last modified.', verbose_name='modified at')),
+                ('stripe_customer_id', models.CharField(max_length=100)),
+                ('payment_method_id', models.CharField(max_length=100, unique=True)),
+                ('stripe_created', models.PositiveIntegerField(default=0)),
+                ('payload', models.TextField()),
+            ],
+            options={
+                'ordering': ['-created', '-modified'],
+                'get_latest_by': 'created',
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='paymentmethod',
+            index=models.Index(fields=['stripe_customer_id', '-stripe_created'], name='users_paymentmethod_cust_idx'),
+        ),
+    ]
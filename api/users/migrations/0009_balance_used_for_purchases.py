@@ -0,0 +1,45 @@
+# Generated by Django 3.0.3 on 2021-05-04 11:20
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.utils.timezone
+import djmoney.models.fields
+
+
+def snapshot_current_balances(apps, schema_editor):
+    """Start the ledger again from the balances stored on User, used_for_purchases included."""
+    User = apps.get_model('users', 'User')
+    BalanceSnapshot = apps.get_model('users', 'BalanceSnapshot')
+    taken_until = django.utils.timezone.now()
+    fields = ['net_income', 'pending_clearance', 'available_for_withdrawal', 'used_for_purchases', 'withdrawn']
+    snapshots = (
+        BalanceSnapshot(user_id=row['id'], taken_until=taken_until, **{field: row[field] for field in fields})
+        for row in User.objects.values('id', *fields).iterator()
+    )
+    BalanceSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_paymentmethod'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='earning',
+            name='type',
+            field=models.CharField(choices=[('OR', 'Order revenue'), ('WI', 'Withdrawn'), ('RE', 'Refund'), ('SP', 'Spent'), ('CL', 'Cleared'), ('CR', 'Credits returned')], default='OR', max_length=2),
+        ),
+        migrations.AddField(
+            model_name='balancesnapshot',
+            name='used_for_purchases_currency',
+            field=djmoney.models.fields.CurrencyField(choices=[('EUR', 'Euro'), ('USD', 'US Dollar')], default='USD', editable=False, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='balancesnapshot',
+            name='used_for_purchases',
+            field=djmoney.models.fields.MoneyField(decimal_places=2, default=Decimal('0'), default_currency='USD', max_digits=14),
+        ),
+        migrations.RunPython(snapshot_current_balances, migrations.RunPython.noop),
+    ]
@@ -2,5 +2,8 @@ from .users import User
 from .users_login_activity import UserLoginActivity
 from .contacts import Contact
 from .plan_subscriptions import PlanSubscription
-from .earnings import Earning
+from .earnings import Earning, InsufficientFunds
+from .balance_snapshots import BalanceSnapshot
 from .plan_payments import PlanPayment
+from .stripe_events import StripeEvent
+from .payment_methods import PaymentMethod
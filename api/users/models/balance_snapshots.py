@@ -0,0 +1,78 @@
+from api.utils.models import CModel
+from django.db import models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+# Models
+from djmoney.models.fields import MoneyField
+from djmoney.money import Money
+
+# Utils
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from django.utils import timezone
+
+
+class BalanceSnapshotManager(models.Manager):
+
+    def take(self, until):
+        """Snapshot the balances of the users with ledger entries since their last snapshot.
+
+        Entries created before until are folded into the new snapshots in a
+        single grouped query. Return the number of snapshots taken.
+        """
+        from .earnings import Earning, to_amount
+
+        last_taken = self.filter(user=OuterRef('user')).order_by('-taken_until').values('taken_until')[:1]
+        epoch = timezone.make_aware(datetime(2000, 1, 1))
+        tail = Earning.objects.annotate(
+            since=Coalesce(Subquery(last_taken), Value(epoch))
+        ).filter(
+            created__gte=models.F('since'),
+            created__lt=until
+        ).order_by().values_list('user_id', 'type').annotate(total=Sum('amount'))
+
+        deltas = defaultdict(lambda: defaultdict(Decimal))
+        for user_id, type, total in tail:
+            for field, sign in Earning.DELTAS.get(type, {}).items():
+                if field in self.model.FIELDS:
+                    deltas[user_id][field] += sign * to_amount(total)
+        if not deltas:
+            return 0
+
+        previous = {
+            snapshot.user_id: snapshot
+            for snapshot in self.filter(user_id__in=deltas, taken_until=Subquery(last_taken))
+        }
+        snapshots = []
+        for user_id, changes in deltas.items():
+            snapshot = self.model(user_id=user_id, taken_until=until)
+            for field in self.model.FIELDS:
+                amount = to_amount(getattr(previous[user_id], field)) if user_id in previous else Decimal(0)
+                setattr(snapshot, field, Money(amount + changes[field], 'USD'))
+            snapshots.append(snapshot)
+        self.bulk_create(snapshots, batch_size=1000)
+        return len(snapshots)
+
+
+class BalanceSnapshot(CModel):
+    """Balances of a user folding every ledger entry created before taken_until."""
+
+    FIELDS = ('net_income', 'pending_clearance', 'available_for_withdrawal', 'used_for_purchases', 'withdrawn')
+
+    user = models.ForeignKey("users.User", on_delete=models.CASCADE, related_name="balance_snapshots")
+    taken_until = models.DateTimeField()
+
+    net_income = MoneyField(max_digits=14, decimal_places=2, default_currency='USD', default=0)
+    withdrawn = MoneyField(max_digits=14, decimal_places=2, default_currency='USD', default=0)
+    used_for_purchases = MoneyField(max_digits=14, decimal_places=2, default_currency='USD', default=0)
+    available_for_withdrawal = MoneyField(max_digits=14, decimal_places=2, default_currency='USD', default=0)
+    pending_clearance = MoneyField(max_digits=14, decimal_places=2, default_currency='USD', default=0)
+
+    objects = BalanceSnapshotManager()
+
+    class Meta(CModel.Meta):
+        indexes = [
+            models.Index(fields=['user', '-taken_until'], name='users_balance_user_taken_idx'),
+        ]
@@ -1,13 +1,195 @@
 from api.utils.models import CModel
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q, Sum
 
 # Models
 from api.plans.models import Plan
 from djmoney.models.fields import MoneyField
+from djmoney.money import Money
 
 # Utils
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
 from django.utils import timezone
 
+from .users import User
+
+CLEARANCE_DAYS = 14
+
+
+def to_amount(value):
+    """Return the USD decimal amount of a Money or a number."""
+    if isinstance(value, Money):
+        return value.amount
+    return Decimal(str(value or 0))
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+class EarningManager(models.Manager):
+    """Append-only ledger of the balances of the users.
+
+    Every entry moves the balance fields of its user by its amount as given in
+    Earning.DELTAS, with F() expression updates in the same transaction as
+    the entry, so concurrent checkouts and withdrawals never overwrite each
+    other. Only the row of the user is locked, and only when the amount moved
+    depends on the current balance.
+    """
+
+    def record(self, user, type, amount, **kwargs):
+        user_id = getattr(user, 'pk', user)
+        amount = to_amount(amount)
+        with transaction.atomic():
+            entry = self.create(user_id=user_id, type=type, amount=Money(amount, 'USD'), **kwargs)
+            User.objects.filter(pk=user_id).update(**{
+                field: F(field) + sign * amount for field, sign in self.model.DELTAS[type].items()
+            })
+        return entry
+
+    def credit(self, user, amount, type=None):
+        """Add an order revenue or a refund, pending clearance for CLEARANCE_DAYS."""
+        return self.record(
+            user,
+            type or self.model.ORDER_REVENUE,
+            amount,
+            available_for_withdrawn_date=timezone.now() + timedelta(days=CLEARANCE_DAYS)
+        )
+
+    def refund(self, user, amount, used_credits=None):
+        """Give back an order as credits, and the credits used to pay it."""
+        with transaction.atomic():
+            entry = self.credit(user, amount, type=self.model.REFUND)
+            if to_amount(used_credits):
+                self.record(user, self.model.CREDITS_RETURNED, used_credits)
+        return entry
+
+    def spend(self, user, amount):
+        """Pay with the credits of a user, the ones pending clearance first.
+
+        The credits taken from pending clearance are cleared right away, so
+        every entry moves a fixed set of balances.
+        """
+        with transaction.atomic():
+            pending_clearance, available_for_withdrawal = User.objects.select_for_update().filter(
+                pk=user.pk
+            ).values_list('pending_clearance', 'available_for_withdrawal').get()
+            pending_clearance = max(to_amount(pending_clearance), 0)
+            available_for_withdrawal = max(to_amount(available_for_withdrawal), 0)
+            amount = min(to_amount(amount), pending_clearance + available_for_withdrawal)
+            if amount <= 0:
+                return None
+            from_pending_clearance = min(amount, pending_clearance)
+            if from_pending_clearance:
+                self.record(user, self.model.CLEARED, from_pending_clearance)
+            return self.record(user, self.model.SPENT, amount)
+
+    def clear(self, earning):
+        """Make an earning available for withdrawal once its clearance ended."""
+        with transaction.atomic():
+            if not self.filter(pk=earning.pk, setted_to_available_for_withdrawn=False).update(
+                setted_to_available_for_withdrawn=True
+            ):
+                # Already cleared by another worker
+                return None
+            pending_clearance = User.objects.select_for_update().filter(
+                pk=earning.user_id
+            ).values_list('pending_clearance', flat=True).get()
+            # Spent credits were cleared early, only what is left is moved
+            amount = min(to_amount(earning.amount), to_amount(pending_clearance))
+            if amount <= 0:
+                return None
+            return self.record(earning.user_id, self.model.CLEARED, amount)
+
+    def due(self, now):
+        """Return the earnings whose pending clearance has ended."""
+        return self.filter(
+            type__in=self.model.CLEARABLE_TYPES,
+            setted_to_available_for_withdrawn=False,
+            available_for_withdrawn_date__lt=now
+        )
+
+    def settle_due(self, now, chunk_size=1000):
+        """Clear every due earning, chunk by chunk. Return the number of earnings settled.
+
+        Chunks are read in (available_for_withdrawn_date, id) order from the
+        last key seen. Each one is settled in its own transaction with one
+        CLEARED entry and one balance update per user, and its earnings are
+        marked in bulk, so an interrupted run is simply resumed by the next.
+        """
+        settled = 0
+        last = None
+        while True:
+            with transaction.atomic():
+                chunk = self.due(now)
+                if last:
+                    chunk = chunk.filter(
+                        Q(available_for_withdrawn_date__gt=last[0]) |
+                        Q(available_for_withdrawn_date=last[0], pk__gt=last[1])
+                    )
+                rows = list(
+                    chunk.select_for_update(skip_locked=True).order_by(
+                        'available_for_withdrawn_date', 'pk'
+                    ).values_list('available_for_withdrawn_date', 'pk', 'user_id', 'amount')[:chunk_size]
+                )
+                if not rows:
+                    return settled
+                last = rows[-1][:2]
+
+                amounts = defaultdict(Decimal)
+                for _, _, user_id, amount in rows:
+                    amounts[user_id] += to_amount(amount)
+                pending = dict(
+                    User.objects.select_for_update().filter(
+                        pk__in=amounts
+                    ).order_by('pk').values_list('pk', 'pending_clearance')
+                )
+
+                cleared = []
+                for user_id, amount in amounts.items():
+                    # Spent credits were cleared early, only what is left is moved
+                    amount = min(amount, to_amount(pending.get(user_id)))
+                    if amount <= 0:
+                        continue
+                    cleared.append(self.model(user_id=user_id, type=self.model.CLEARED, amount=Money(amount, 'USD')))
+                    User.objects.filter(pk=user_id).update(**{
+                        field: F(field) + sign * amount
+                        for field, sign in self.model.DELTAS[self.model.CLEARED].items()
+                    })
+                self.bulk_create(cleared)
+                self.filter(pk__in=[row[1] for row in rows]).update(setted_to_available_for_withdrawn=True)
+                settled += len(rows)
+
+    def withdraw(self, user, amount, **kwargs):
+        """Take an amount from the available balance, InsufficientFunds if it is greater."""
+        amount = to_amount(amount)
+        with transaction.atomic():
+            withdrawn = User.objects.filter(pk=user.pk, available_for_withdrawal__gte=amount).update(**{
+                field: F(field) + sign * amount for field, sign in self.model.DELTAS[self.model.WITHDRAWN].items()
+            })
+            if not withdrawn:
+                raise InsufficientFunds()
+            return self.create(user=user, type=self.model.WITHDRAWN, amount=Money(amount, 'USD'), **kwargs)
+
+    def balance(self, user):
+        """Return the balances of a user as its last snapshot plus the entries after it."""
+        from .balance_snapshots import BalanceSnapshot
+
+        snapshot = BalanceSnapshot.objects.filter(user=user).order_by('-taken_until').first()
+        entries = self.filter(user=user)
+        if snapshot:
+            balance = {field: to_amount(getattr(snapshot, field)) for field in BalanceSnapshot.FIELDS}
+            entries = entries.filter(created__gte=snapshot.taken_until)
+        else:
+            balance = {field: Decimal(0) for field in BalanceSnapshot.FIELDS}
+        for type, total in entries.order_by().values_list('type').annotate(total=Sum('amount')):
+            for field, sign in self.model.DELTAS.get(type, {}).items():
+                if field in balance:
+                    balance[field] += sign * to_amount(total)
+        return {field: Money(amount, 'USD') for field, amount in balance.items()}
+
 
 class Earning(CModel):
 
@@ -17,13 +199,33 @@ class Earning(CModel):
     WITHDRAWN = 'WI'
     REFUND = 'RE'
     SPENT = 'SP'
+    CLEARED = 'CL'
+    CREDITS_RETURNED = 'CR'
     EARNING_TYPES = [
         (ORDER_REVENUE, 'Order revenue'),
         (WITHDRAWN, 'Withdrawn'),
         (REFUND, 'Refund'),
         (SPENT, 'Spent'),
+        (CLEARED, 'Cleared'),
+        (CREDITS_RETURNED, 'Credits returned'),
     ]
 
+    # Entries that are pending clearance until available_for_withdrawn_date
+    CLEARABLE_TYPES = (ORDER_REVENUE, REFUND)
+
+    # Balance fields of User moved by each entry type
+    DELTAS = {
+        ORDER_REVENUE: {'net_income': 1, 'pending_clearance': 1},
+        REFUND: {'net_income': 1, 'pending_clearance': 1},
+        CLEARED: {'pending_clearance': -1, 'available_for_withdrawal': 1},
+        SPENT: {'available_for_withdrawal': -1, 'used_for_purchases': 1},
+        WITHDRAWN: {'available_for_withdrawal': -1, 'withdrawn': 1},
+        CREDITS_RETURNED: {'used_for_purchases': -1},
+    }
+
+    # Entries that only move money between the balances of a user
+    INTERNAL_TYPES = (CLEARED, CREDITS_RETURNED)
+
     type = models.CharField(
         max_length=2,
         choices=EARNING_TYPES,
@@ -41,3 +243,15 @@ class Earning(CModel):
     )
 
     setted_to_available_for_withdrawn = models.BooleanField(default=False)
+
+    objects = EarningManager()
+
+    class Meta(CModel.Meta):
+        indexes = [
+            models.Index(fields=['user', 'created'], name='users_earning_user_created_idx'),
+            models.Index(
+                fields=['available_for_withdrawn_date', 'id'],
+                name='users_earning_due_idx',
+                condition=Q(setted_to_available_for_withdrawn=False, type__in=['OR', 'RE'])
+            ),
+        ]
@@ -0,0 +1,47 @@
+from api.utils.models import CModel
+from django.db import models, transaction
+
+# Utils
+import json
+
+
+class PaymentMethodManager(models.Manager):
+
+    def store(self, payment_method):
+        """Mirror a Stripe payment method, or drop it once it is detached."""
+        if not payment_method.get('customer'):
+            self.filter(payment_method_id=payment_method['id']).delete()
+            return None
+        mirrored, _ = self.update_or_create(payment_method_id=payment_method['id'], defaults={
+            'stripe_customer_id': payment_method['customer'],
+            'stripe_created': payment_method.get('created') or 0,
+            'payload': json.dumps(payment_method),
+        })
+        return mirrored
+
+    def sync(self, stripe_customer_id, payment_methods):
+        """Replace the mirror of a customer with its payment methods listed in Stripe."""
+        with transaction.atomic():
+            self.filter(stripe_customer_id=stripe_customer_id).exclude(
+                payment_method_id__in=[payment_method['id'] for payment_method in payment_methods]
+            ).delete()
+            for payment_method in payment_methods:
+                self.store(payment_method)
+
+
+class PaymentMethod(CModel):
+    """Local copy of a card payment method of a Stripe customer."""
+
+    stripe_customer_id = models.CharField(max_length=100)
+    payment_method_id = models.CharField(max_length=100, unique=True)
+    # Creation timestamp of the payment method in Stripe
+    stripe_created = models.PositiveIntegerField(default=0)
+    # The Stripe PaymentMethod object as returned by its API
+    payload = models.TextField()
+
+    objects = PaymentMethodManager()
+
+    class Meta(CModel.Meta):
+        indexes = [
+            models.Index(fields=['stripe_customer_id', '-stripe_created'], name='users_paymentmethod_cust_idx'),
+        ]
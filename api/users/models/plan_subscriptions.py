@@ -1,10 +1,33 @@
 from api.utils.models import CModel
 from django.db import models
+from django.db.models import Q
 
 # Models
 from api.plans.models import Plan
 
 
+class PlanSubscriptionQuerySet(models.QuerySet):
+
+    def cancel_ended(self, now, chunk_size=1000):
+        """Cancel the subscriptions set to be cancelled whose period ended before now.
+
+        Return the ids of their users.
+        """
+        timestamp = int(now.timestamp())
+        user_ids = set()
+        while True:
+            chunk = list(self.filter(
+                to_be_cancelled=True,
+                cancelled=False,
+                current_period_end__gt=0,
+                current_period_end__lt=timestamp
+            ).order_by('current_period_end').values_list('pk', 'user_id')[:chunk_size])
+            if not chunk:
+                return user_ids
+            self.filter(pk__in=[pk for pk, _ in chunk]).update(cancelled=True, to_be_cancelled=False)
+            user_ids.update(user_id for _, user_id in chunk)
+
+
 class PlanSubscription(CModel):
     # Login Status
 
@@ -23,3 +46,14 @@ class PlanSubscription(CModel):
     plan_unit_amount = models.FloatField(null=True, blank=True)
     plan_currency = models.CharField(max_length=3, blank=True, null=True)
     plan_price_label = models.CharField(max_length=100, blank=True, null=True)
+
+    objects = PlanSubscriptionQuerySet.as_manager()
+
+    class Meta(CModel.Meta):
+        indexes = [
+            models.Index(
+                fields=['current_period_end'],
+                name='users_plansub_to_cancel_idx',
+                condition=Q(to_be_cancelled=True, cancelled=False)
+            ),
+        ]
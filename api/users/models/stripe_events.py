@@ -0,0 +1,66 @@
+from api.utils.models import CModel
+from django.db import models
+
+# Utils
+import json
+
+
+class StripeEventManager(models.Manager):
+
+    def receive(self, payload, handled_types=()):
+        """Store a raw webhook payload once per Stripe event id.
+
+        Events of a type without a handler are stored as ignored.
+        Return (event, created).
+        """
+        data = json.loads(payload)
+        data_object = data['data']['object']
+        if data_object.get('object') == 'subscription':
+            subscription_id = data_object.get('id')
+        else:
+            subscription_id = data_object.get('subscription')
+        return self.get_or_create(event_id=data['id'], defaults={
+            'type': data['type'],
+            'subscription_id': subscription_id,
+            'stripe_created': data.get('created') or 0,
+            'payload': payload.decode() if isinstance(payload, bytes) else payload,
+            'status': self.model.PENDING if data['type'] in handled_types else self.model.IGNORED,
+        })
+
+
+class StripeEvent(CModel):
+    """Raw Stripe webhook event, processed in order with the other events of its subscription."""
+
+    PENDING = 'PE'
+    PROCESSED = 'PR'
+    FAILED = 'FA'
+    IGNORED = 'IG'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSED, 'Processed'),
+        (FAILED, 'Failed'),
+        (IGNORED, 'Ignored'),
+    ]
+
+    event_id = models.CharField(max_length=100, unique=True)
+    type = models.CharField(max_length=100)
+    subscription_id = models.CharField(max_length=100, blank=True, null=True)
+    # Creation timestamp of the event in Stripe
+    stripe_created = models.PositiveIntegerField(default=0)
+    payload = models.TextField()
+
+    status = models.CharField(max_length=2, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    objects = StripeEventManager()
+
+    class Meta(CModel.Meta):
+        indexes = [
+            models.Index(
+                fields=['subscription_id', 'stripe_created'],
+                name='users_stripeevent_pending_idx',
+                condition=models.Q(status='PE')
+            ),
+        ]
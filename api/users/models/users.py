@@ -3,8 +3,10 @@
 # Django
 from django.db.models.fields.related import ManyToManyField
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.db.models import Exists, OuterRef, Prefetch, Q, Subquery, Sum
+from django.contrib.auth.models import AbstractUser, UserManager as AuthUserManager
 from django.core.validators import RegexValidator
+from django.utils import timezone
 
 # Models
 from djmoney.models.fields import MoneyField
@@ -13,6 +15,75 @@ from djmoney.models.fields import MoneyField
 from api.utils.models import CModel
 
 
+class UserQuerySet(models.QuerySet):
+
+    def with_profile_annotations(self):
+        """Load the derived fields of UserModelSerializer with the users.
+
+        Adds earned_this_month, the active_plan_subscriptions prefetch and
+        joins the notification counter, so serializing a page of users does
+        not run queries per user.
+        """
+        from api.users.models import Earning, PlanSubscription
+
+        today = timezone.now()
+        earned_this_month = Earning.objects.filter(
+            user=OuterRef("pk"),
+            created__month=today.month,
+            type=Earning.ORDER_REVENUE
+        ).order_by().values("user").annotate(total=Sum("amount")).values("total")
+        return self.select_related("notification_counter").annotate(
+            earned_this_month=Subquery(
+                earned_this_month,
+                output_field=models.DecimalField(max_digits=14, decimal_places=2)
+            )
+        ).prefetch_related(Prefetch(
+            "plansubscription_set",
+            queryset=PlanSubscription.objects.filter(cancelled=False),
+            to_attr="active_plan_subscriptions"
+        ))
+
+
+    def expire_free_trials(self, now, chunk_size=1000):
+        """Turn off the free trials that ended before now, chunk by chunk.
+
+        Users keep an active plan only if their subscription is paid or
+        still in its Stripe trial, which is charged when it ends. Return the
+        ids of the users updated.
+        """
+        from api.users.models import PlanSubscription
+
+        paid_plan = PlanSubscription.objects.filter(
+            user=OuterRef('pk'), cancelled=False, status__in=['active', 'trialing']
+        )
+        expired = []
+        while True:
+            chunk = list(self.filter(
+                is_free_trial=True,
+                free_trial_expiration__lt=now
+            ).order_by('free_trial_expiration').values_list('pk', flat=True)[:chunk_size])
+            if not chunk:
+                return expired
+            self.filter(pk__in=chunk).update(
+                is_free_trial=False,
+                passed_free_trial_once=True,
+                have_active_plan=Exists(paid_plan)
+            )
+            expired.extend(chunk)
+
+    def without_plan(self):
+        """Return the users flagged with an active plan that have no subscription left."""
+        from api.users.models import PlanSubscription
+
+        return self.filter(have_active_plan=True, is_free_trial=False).annotate(
+            has_subscription=Exists(PlanSubscription.objects.filter(user=OuterRef('pk'), cancelled=False))
+        ).filter(has_subscription=False)
+
+
+class UserManager(AuthUserManager.from_queryset(UserQuerySet)):
+    pass
+
+
 class User(CModel, AbstractUser):
     """User model.
     Extend from Django's Abstract User, change the username field
@@ -150,17 +221,35 @@ class User(CModel, AbstractUser):
 
     is_online = models.BooleanField(default=False)
 
+    objects = UserManager()
+
+    class Meta(CModel.Meta):
+        indexes = [
+            models.Index(
+                fields=['free_trial_expiration'],
+                name='users_user_free_trial_idx',
+                condition=Q(is_free_trial=True)
+            ),
+        ]
+
     def __str__(self):
         """Return username."""
         return '{} {}'.format(self.first_name, self.last_name)
 
     def save(self, **kwargs):
+        profile_changed = False
         try:
             this = User.objects.get(id=self.id)
             # import pdb
             # pdb.set_trace()
+            profile_changed = this.username != self.username or this.picture != self.picture
             if this.picture != self.picture:
                 this.picture.delete(save=False)
         except:
             pass
         super(User, self).save(**kwargs)
+
+        if profile_changed:
+            # Keep the chat list projection of the other participants in sync
+            from api.chats.models import InboxEntry
+            InboxEntry.objects.update_counterpart(self)
@@ -10,16 +10,17 @@ from django.core.validators import RegexValidator
 from django.shortcuts import get_object_or_404
 
 # Serializers
-from api.users.serializers import UserModelSerializer
+from api.users.serializers import UserModelSerializer, UserSummarySerializer
+from api.utils.serializers.dynamic_fields import DynamicFieldsMixin
 
 # Models
 from api.users.models import Contact, User
 
 
-class ContactModelSerializer(serializers.ModelSerializer):
+class ContactModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """User model serializer."""
 
-    contact_user = UserModelSerializer(read_only=True)
+    contact_user = UserSummarySerializer(read_only=True)
 
     class Meta:
         """Meta class."""
@@ -29,6 +30,9 @@ class ContactModelSerializer(serializers.ModelSerializer):
             "id",
             "contact_user",
         )
+        expandable_fields = {
+            "contact_user": UserModelSerializer,
+        }
 
         read_only_fields = ("id",)
 
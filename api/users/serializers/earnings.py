@@ -6,14 +6,16 @@ from rest_framework import serializers
 
 # Django
 from django.conf import settings
+from django.db import transaction
 from django.contrib.auth import password_validation, authenticate
 from django.core.validators import RegexValidator
 from django.shortcuts import get_object_or_404
 from django.db.models import Sum
 
 # Models
-from api.users.models import Earning, User
+from api.users.models import Earning, User, InsufficientFunds
 from djmoney.models.fields import Money
+from djmoney.contrib.django_rest_framework import MoneyField
 
 # Utils
 
@@ -49,6 +51,16 @@ class EarningModelSerializer(serializers.ModelSerializer):
         read_only_fields = ("id",)
 
 
+class BalanceSerializer(serializers.Serializer):
+    """Balances of a user, as given by Earning.objects.balance()."""
+
+    net_income = MoneyField(max_digits=14, decimal_places=2, read_only=True)
+    pending_clearance = MoneyField(max_digits=14, decimal_places=2, read_only=True)
+    available_for_withdrawal = MoneyField(max_digits=14, decimal_places=2, read_only=True)
+    used_for_purchases = MoneyField(max_digits=14, decimal_places=2, read_only=True)
+    withdrawn = MoneyField(max_digits=14, decimal_places=2, read_only=True)
+
+
 class WithdrawFundsModelSerializer(serializers.ModelSerializer):
     """User model serializer."""
 
@@ -77,7 +89,7 @@ class WithdrawFundsModelSerializer(serializers.ModelSerializer):
         request = self.context['request']
         user = request.user
 
-        if amount > user.available_for_withdrawal:
+        if amount > Earning.objects.balance(user)['available_for_withdrawal']:
             raise serializers.ValidationError('The amount is greater than your budget')
         if amount > Money(amount=5000, currency="USD"):
             raise serializers.ValidationError('The amount is too large')
@@ -86,11 +98,19 @@ class WithdrawFundsModelSerializer(serializers.ModelSerializer):
 
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         amount = Money(amount=validated_data['amount'], currency="USD")
         request = self.context['request']
         user = request.user
 
+        # Take the funds before the payout so concurrent withdrawals can't
+        # overdraw the balance, a failed payout rolls it back
+        try:
+            withdrawn = Earning.objects.withdraw(user, amount)
+        except InsufficientFunds:
+            raise serializers.ValidationError('The amount is greater than your budget')
+
         # transfer = stripe.Transfer.create(
         #     amount=int(converted_unit_amount * 100),
         #     currency=user.currency,
@@ -191,15 +211,7 @@ class WithdrawFundsModelSerializer(serializers.ModelSerializer):
                 print(ioe)
             raise serializers.ValidationError('Withdraw error')
 
-        withdrawn = Earning.objects.create(
-            type=Earning.WITHDRAWN,
-            amount=amount,
-            batch_id=batch_id,
-            user=user
-        )
-
-        user.available_for_withdrawal -= amount
-        user.withdrawn += amount
-        user.save()
+        withdrawn.batch_id = batch_id
+        withdrawn.save(update_fields=['batch_id', 'modified'])
 
         return withdrawn
@@ -14,8 +14,8 @@ from rest_framework.authtoken.models import Token
 from rest_framework.validators import UniqueValidator
 
 # Models
-from api.users.models import User, UserLoginActivity, PlanSubscription, Earning
-from api.notifications.models import Notification
+from api.users.models import User, UserLoginActivity, PlanSubscription, Earning, PaymentMethod
+from api.notifications.models import NotificationCounter
 from api.plans.models import Plan
 from api.activities.models import Activity
 from djmoney.models.fields import Money
@@ -29,7 +29,8 @@ from api.taskapp.tasks import (
     send_confirmation_email,
     send_change_email_email,
     send_reset_password_email,
-    send_invitation_email
+    send_invitation_email,
+    enqueue_on_commit
 )
 
 
@@ -47,10 +48,29 @@ import environ
 env = environ.Env()
 
 
+class UserSummarySerializer(serializers.ModelSerializer):
+    """Compact user embed."""
+
+    class Meta:
+        """Meta class."""
+
+        model = User
+        fields = (
+            'id',
+            'username',
+            'first_name',
+            'last_name',
+            'picture',
+        )
+
+        read_only_fields = fields
+
+
 class UserModelSerializer(serializers.ModelSerializer):
     """User model serializer."""
     pending_notifications = serializers.SerializerMethodField(read_only=True)
     pending_messages = serializers.SerializerMethodField(read_only=True)
+    notification_counters = serializers.SerializerMethodField(read_only=True)
     current_plan_subscription = serializers.SerializerMethodField(read_only=True)
     earned_this_month = serializers.SerializerMethodField(read_only=True)
 
@@ -87,6 +107,7 @@ class UserModelSerializer(serializers.ModelSerializer):
             'pending_clearance',
             'pending_messages',
             'pending_notifications',
+            'notification_counters',
             'default_payment_method',
             'plan_default_payment_method',
             'current_plan_subscription',
@@ -95,26 +116,60 @@ class UserModelSerializer(serializers.ModelSerializer):
 
         read_only_fields = (
             'id',
+            # Moved by the Earning ledger only
+            'net_income',
+            'withdrawn',
+            'used_for_purchases',
+            'available_for_withdrawal',
+            'pending_clearance',
         )
 
-    def get_pending_notifications(self, obj):
+    def update(self, instance, validated_data):
+        """Save only the given fields, never the balances read with the user."""
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=list(validated_data) + ['modified'])
+        return instance
 
-        return obj.notifications.through.objects.filter(user=obj, is_read=False).exists()
+    def _notification_counter(self, obj):
+        # The reverse one to one is cached in the instance, missing included
+        try:
+            return obj.notification_counter
+        except NotificationCounter.DoesNotExist:
+            return None
+
+    def get_pending_notifications(self, obj):
+        counter = self._notification_counter(obj)
+        return bool(counter and counter.total)
 
     def get_pending_messages(self, obj):
-        return obj.notifications.through.objects.filter(
-            user=obj, is_read=False, notification__type__in=[Notification.MESSAGES, Notification.ACTIVITY]).exists()
+        counter = self._notification_counter(obj)
+        return bool(counter and (counter.messages or counter.activity))
+
+    def get_notification_counters(self, obj):
+        counter = self._notification_counter(obj)
+        return {
+            "messages": counter.messages if counter else 0,
+            "activity": counter.activity if counter else 0,
+        }
 
     def get_current_plan_subscription(self, obj):
 
-        subscriptions_queryset = PlanSubscription.objects.filter(user=obj, cancelled=False)
-        if not subscriptions_queryset.exists():
+        # Prefetched by User.objects.with_profile_annotations()
+        if hasattr(obj, 'active_plan_subscriptions'):
+            subscriptions = obj.active_plan_subscriptions
+            plan_subscription = subscriptions[0] if subscriptions else None
+        else:
+            plan_subscription = PlanSubscription.objects.filter(user=obj, cancelled=False).first()
+        if not plan_subscription:
             return None
-        plan_subscription = subscriptions_queryset.first()
         return PlanSubscriptionModelSerializer(plan_subscription, many=False).data
 
     def get_earned_this_month(self, obj):
 
+        if hasattr(obj, 'earned_this_month'):
+            return obj.earned_this_month
+
         today = timezone.now()
 
         earnings = Earning.objects.filter(
@@ -320,7 +375,7 @@ class UserSignUpSerializer(serializers.Serializer):
             user.free_trial_expiration = expiration_date
             user.stripe_plan_customer_id = new_customer["id"]
             user.currency = currency
-            user.save()
+            user.save(update_fields=['country', 'seller_view', 'is_seller', 'is_free_trial', 'free_trial_expiration', 'stripe_plan_customer_id', 'currency', 'modified'])
 
         else:
             user = User.objects.create_user(**data,
@@ -353,7 +408,7 @@ class UserSignUpSerializer(serializers.Serializer):
                                                     status=UserLoginActivity.SUCCESS)
         user_login_activity_log.save()
 
-        send_confirmation_email(user)
+        enqueue_on_commit(send_confirmation_email, user.pk)
 
         if 'payload' in self.context:
             # Add to contacts user to from user
@@ -361,9 +416,7 @@ class UserSignUpSerializer(serializers.Serializer):
 
             from_user = get_object_or_404(User, id=payload['from_user'])
             from_user.contacts.add(user)
-            from_user.save()
             user.contacts.add(from_user)
-            user.save()
 
         return user, token.key
 
@@ -464,7 +517,7 @@ class AccountVerificationSerializer(serializers.Serializer):
             raise serializers.ValidationError('Your account is already validated')
 
         user.is_verified = True
-        user.save()
+        user.save(update_fields=['is_verified', 'modified'])
 
 
 class IsEmailAvailableSerializer(serializers.Serializer):
@@ -534,7 +587,7 @@ class ChangeEmailSerializer(serializers.Serializer):
 
         user = self.context['user']
 
-        send_change_email_email(user, email)
+        enqueue_on_commit(send_change_email_email, user.pk, email)
         return {'email': email, 'user': user}
 
 
@@ -564,7 +617,7 @@ class ValidateChangeEmail(serializers.Serializer):
         email = payload['email']
 
         user.email = email
-        user.save()
+        user.save(update_fields=['email', 'modified'])
         return email
 
 
@@ -581,7 +634,7 @@ class ForgetPasswordSerializer(serializers.Serializer):
         if not User.objects.filter(email=email).exists():
             raise serializers.ValidationError('This email does not exists')
 
-        send_reset_password_email(email)
+        enqueue_on_commit(send_reset_password_email, email)
         return {'email': email}
 
 
@@ -621,7 +674,7 @@ class ResetPasswordSerializer(serializers.Serializer):
         password = self.data['password']
         user = User.objects.get(username=username)
         user.set_password(password)
-        user.save()
+        user.save(update_fields=['password', 'modified'])
         return user
 
 
@@ -685,7 +738,7 @@ class ChangePasswordSerializer(serializers.Serializer):
             raise serializers.ValidationError('Passwords not match')
         user.set_password(new_password)
         user.password_changed = True
-        user.save()
+        user.save(update_fields=['password', 'password_changed', 'modified'])
 
         return data
 
@@ -711,7 +764,7 @@ class InviteUserSerializer(serializers.Serializer):
         request = self.context['request']
         user = request.user
 
-        send_invitation_email(user, email, message, type)
+        enqueue_on_commit(send_invitation_email, user.pk, email, message, type)
         return data
 
 
@@ -736,7 +789,7 @@ class InviteUserSerializer(serializers.Serializer):
         request = self.context['request']
         user = request.user
 
-        send_invitation_email(user, email, message, type)
+        enqueue_on_commit(send_invitation_email, user.pk, email, message, type)
         return data
 
 
@@ -787,7 +840,7 @@ class StripeConnectSerializer(serializers.Serializer):
         )
         user.stripe_account_id = connected_account_id
         user.stripe_dashboard_url = stripe_dashboard_url["url"]
-        user.save()
+        user.save(update_fields=['stripe_account_id', 'stripe_dashboard_url', 'modified'])
         return {"stripe_account_id": user.stripe_account_id, "stripe_dashboard_url": user.stripe_dashboard_url}
 
 
@@ -810,7 +863,7 @@ class PaypalConnectSerializer(serializers.Serializer):
         user = instance
         email = validated_data['email']
         user.paypal_email = email
-        user.save()
+        user.save(update_fields=['paypal_email', 'modified'])
 
         return {"email": email}
 
@@ -892,12 +945,12 @@ class StripeSellerSubscriptionSerializer(serializers.Serializer):
                     "default_payment_method": payment_method_id
                 }
             )
-            stripe.PaymentMethod.modify(
+            PaymentMethod.objects.store(stripe.PaymentMethod.modify(
                 payment_method_id,
                 billing_details={
                     "name": data.get('card_name', " "),
                 }
-            )
+            ))
 
         else:
             plan = helpers.get_plan(user.currency)
@@ -920,7 +973,7 @@ class StripeSellerSubscriptionSerializer(serializers.Serializer):
             user.seller_view = True
             user.is_seller = True
             user.have_active_plan = True
-            user.save()
+            user.save(update_fields=['seller_view', 'is_seller', 'have_active_plan', 'modified'])
 
         # Create customer if not exists
         user.have_active_plan = True
@@ -929,7 +982,7 @@ class StripeSellerSubscriptionSerializer(serializers.Serializer):
     def update(self, instance, validated_data):
 
         instance.plan_default_payment_method = validated_data['payment_method_id']
-        instance.save()
+        instance.save(update_fields=['plan_default_payment_method', 'modified'])
         return instance
 
 
@@ -953,7 +1006,7 @@ class SellerChangePaymentMethodSerializer(serializers.Serializer):
     def update(self, instance, validated_data):
 
         instance.plan_default_payment_method = validated_data['payment_method_id']
-        instance.save()
+        instance.save(update_fields=['plan_default_payment_method', 'modified'])
         return instance
 
 
@@ -1023,7 +1076,7 @@ class SellerReactivateSubscriptionSerializer(serializers.Serializer):
             user.seller_view = True
             user.is_seller = True
             user.have_active_plan = True
-            user.save()
+            user.save(update_fields=['seller_view', 'is_seller', 'have_active_plan', 'modified'])
         self.context['plan_subscription'] = plan_subscription
 
         return data
@@ -1088,7 +1141,7 @@ class BecomeASellerSerializer(serializers.Serializer):
         instance.have_active_plan = True
         instance.stripe_plan_customer_id = new_customer_id
 
-        instance.save()
+        instance.save(update_fields=['is_seller', 'is_free_trial', 'free_trial_expiration', 'have_active_plan', 'stripe_plan_customer_id', 'modified'])
         return instance
 
 
@@ -1116,12 +1169,12 @@ class AttachPlanPaymentMethodSerializer(serializers.Serializer):
             payment_method_id,
             customer=user.stripe_plan_customer_id,
         )
-        stripe.PaymentMethod.modify(
+        PaymentMethod.objects.store(stripe.PaymentMethod.modify(
             payment_method_id,
             billing_details={
                 "name": data.get('card_name', " "),
             }
-        )
+        ))
 
         return data
 
@@ -1150,7 +1203,7 @@ class AttachPaymentMethodSerializer(serializers.Serializer):
                 email=user.email,
             )
             user.stripe_customer_id = new_customer['id']
-            user.save()
+            user.save(update_fields=['stripe_customer_id', 'modified'])
 
         payment_methods = helpers.get_payment_methods(stripe, user.stripe_customer_id)
         if payment_methods:
@@ -1172,12 +1225,12 @@ class AttachPaymentMethodSerializer(serializers.Serializer):
             )
             user.default_payment_method = payment_method_id
 
-        stripe.PaymentMethod.modify(
+        PaymentMethod.objects.store(stripe.PaymentMethod.modify(
             payment_method_id,
             billing_details={
                 "name": data.get('card_name', " "),
             }
-        )
+        ))
 
         return data
 
@@ -1199,9 +1252,9 @@ class DetachPaymentMethodSerializer(serializers.Serializer):
             raise serializers.ValidationError(
                 'This payment method is attached to a plan subscription')
 
-        stripe.PaymentMethod.detach(
-            "pm_1ICOvTCob7soW4zYIiXsCA4C",
-        )
+        PaymentMethod.objects.store(stripe.PaymentMethod.detach(
+            payment_method_id,
+        ))
 
         return data
 
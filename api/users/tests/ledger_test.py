@@ -0,0 +1,99 @@
+# Django
+from django.test import TestCase
+from django.utils import timezone
+from djmoney.money import Money
+
+# Django REST Framework
+from rest_framework.test import APITestCase
+
+# Model
+from api.users.models import User, Earning, BalanceSnapshot, InsufficientFunds
+
+# Utils
+from datetime import timedelta
+
+
+class EarningLedgerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        self.earning = Earning.objects.credit(self.user, Money(30, 'USD'))
+
+    def assertBalance(self, **expected):
+        user = User.objects.get(pk=self.user.pk)
+        balance = Earning.objects.balance(self.user)
+        for field, amount in expected.items():
+            self.assertEqual(getattr(user, field), Money(amount, 'USD'))
+            self.assertEqual(balance[field], Money(amount, 'USD'))
+
+    def test_spend_takes_pending_clearance_first(self):
+        Earning.objects.clear(self.earning)
+        Earning.objects.credit(self.user, Money(10, 'USD'))
+        Earning.objects.spend(self.user, 25)
+        self.assertBalance(net_income=40, pending_clearance=0, available_for_withdrawal=15, used_for_purchases=25)
+
+    def test_refund_returns_the_used_credits(self):
+        Earning.objects.spend(self.user, 10)
+        self.assertEqual(BalanceSnapshot.objects.take(timezone.now()), 1)
+        Earning.objects.refund(self.user, Money(15, 'USD'), used_credits=Money(10, 'USD'))
+        self.assertBalance(net_income=45, pending_clearance=35, used_for_purchases=0)
+
+    def test_clear_moves_what_is_left_once(self):
+        Earning.objects.spend(self.user, 10)
+        Earning.objects.clear(self.earning)
+        self.assertIsNone(Earning.objects.clear(self.earning))
+        self.assertBalance(net_income=30, pending_clearance=0, available_for_withdrawal=20)
+
+    def test_withdraw_can_not_overdraw(self):
+        Earning.objects.clear(self.earning)
+        Earning.objects.withdraw(self.user, 20)
+        with self.assertRaises(InsufficientFunds):
+            Earning.objects.withdraw(self.user, 20)
+        self.assertBalance(available_for_withdrawal=10, withdrawn=20)
+
+    def test_balance_from_snapshot_and_tail(self):
+        self.assertEqual(BalanceSnapshot.objects.take(timezone.now()), 1)
+        Earning.objects.clear(self.earning)
+        self.assertBalance(net_income=30, pending_clearance=0, available_for_withdrawal=30)
+
+    def test_settle_due_in_chunks(self):
+        other = User.objects.create_user("ivan", "ivan@gmail.com", "admin321")
+        for user in [self.user, other, other]:
+            Earning.objects.credit(user, Money(10, 'USD'))
+        Earning.objects.spend(self.user, 15)
+        now = timezone.now() + timedelta(days=15)
+
+        self.assertEqual(Earning.objects.settle_due(now, chunk_size=2), 4)
+        self.assertEqual(Earning.objects.settle_due(now, chunk_size=2), 0)
+        self.assertFalse(Earning.objects.due(now).exists())
+        self.assertBalance(net_income=40, pending_clearance=0, available_for_withdrawal=25)
+        other = User.objects.get(pk=other.pk)
+        self.assertEqual(other.pending_clearance, Money(0, 'USD'))
+        self.assertEqual(other.available_for_withdrawal, Money(20, 'USD'))
+
+
+class BalanceAPITestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        Earning.objects.credit(self.user, Money(30, 'USD'))
+        Earning.objects.spend(self.user, 10)
+        self.client.force_authenticate(self.user)
+
+    def test_balance(self):
+        response = self.client.get("/api/earnings/balance/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {field: float(amount) for field, amount in response.data.items()},
+            {
+                "net_income": 30,
+                "pending_clearance": 20,
+                "available_for_withdrawal": 0,
+                "used_for_purchases": 10,
+                "withdrawn": 0,
+            }
+        )
+
+    def test_internal_entries_are_not_listed(self):
+        response = self.client.get("/api/earnings/")
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"] if isinstance(response.data, dict) else response.data
+        self.assertEqual(sorted(earning["type"] for earning in results), [Earning.ORDER_REVENUE, Earning.SPENT])
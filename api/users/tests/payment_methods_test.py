@@ -0,0 +1,51 @@
+# Django
+from django.core.cache import cache
+from django.test import TestCase
+
+# Model
+from api.users.models import PaymentMethod
+
+# Utils
+from api.utils import helpers
+from types import SimpleNamespace
+
+
+class FakeStripe:
+    api_key = None
+
+    class PaymentMethod:
+        listed = 0
+        data = []
+
+        @classmethod
+        def list(cls, customer, type):
+            cls.listed += 1
+            return SimpleNamespace(data=cls.data)
+
+        @classmethod
+        def construct_from(cls, values, key):
+            return values
+
+
+class PaymentMethodsMirrorTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        FakeStripe.PaymentMethod.listed = 0
+        FakeStripe.PaymentMethod.data = [
+            {"id": "pm_2", "customer": "cus_1", "created": 2, "card": {"fingerprint": "b"}},
+            {"id": "pm_1", "customer": "cus_1", "created": 1, "card": {"fingerprint": "a"}},
+        ]
+
+    def test_listed_from_stripe_once(self):
+        self.assertEqual(helpers.get_payment_methods(FakeStripe, "cus_1"), FakeStripe.PaymentMethod.data)
+        self.assertEqual(helpers.get_payment_methods(FakeStripe, "cus_1"), FakeStripe.PaymentMethod.data)
+        self.assertEqual(FakeStripe.PaymentMethod.listed, 1)
+        self.assertIsNone(helpers.get_payment_methods(FakeStripe, ""))
+
+    def test_detached_payment_methods_are_dropped(self):
+        helpers.get_payment_methods(FakeStripe, "cus_1")
+        PaymentMethod.objects.store({"id": "pm_2", "customer": None})
+        self.assertEqual(
+            [payment_method["id"] for payment_method in helpers.get_payment_methods(FakeStripe, "cus_1")],
+            ["pm_1"]
+        )
@@ -0,0 +1,38 @@
+# Django
+from django.test import TestCase
+from djmoney.money import Money
+from decimal import Decimal
+
+# Model
+from api.users.models import User, Earning, PlanSubscription
+from api.notifications.models import Notification, NotificationCounter
+
+# Serializers
+from api.users.serializers import UserModelSerializer
+
+
+class UserProfileAnnotationsTestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user("user{}".format(i), "user{}@gmail.com".format(i), "admin321")
+            for i in range(12)
+        ]
+        seller = self.users[0]
+        Earning.objects.create(user=seller, amount=Money(10, 'USD'))
+        Earning.objects.create(user=seller, amount=Money(5, 'USD'))
+        PlanSubscription.objects.create(user=seller, subscription_id="sub_1", plan_type="BA")
+        NotificationCounter.objects.increment(seller.pk, Notification.MESSAGES)
+
+    def test_annotated_serialization_matches(self):
+        """The annotated queryset should serialize the same data"""
+        expected = UserModelSerializer(User.objects.order_by("username"), many=True).data
+        with self.assertNumQueries(2):
+            data = UserModelSerializer(
+                User.objects.order_by("username").with_profile_annotations(),
+                many=True
+            ).data
+        self.assertEqual(data, expected)
+        # The string form of the Sum depends on the database backend
+        self.assertEqual(Decimal(str(data[0]["earned_this_month"])), Decimal("15"))
+        self.assertEqual(data[0]["current_plan_subscription"]["subscription_id"], "sub_1")
+        self.assertTrue(data[0]["pending_notifications"])
@@ -0,0 +1,40 @@
+# Django
+from django.test import TestCase
+
+# Model
+from api.users.models import User, PlanSubscription, StripeEvent
+
+# Utils
+from api.users import webhooks
+import json
+
+
+def subscription_event(event_id, status, created, type="customer.subscription.updated"):
+    return json.dumps({
+        "id": event_id,
+        "type": type,
+        "created": created,
+        "data": {"object": {"id": "sub_1", "object": "subscription", "status": status}},
+    }).encode()
+
+
+class StripeEventsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        PlanSubscription.objects.create(user=self.user, subscription_id="sub_1", plan_type="BA", status="trialing")
+
+    def test_events_are_stored_once(self):
+        self.assertIsNotNone(webhooks.receive(subscription_event("evt_1", "active", 1)))
+        self.assertIsNone(webhooks.receive(subscription_event("evt_1", "active", 1)))
+        self.assertIsNone(webhooks.receive(subscription_event("evt_2", "active", 2, type="customer.created")))
+        self.assertEqual(StripeEvent.objects.get(event_id="evt_2").status, StripeEvent.IGNORED)
+        self.assertEqual(StripeEvent.objects.count(), 2)
+
+    def test_events_of_a_subscription_are_processed_in_order(self):
+        webhooks.receive(subscription_event("evt_2", "past_due", 20))
+        webhooks.receive(subscription_event("evt_1", "active", 10))
+
+        self.assertEqual(webhooks.process("evt_2"), 2)
+        self.assertEqual(PlanSubscription.objects.get(subscription_id="sub_1").status, "past_due")
+        self.assertTrue(User.objects.get(pk=self.user.pk).have_active_plan)
+        self.assertFalse(StripeEvent.objects.filter(status=StripeEvent.PENDING).exists())
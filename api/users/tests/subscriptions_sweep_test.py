@@ -0,0 +1,68 @@
+# Django
+from django.test import TestCase
+from django.utils import timezone
+
+# Model
+from api.users.models import User, PlanSubscription
+
+# Utils
+from datetime import timedelta
+
+
+class SubscriptionsSweepTestCase(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.users = [
+            User.objects.create_user("user{}".format(i), "user{}@gmail.com".format(i), "admin321")
+            for i in range(4)
+        ]
+        ended, paid, running, cancelled = self.users
+        User.objects.filter(pk__in=[ended.pk, paid.pk]).update(
+            is_free_trial=True,
+            have_active_plan=True,
+            free_trial_expiration=self.now - timedelta(days=1)
+        )
+        User.objects.filter(pk=running.pk).update(
+            is_free_trial=True,
+            have_active_plan=True,
+            free_trial_expiration=self.now + timedelta(days=1)
+        )
+        User.objects.filter(pk=cancelled.pk).update(have_active_plan=True)
+        PlanSubscription.objects.create(user=paid, subscription_id="sub_1", plan_type="BA", status="active")
+        PlanSubscription.objects.create(
+            user=cancelled,
+            subscription_id="sub_2",
+            plan_type="BA",
+            status="active",
+            to_be_cancelled=True,
+            current_period_end=int((self.now - timedelta(hours=1)).timestamp())
+        )
+
+    def test_expire_free_trials(self):
+        ended, paid, running, _ = self.users
+        expired = User.objects.expire_free_trials(self.now, chunk_size=1)
+        self.assertEqual(set(expired), {ended.pk, paid.pk})
+        states = dict(User.objects.values_list('pk', 'have_active_plan'))
+        self.assertFalse(states[ended.pk])
+        self.assertTrue(states[paid.pk])
+        self.assertTrue(User.objects.get(pk=running.pk).is_free_trial)
+
+    def test_trialing_subscription_keeps_the_plan(self):
+        trialing = User.objects.create_user("trialing", "trialing@gmail.com", "admin321")
+        User.objects.filter(pk=trialing.pk).update(
+            is_free_trial=True,
+            have_active_plan=True,
+            free_trial_expiration=self.now - timedelta(days=1)
+        )
+        PlanSubscription.objects.create(user=trialing, subscription_id="sub_3", plan_type="BA", status="trialing")
+        self.assertIn(trialing.pk, User.objects.expire_free_trials(self.now))
+        trialing = User.objects.get(pk=trialing.pk)
+        self.assertTrue(trialing.have_active_plan)
+        self.assertFalse(trialing.is_free_trial)
+
+    def test_cancel_ended_subscriptions(self):
+        cancelled = self.users[3]
+        user_ids = PlanSubscription.objects.cancel_ended(self.now)
+        self.assertEqual(user_ids, {cancelled.pk})
+        self.assertTrue(PlanSubscription.objects.get(user=cancelled).cancelled)
+        self.assertEqual(list(User.objects.filter(pk__in=user_ids).without_plan()), [cancelled])
@@ -4,6 +4,7 @@
 import pdb
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
+from django.db.models import Prefetch
 
 
 # Django REST Framework
@@ -28,6 +29,9 @@ from api.users.permissions import IsAccountOwner
 # Models
 from api.users.models import Contact
 
+# Utils
+from api.utils.serializers.dynamic_fields import is_expanded
+
 # Serializers
 from api.users.serializers import ContactModelSerializer, CreateContactSerializer
 
@@ -72,6 +76,12 @@ class ContactViewSet(
         """Restrict list to public-only."""
         user = self.request.user
         queryset = Contact.objects.filter(from_user=user)
+        if is_expanded(self.request, "contact_user"):
+            queryset = queryset.prefetch_related(
+                Prefetch("contact_user", queryset=User.objects.with_profile_annotations())
+            )
+        else:
+            queryset = queryset.select_related("contact_user")
 
         return queryset
 
@@ -28,7 +28,7 @@ from api.users.permissions import IsAccountOwner
 from api.users.models import Earning
 
 # Serializers
-from api.users.serializers import EarningModelSerializer, WithdrawFundsModelSerializer
+from api.users.serializers import EarningModelSerializer, WithdrawFundsModelSerializer, BalanceSerializer
 
 # Filters
 from rest_framework.filters import SearchFilter
@@ -62,9 +62,16 @@ class EarningViewSet(
         """Restrict list to public-only."""
         user = self.request.user
 
-        queryset = Earning.objects.filter(user=user)
+        # Clearances and returned credits only move money between balances
+        queryset = Earning.objects.filter(user=user).exclude(type__in=Earning.INTERNAL_TYPES)
         return queryset
 
+    @action(detail=False, methods=['get'])
+    def balance(self, request, *args, **kwargs):
+        """Balances of the user from the ledger."""
+        data = BalanceSerializer(Earning.objects.balance(request.user)).data
+        return Response(data, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['post'])
     def withdraw_funds(self, request, *args, **kwargs):
         """Process stripe connect auth flow."""
@@ -26,7 +26,7 @@ from stripe.api_resources import plan
 from api.users.permissions import IsAccountOwner
 
 # Models
-from api.users.models import User, UserLoginActivity, PlanSubscription, Earning, Contact, PlanPayment
+from api.users.models import User, UserLoginActivity, PlanSubscription, Earning, Contact, PlanPayment, PaymentMethod
 from api.plans.models import Plan
 from api.orders.models import OrderPayment, Order
 from djmoney.money import Money
@@ -57,7 +57,8 @@ from api.users.serializers import (
     DetachPaymentMethodSerializer,
     GetUserByJwtSerializer,
     BecomeASellerSerializer,
-    PaypalConnectSerializer
+    PaypalConnectSerializer,
+    BalanceSerializer
 )
 
 # Filters
@@ -65,7 +66,7 @@ from rest_framework.filters import SearchFilter
 from django_filters.rest_framework import DjangoFilterBackend
 
 # Celery
-from api.taskapp.tasks import send_confirmation_email, send_feedback_email
+from api.taskapp.tasks import send_confirmation_email, send_feedback_email, process_stripe_events, enqueue_on_commit
 
 import os
 import stripe
@@ -73,6 +74,7 @@ import json
 
 # Utils
 from api.utils import helpers
+from api.users import webhooks
 
 from datetime import timedelta
 from django.utils import timezone
@@ -134,8 +136,14 @@ class UserViewSet(mixins.RetrieveModelMixin,
             users = Contact.objects.filter(from_user=user).values_list('contact_user__pk')
             users_list = [x[0] for x in users]
             users_list.append(user.pk)
-            return User.objects.filter(account_deactivated=False, is_staff=False).exclude(pk__in=users_list)
-        return User.objects.filter(account_deactivated=False, is_staff=False)
+            return User.objects.filter(
+                account_deactivated=False,
+                is_staff=False
+            ).exclude(pk__in=users_list).with_profile_annotations()
+        queryset = User.objects.filter(account_deactivated=False, is_staff=False)
+        if self.action in ['list', 'retrieve']:
+            return queryset.with_profile_annotations()
+        return queryset
 
     # User destroy
 
@@ -154,28 +162,22 @@ class UserViewSet(mixins.RetrieveModelMixin,
             stripe.Subscription.delete(order_subscription.subscription_id)
         order_subscriptions.update(cancelled=True)
         normal_orders = Order.objects.filter(seller=instance, type=Order.HOLDING_PAYMENT_ORDER)
-        for normal_order in normal_orders:
+        for normal_order in normal_orders.select_related('buyer'):
             # Return de money to user as credits
-            buyer = normal_order.buyer
-            buyer.net_income += normal_order.due_to_seller
-            Earning.objects.create(
-                user=buyer,
-                amount=normal_order.due_to_seller,
-                type=Earning.REFUND,
-                available_for_withdrawn_date=timezone.now() + timedelta(days=14)
+            Earning.objects.refund(
+                normal_order.buyer,
+                normal_order.due_to_seller,
+                used_credits=normal_order.used_credits
             )
-            buyer.pending_clearance += normal_order.due_to_seller
-            buyer.used_for_purchases -= normal_order.used_credits
-            buyer.save()
 
         instance.account_deactivated = True
-        instance.save()
+        instance.save(update_fields=['account_deactivated', 'modified'])
 
     @action(detail=False, methods=['post'])
     def leave_feedback(self, request):
         """Check if email passed is correct."""
 
-        send_feedback_email(request.user, request.data['message'])
+        enqueue_on_commit(send_feedback_email, request.user.pk, request.data['message'])
         return Response(status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['get'])
@@ -285,7 +287,7 @@ class UserViewSet(mixins.RetrieveModelMixin,
         """Send the email confirmation."""
         if request.user.id:
             user = request.user
-            send_confirmation_email(user)
+            enqueue_on_commit(send_confirmation_email, user.pk)
             return Response(status=status.HTTP_200_OK)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -392,6 +394,7 @@ class UserViewSet(mixins.RetrieveModelMixin,
         remove = stripe.PaymentMethod.detach(
             request.data.get('payment_method').get('id'),
         )
+        PaymentMethod.objects.store(remove)
         return HttpResponse(status=200)
 
     @action(detail=False, methods=['post'])
@@ -467,6 +470,8 @@ class UserViewSet(mixins.RetrieveModelMixin,
             'user': UserModelSerializer(request.user, many=False).data,
 
         }
+        # Balances from the ledger
+        data['user'].update(BalanceSerializer(Earning.objects.balance(request.user)).data)
         if 'STRIPE_API_KEY' in env:
             stripe.api_key = env('STRIPE_API_KEY')
         else:
@@ -786,362 +791,39 @@ class UserViewSet(mixins.RetrieveModelMixin,
     @action(detail=False, methods=['post'])
     def stripe_webhook_subscription_deleted(self, request, *args, **kwargs):
         """Process stripe webhook notification for subscription cancellation"""
-        payload = request.body
-        event = None
-        if 'STRIPE_API_KEY' in env:
-            stripe.api_key = env('STRIPE_API_KEY')
-        else:
-            stripe.api_key = 'sk_test_51IZy28Dieqyg7vAImOKb5hg7amYYGSzPTtSqoT9RKI69VyycnqXV3wCPANyYHEl2hI7KLHHAeIPpC7POg7I4WMwi00TSn067f4'
-
-        try:
-            event = stripe.Event.construct_from(
-                json.loads(payload), stripe.api_key
-            )
-        except ValueError as e:
-            # Invalid payload
-            return HttpResponse(status=400)
-
-        # Handle the event
-        if event.type == 'customer.subscription.deleted':
-            subscription = event.data.object  # contains a stripe.Subscription
-
-            subscriptions_queryset = PlanSubscription.objects.filter(
-                subscription_id=subscription['id'], cancelled=False)
-
-            if subscriptions_queryset.exists():
-                plan_subscription = subscriptions_queryset.first()
-                user = plan_subscription.user
-                plan_subscription.update(cancelled=True)
-                user.update(have_active_plan=False)
-
-            # Handle also the recurrent order subscription cancelation
-            orders = Order.objects.filter(subscription_id=subscription['id'])
-
-            for order in orders:
-                try:
-                    stripe.Subscription.delete(subscription['id'])
-                except Exception as e:
-                    pass
-                order.status = Order.CANCELLED
-                order.cancelled = True
-                order.save()
-
-        return HttpResponse(status=200)
+        return self.receive_stripe_event(request)
 
     @action(detail=False, methods=['post'])
     def stripe_webhook_subscription_updated(self, request, *args, **kwargs):
-        """Process stripe webhook notification for subscription cancellation"""
-        payload = request.body
-        event = None
-        if 'STRIPE_API_KEY' in env:
-            stripe.api_key = env('STRIPE_API_KEY')
-        else:
-            stripe.api_key = 'sk_test_51IZy28Dieqyg7vAImOKb5hg7amYYGSzPTtSqoT9RKI69VyycnqXV3wCPANyYHEl2hI7KLHHAeIPpC7POg7I4WMwi00TSn067f4'
-
-        try:
-            event = stripe.Event.construct_from(
-                json.loads(payload), stripe.api_key
-            )
-        except ValueError as e:
-            # Invalid payload
-            return HttpResponse(status=200)
-
-        # Handle the event
-        if event.type == 'customer.subscription.updated':
-            subscription = event.data.object  # contains a stripe.Subscription
-            if subscription['status'] == "active":
-                subscriptions_queryset = PlanSubscription.objects.filter(
-                    subscription_id=subscription['id'])
-                if subscriptions_queryset.exists():
-                    plan_subscription = subscriptions_queryset.first()
-                    user = plan_subscription.user
-                    plan_subscription.update(status="active")
-                    user.update(have_active_plan=True, passed_free_trial_once=True, is_free_trial=False)
-            if subscription['status'] == "past_due":
-                subscriptions_queryset = PlanSubscription.objects.filter(
-                    subscription_id=subscription['id'])
-                if subscriptions_queryset.exists():
-                    plan_subscription = subscriptions_queryset.first()
-                    plan_subscription.update(status="past_due")
-        return HttpResponse(status=200)
+        """Process stripe webhook notification for subscription update"""
+        return self.receive_stripe_event(request)
 
     @action(detail=False, methods=['post'])
     def stripe_webhooks_invoice_payment_succeeded(self, request, *args, **kwargs):
-        """Process stripe webhook notification for subscription cancellation"""
-        payload = request.body
-        event = None
-        if 'STRIPE_API_KEY' in env:
-            stripe.api_key = env('STRIPE_API_KEY')
-        else:
-            stripe.api_key = 'sk_test_51IZy28Dieqyg7vAImOKb5hg7amYYGSzPTtSqoT9RKI69VyycnqXV3wCPANyYHEl2hI7KLHHAeIPpC7POg7I4WMwi00TSn067f4'
-
-        try:
-            event = stripe.Event.construct_from(
-                json.loads(payload), stripe.api_key
-            )
-        except ValueError as e:
-            # Invalid payload
-            return HttpResponse(status=400)
-        print(event)
-        # Handle the event
-        if event.type == 'invoice.payment_succeeded':
-            invoice_success = event.data.object
-            invoice_id = invoice_success['id']
-            charge_id = invoice_success['charge']
-            invoice_pdf = invoice_success['invoice_pdf']
-            subscription_id = invoice_success['subscription']
-            amount_paid = float(invoice_success['amount_paid']) / 100
-            currency = invoice_success['currency']
-            status = invoice_success['status']
-
-            # Get plan subscription
-            plan_subscriptions = PlanSubscription.objects.filter(subscription_id=subscription_id)
-
-            if plan_subscriptions.exists():
-                plan_subscription = plan_subscriptions.first()
-                plan_user = plan_subscription.user
-                PlanPayment.objects.create(
-                    user=plan_user,
-                    invoice_id=invoice_id,
-                    subscription_id=subscription_id,
-                    invoice_pdf=invoice_pdf,
-                    charge_id=charge_id,
-                    amount_paid=amount_paid,
-                    currency=currency,
-                    status=status,
-                )
-
-                if plan_user.free_trial_invoiced:
-
-                    if plan_user.active_month:
-
-                        def create_new_price():
-                            price = stripe.Price.create(
-                                unit_amount=int(plan_subscription.plan_unit_amount * 100),
-                                currency=plan_subscription.plan_currency,
-                                product=product_id,
-                                recurring={"interval": "month"},
-                            )
-
-                            subscription = stripe.Subscription.retrieve(
-                                subscription_id)
-
-                            stripe.Subscription.modify(
-                                subscription_id,
-                                cancel_at_period_end=False,
-                                proration_behavior=None,
-                                items=[
-                                    {
-                                        'id': subscription['items']['data'][0]['id'],
-                                        "price": price['id']
-                                    },
-                                ],
-                            )
-
-                        product_id = plan_subscription.product_id
-                        plan_currency = plan_subscription.plan_currency
-                        plans = Plan.objects.filter(stripe_product_id=product_id, currency=plan_currency)
-                        if plans.exists():
-                            plan = plans.first()
-                            if plan.unit_amount != plan_subscription.plan_unit_amount:
-                                create_new_price()
-                            else:
-
-                                subscription = stripe.Subscription.retrieve(
-                                    subscription_id)
-
-                                stripe.Subscription.modify(
-                                    subscription_id,
-                                    cancel_at_period_end=False,
-                                    proration_behavior=None,
-                                    items=[
-                                        {
-                                            'id': subscription['items']['data'][0]['id'],
-                                            "price": plan.stripe_price_id
-                                        },
-                                    ],
-                                )
-
-                        # If plan does not exists
-                        else:
-                            create_new_price()
-
-                        plan_user.active_month = False
-                        plan_user.save()
-                    else:
-                        product_id = plan_subscription.product_id
-
-                        price = stripe.Price.create(
-                            unit_amount=0,
-                            currency=plan_user.currency,
-                            recurring={"interval": "month"},
-
-                            product=product_id
-                        )
-
-                        subscription = stripe.Subscription.retrieve(
-                            subscription_id)
-
-                        stripe.Subscription.modify(
-                            subscription_id,
-                            cancel_at_period_end=False,
-                            proration_behavior=None,
-                            items=[
-                                {
-                                    'id': subscription['items']['data'][0]['id'],
-                                    "price": price['id']
-                                },
-                            ],
-                        )
-                else:
-                    # enter the free trial invocie
-                    plan_user.free_trial_invoiced = True
-                    plan_user.save()
-
-                return HttpResponse(status=200)
-
-            orders = Order.objects.filter(subscription_id=subscription_id).exclude(subscription_id=None)
-
-            if not orders.exists():
-                return HttpResponse(status=200)
-
-            order = orders.first()
-            OrderPayment.objects.create(
-                order=order,
-                invoice_id=invoice_id,
-                invoice_pdf=invoice_pdf,
-                charge_id=charge_id,
-                amount_paid=amount_paid,
-                currency=currency,
-                status=status,
-            )
-            rate_date = order.rate_date
-            seller = order.seller
-            buyer = order.buyer
-            used_credits = order.used_credits
-
-            if used_credits:
-                Earning.objects.create(
-                    user=buyer,
-                    type=Earning.SPENT,
-                    amount=used_credits
-                )
-
-                # Substract in pending_clearance and available_for_withdrawal the used credits amount
-                pending_clearance = buyer.pending_clearance - used_credits
-
-                if pending_clearance < Money(amount=0, currency="USD"):
-                    buyer.pending_clearance = Money(amount=0, currency="USD")
-                    available_money_payed = abs(pending_clearance)
-
-                    available_for_withdrawal = buyer.available_for_withdrawal - available_money_payed
-                    if available_for_withdrawal < Money(amount=0, currency="USD"):
-                        available_for_withdrawal = Money(amount=0, currency="USD")
-                    buyer.available_for_withdrawal = available_for_withdrawal
-                else:
-                    buyer.pending_clearance = pending_clearance
-
-                buyer.used_for_purchases += used_credits
-
-                buyer.save()
-
-            order_fee = order.service_fee
-            unit_amount_without_fees = order.offer.unit_amount
-
-            new_cost_of_subscription = unit_amount_without_fees + order_fee
-
-            order.unit_amount = new_cost_of_subscription
-            order.used_credits = 0
-            order.save()
-
-            new_cost_of_subscription, _ = helpers.convert_currency(
-                buyer.currency, "USD", new_cost_of_subscription.amount, rate_date)
-
-            switcher = {
-                Order.MONTH: "month",
-                Order.YEAR: "year"
-            }
-            interval = switcher.get(order.interval_subscription, None)
-            price = stripe.Price.create(
-                unit_amount=int(new_cost_of_subscription * 100),
-                currency=buyer.currency,
-                product=order.product_id,
-                recurring={"interval": interval}
-            )
-
-            subscription = stripe.Subscription.retrieve(
-                subscription_id)
-
-            stripe.Subscription.modify(
-                subscription_id,
-                cancel_at_period_end=False,
-                proration_behavior=None,
-                items=[
-                    {
-                        'id': subscription['items']['data'][0]['id'],
-                        "price": price['id']
-                    },
-                ],
-            )
-
-            due_to_seller = order.offer.unit_amount
-
-            seller.net_income = seller.net_income + due_to_seller
-
-            Earning.objects.create(
-                user=seller,
-                amount=due_to_seller,
-                available_for_withdrawn_date=timezone.now() + timedelta(days=14)
-            )
-
-            seller.pending_clearance += due_to_seller
+        """Process stripe webhook notification for invoice payment succeeded"""
+        return self.receive_stripe_event(request)
 
-            seller.save()
-
-            return HttpResponse(status=200)
-
-        else:
-            # Unexpected event type
-            return HttpResponse(status=200)
-
-    @ action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'])
     def stripe_webhooks_invoice_payment_failed(self, request, *args, **kwargs):
-        """Process stripe webhook notification for subscription cancellation"""
-        payload = request.body
-        event = None
-        if 'STRIPE_API_KEY' in env:
-            stripe.api_key = env('STRIPE_API_KEY')
-        else:
-            stripe.api_key = 'sk_test_51IZy28Dieqyg7vAImOKb5hg7amYYGSzPTtSqoT9RKI69VyycnqXV3wCPANyYHEl2hI7KLHHAeIPpC7POg7I4WMwi00TSn067f4'
+        """Process stripe webhook notification for invoice payment failed"""
+        return self.receive_stripe_event(request)
+
+    @action(detail=False, methods=['post'])
+    def stripe_webhook_payment_method(self, request, *args, **kwargs):
+        """Process stripe webhook notifications for payment methods changes"""
+        return self.receive_stripe_event(request)
 
+    def receive_stripe_event(self, request):
+        """Store the event and acknowledge it, it is processed on the billing queue."""
         try:
-            event = stripe.Event.construct_from(
-                json.loads(payload), stripe.api_key
-            )
-        except ValueError as e:
+            event = webhooks.receive(request.body)
+        except (ValueError, KeyError, TypeError):
             # Invalid payload
             return HttpResponse(status=400)
-        print(event)
-        # Handle the event
-        if event.type == 'invoice.payment_failed':
-            invoice_failed = event.data.object
-            subscription_id = invoice_failed['subscription']
-
-            orders = Order.objects.filter(subscription_id=subscription_id)
-
-            for order in orders:
-                try:
-                    stripe.Subscription.delete(subscription_id)
-                except Exception as e:
-                    pass
-                order.status = Order.CANCELLED
-                order.cancelled = True
-                order.payment_issue = True
-                order.save()
-
+        if event:
+            enqueue_on_commit(process_stripe_events, event.event_id)
         return HttpResponse(status=200)
 
-
 # {
 #   "id": "sub_IlnjqhWRBzlgmq",
 #   "object": "subscription",
@@ -0,0 +1,355 @@
+"""Stripe webhooks.
+
+The webhook views only store the raw event (StripeEvent), once per Stripe
+event id, and queue process_stripe_events. The events of a subscription are
+processed one at a time in the order Stripe created them, each handler in
+the transaction that marks its event processed. An event that fails is
+retried by the next run until STRIPE_EVENTS_MAX_ATTEMPTS, and the events
+after it wait for it meanwhile.
+"""
+
+# Django
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+# Models
+from api.users.models import User, PlanSubscription, Earning, PlanPayment, StripeEvent, PaymentMethod
+from api.plans.models import Plan
+from api.orders.models import OrderPayment, Order
+
+# Utils
+from api.utils import helpers
+
+import json
+import logging
+import stripe
+import environ
+env = environ.Env()
+
+logger = logging.getLogger(__name__)
+
+
+def subscription_deleted(subscription):
+    """Turn off the plan or cancel the recurrent order of a cancelled subscription."""
+    subscriptions_queryset = PlanSubscription.objects.filter(
+        subscription_id=subscription['id'], cancelled=False)
+
+    plan_subscription = subscriptions_queryset.first()
+    if plan_subscription:
+        subscriptions_queryset.update(cancelled=True)
+        User.objects.filter(pk=plan_subscription.user_id).update(have_active_plan=False)
+
+    # Handle also the recurrent order subscription cancelation
+    orders = Order.objects.filter(subscription_id=subscription['id'])
+
+    for order in orders:
+        try:
+            stripe.Subscription.delete(subscription['id'])
+        except Exception as e:
+            pass
+        order.status = Order.CANCELLED
+        order.cancelled = True
+        order.save()
+
+
+def subscription_updated(subscription):
+    """Update the status of a plan subscription."""
+    if subscription['status'] == "active":
+        subscriptions_queryset = PlanSubscription.objects.filter(
+            subscription_id=subscription['id'])
+        plan_subscription = subscriptions_queryset.first()
+        if plan_subscription:
+            subscriptions_queryset.update(status="active")
+            User.objects.filter(pk=plan_subscription.user_id).update(
+                have_active_plan=True, passed_free_trial_once=True, is_free_trial=False
+            )
+    if subscription['status'] == "past_due":
+        subscriptions_queryset = PlanSubscription.objects.filter(
+            subscription_id=subscription['id'])
+        subscriptions_queryset.update(status="past_due")
+
+
+def invoice_payment_succeeded(invoice_success):
+    """Store the payment of a plan or a recurrent order and set the price of its next period."""
+    invoice_id = invoice_success['id']
+    charge_id = invoice_success['charge']
+    invoice_pdf = invoice_success['invoice_pdf']
+    subscription_id = invoice_success['subscription']
+    amount_paid = float(invoice_success['amount_paid']) / 100
+    currency = invoice_success['currency']
+    status = invoice_success['status']
+
+    # Get plan subscription
+    plan_subscriptions = PlanSubscription.objects.filter(subscription_id=subscription_id)
+
+    if plan_subscriptions.exists():
+        plan_subscription = plan_subscriptions.first()
+        plan_user = plan_subscription.user
+        PlanPayment.objects.create(
+            user=plan_user,
+            invoice_id=invoice_id,
+            subscription_id=subscription_id,
+            invoice_pdf=invoice_pdf,
+            charge_id=charge_id,
+            amount_paid=amount_paid,
+            currency=currency,
+            status=status,
+        )
+
+        if plan_user.free_trial_invoiced:
+
+            if plan_user.active_month:
+
+                def create_new_price():
+                    price = stripe.Price.create(
+                        unit_amount=int(plan_subscription.plan_unit_amount * 100),
+                        currency=plan_subscription.plan_currency,
+                        product=product_id,
+                        recurring={"interval": "month"},
+                    )
+
+                    subscription = stripe.Subscription.retrieve(
+                        subscription_id)
+
+                    stripe.Subscription.modify(
+                        subscription_id,
+                        cancel_at_period_end=False,
+                        proration_behavior=None,
+                        items=[
+                            {
+                                'id': subscription['items']['data'][0]['id'],
+                                "price": price['id']
+                            },
+                        ],
+                    )
+
+                product_id = plan_subscription.product_id
+                plan_currency = plan_subscription.plan_currency
+                plans = Plan.objects.filter(stripe_product_id=product_id, currency=plan_currency)
+                if plans.exists():
+                    plan = plans.first()
+                    if plan.unit_amount != plan_subscription.plan_unit_amount:
+                        create_new_price()
+                    else:
+
+                        subscription = stripe.Subscription.retrieve(
+                            subscription_id)
+
+                        stripe.Subscription.modify(
+                            subscription_id,
+                            cancel_at_period_end=False,
+                            proration_behavior=None,
+                            items=[
+                                {
+                                    'id': subscription['items']['data'][0]['id'],
+                                    "price": plan.stripe_price_id
+                                },
+                            ],
+                        )
+
+                # If plan does not exists
+                else:
+                    create_new_price()
+
+                plan_user.active_month = False
+                plan_user.save(update_fields=['active_month', 'modified'])
+            else:
+                product_id = plan_subscription.product_id
+
+                price = stripe.Price.create(
+                    unit_amount=0,
+                    currency=plan_user.currency,
+                    recurring={"interval": "month"},
+
+                    product=product_id
+                )
+
+                subscription = stripe.Subscription.retrieve(
+                    subscription_id)
+
+                stripe.Subscription.modify(
+                    subscription_id,
+                    cancel_at_period_end=False,
+                    proration_behavior=None,
+                    items=[
+                        {
+                            'id': subscription['items']['data'][0]['id'],
+                            "price": price['id']
+                        },
+                    ],
+                )
+        else:
+            # enter the free trial invocie
+            plan_user.free_trial_invoiced = True
+            plan_user.save(update_fields=['free_trial_invoiced', 'modified'])
+
+        return
+
+    orders = Order.objects.filter(subscription_id=subscription_id).exclude(subscription_id=None)
+
+    if not orders.exists():
+        return
+
+    order = orders.first()
+    OrderPayment.objects.create(
+        order=order,
+        invoice_id=invoice_id,
+        invoice_pdf=invoice_pdf,
+        charge_id=charge_id,
+        amount_paid=amount_paid,
+        currency=currency,
+        status=status,
+    )
+    rate_date = order.rate_date
+    seller = order.seller
+    buyer = order.buyer
+    used_credits = order.used_credits
+
+    if used_credits:
+        Earning.objects.spend(buyer, used_credits)
+
+    order_fee = order.service_fee
+    unit_amount_without_fees = order.offer.unit_amount
+
+    new_cost_of_subscription = unit_amount_without_fees + order_fee
+
+    order.unit_amount = new_cost_of_subscription
+    order.used_credits = 0
+    order.save()
+
+    new_cost_of_subscription, _ = helpers.convert_currency(
+        buyer.currency, "USD", new_cost_of_subscription.amount, rate_date)
+
+    switcher = {
+        Order.MONTH: "month",
+        Order.YEAR: "year"
+    }
+    interval = switcher.get(order.interval_subscription, None)
+    price = stripe.Price.create(
+        unit_amount=int(new_cost_of_subscription * 100),
+        currency=buyer.currency,
+        product=order.product_id,
+        recurring={"interval": interval}
+    )
+
+    subscription = stripe.Subscription.retrieve(
+        subscription_id)
+
+    stripe.Subscription.modify(
+        subscription_id,
+        cancel_at_period_end=False,
+        proration_behavior=None,
+        items=[
+            {
+                'id': subscription['items']['data'][0]['id'],
+                "price": price['id']
+            },
+        ],
+    )
+
+    Earning.objects.credit(seller, order.offer.unit_amount)
+
+
+def invoice_payment_failed(invoice_failed):
+    """Cancel the recurrent orders whose payment failed."""
+    subscription_id = invoice_failed['subscription']
+
+    orders = Order.objects.filter(subscription_id=subscription_id)
+
+    for order in orders:
+        try:
+            stripe.Subscription.delete(subscription_id)
+        except Exception as e:
+            pass
+        order.status = Order.CANCELLED
+        order.cancelled = True
+        order.payment_issue = True
+        order.save()
+
+
+def payment_method_changed(payment_method):
+    """Keep the local mirror of the payment methods up to date."""
+    if payment_method.get('type') == 'card':
+        PaymentMethod.objects.store(payment_method)
+
+
+# Event type -> handler of its data object
+HANDLERS = {
+    'customer.subscription.deleted': subscription_deleted,
+    'customer.subscription.updated': subscription_updated,
+    'invoice.payment_succeeded': invoice_payment_succeeded,
+    'invoice.payment_failed': invoice_payment_failed,
+    'payment_method.attached': payment_method_changed,
+    'payment_method.updated': payment_method_changed,
+    'payment_method.automatically_updated': payment_method_changed,
+    'payment_method.detached': payment_method_changed,
+}
+
+
+def set_api_key():
+    if 'STRIPE_API_KEY' in env:
+        stripe.api_key = env('STRIPE_API_KEY')
+    else:
+        stripe.api_key = 'sk_test_51IZy28Dieqyg7vAImOKb5hg7amYYGSzPTtSqoT9RKI69VyycnqXV3wCPANyYHEl2hI7KLHHAeIPpC7POg7I4WMwi00TSn067f4'
+
+
+def receive(payload):
+    """Store a webhook payload. Return the event if it is new and has to be processed."""
+    event, created = StripeEvent.objects.receive(payload, handled_types=HANDLERS)
+    if created and event.status == StripeEvent.PENDING:
+        return event
+    return None
+
+
+def process(event_id):
+    """Process the pending events of the subscription of an event, in order.
+
+    Return the number of events processed.
+    """
+    set_api_key()
+
+    subscription_id = StripeEvent.objects.filter(
+        event_id=event_id
+    ).values_list('subscription_id', flat=True).first()
+    if subscription_id:
+        pending = StripeEvent.objects.filter(subscription_id=subscription_id)
+    else:
+        pending = StripeEvent.objects.filter(event_id=event_id)
+
+    processed = 0
+    while True:
+        with transaction.atomic():
+            # Workers of the same subscription wait here for each other
+            event = pending.filter(status=StripeEvent.PENDING).select_for_update().order_by(
+                'stripe_created', 'created'
+            ).first()
+            if not event:
+                return processed
+            try:
+                with transaction.atomic():
+                    data = stripe.Event.construct_from(json.loads(event.payload), stripe.api_key)
+                    HANDLERS[event.type](data.data.object)
+            except Exception as e:
+                logger.exception('Stripe event %s failed: %s', event.event_id, e)
+                event.attempts += 1
+                event.last_error = str(e)
+                if event.attempts >= settings.STRIPE_EVENTS_MAX_ATTEMPTS:
+                    event.status = StripeEvent.FAILED
+                event.save(update_fields=['attempts', 'last_error', 'status', 'modified'])
+                # The next events of the subscription wait for the retry
+                return processed
+            event.status = StripeEvent.PROCESSED
+            event.processed_at = timezone.now()
+            event.save(update_fields=['status', 'processed_at', 'modified'])
+            processed += 1
+
+
+def process_pending():
+    """Process the pending events of every subscription. Return the number processed."""
+    event_ids = {}
+    for event_id, subscription_id in StripeEvent.objects.filter(
+        status=StripeEvent.PENDING
+    ).order_by('stripe_created').values_list('event_id', 'subscription_id'):
+        event_ids.setdefault(subscription_id or event_id, event_id)
+    return sum(process(event_id) for event_id in event_ids.values())
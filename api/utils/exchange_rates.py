@@ -0,0 +1,225 @@
+"""Exchange rates store.
+
+Rates are fetched from exchangerate.host by the update_exchange_rates task and
+persisted as daily USD based rows (ExchangeRate), while the latest snapshot is
+also written to the djmoney.contrib.exchange tables. Lookups are served from an
+in-process cache and the Redis cache keyed by (base, rate_date); rates of past
+dates never change, so those entries never expire. Lookups never call the rates
+API: dates that are not stored are queued and fetched by the beat task.
+"""
+
+# Django
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+
+# djmoney
+from djmoney.contrib.exchange.backends.base import BaseExchangeBackend
+
+# Models
+from api.utils.models import ExchangeRate
+
+# Utilities
+from datetime import date
+from decimal import Decimal
+import threading
+import logging
+import time
+import requests
+
+logger = logging.getLogger(__name__)
+
+BASE_CURRENCY = 'USD'
+CACHE_PREFIX = 'exchange_rates'
+MISSING_KEY = '{}:missing'.format(CACHE_PREFIX)
+LOCAL_CACHE_SIZE = 1024
+
+_local_rates = {}
+_local_lock = threading.Lock()
+_latest_date = (0, None)
+
+
+class ExchangeRateHostBackend(BaseExchangeBackend):
+    """djmoney exchange backend backed by exchangerate.host."""
+    name = 'exchangerate.host'
+
+    def get_params(self):
+        return {}
+
+    def get_rates(self, rates=None, **params):
+        if rates is None:
+            _, rates = fetch_rates()
+        return rates
+
+
+def fetch_rates(rate_date='latest'):
+    """Fetch the USD based rates of a date. Return (rate_date, rates)."""
+    r = requests.get(
+        settings.EXCHANGE_RATES_URL.format(rate_date=rate_date),
+        params={'base': BASE_CURRENCY},
+        timeout=10
+    )
+    r.raise_for_status()
+    data = r.json()
+    rates = {
+        currency: Decimal(str(value))
+        for currency, value in data['rates'].items() if value
+    }
+    return data['date'], rates
+
+
+def store_rates(rate_date, rates):
+    """Persist the USD based rates of a date.
+
+    The first rates stored for a date are kept, so offers and orders priced
+    with that rate_date always convert with the same rates.
+    """
+    if isinstance(rate_date, str):
+        rate_date = date.fromisoformat(rate_date)
+    ExchangeRate.objects.bulk_create([
+        ExchangeRate(base=BASE_CURRENCY, currency=currency, rate_date=rate_date, value=value)
+        for currency, value in rates.items()
+    ], ignore_conflicts=True)
+    clear_cache()
+
+
+def update_rates():
+    """Fetch the latest rates and store them. Return the rate date."""
+    rate_date, rates = fetch_rates()
+    store_rates(rate_date, rates)
+    ExchangeRateHostBackend().update_rates(base_currency=BASE_CURRENCY, rates=rates)
+    return rate_date
+
+
+def get_latest_rate_date():
+    """Return the date of the most recent stored rates as a string."""
+    global _latest_date
+    expires, latest = _latest_date
+    if latest and expires > time.monotonic():
+        return latest
+
+    key = '{}:latest'.format(CACHE_PREFIX)
+    latest = cache.get(key)
+    if not latest:
+        latest = ExchangeRate.objects.filter(
+            base=BASE_CURRENCY
+        ).aggregate(Max('rate_date'))['rate_date__max']
+        if latest:
+            latest = latest.isoformat()
+            cache.set(key, latest, settings.EXCHANGE_RATES_LATEST_TTL)
+    if latest:
+        _latest_date = (time.monotonic() + settings.EXCHANGE_RATES_LATEST_TTL, latest)
+    return latest
+
+
+def _load_usd_rates(rate_date):
+    """Return (rate_date, rates) of the closest stored date not after rate_date."""
+    closest = ExchangeRate.objects.filter(
+        base=BASE_CURRENCY,
+        rate_date__lte=rate_date
+    ).aggregate(Max('rate_date'))['rate_date__max']
+    if not closest:
+        return None, None
+    rates = dict(
+        ExchangeRate.objects.filter(
+            base=BASE_CURRENCY,
+            rate_date=closest
+        ).values_list('currency', 'value')
+    )
+    rates.setdefault(BASE_CURRENCY, Decimal(1))
+    return closest.isoformat(), rates
+
+
+def _failed_key(rate_date):
+    return '{}:failed:{}'.format(CACHE_PREFIX, rate_date)
+
+
+def _queue_missing_date(rate_date):
+    """Queue a date that is not stored for fetch_missing_rates, unless it failed lately."""
+    if cache.get(_failed_key(rate_date)):
+        return
+    missing = cache.get(MISSING_KEY) or set()
+    if rate_date not in missing:
+        missing.add(rate_date)
+        cache.set(MISSING_KEY, missing, None)
+
+
+def fetch_missing_rates(rate_dates=None):
+    """Fetch and store the rates of the given or queued dates. Return the dates stored.
+
+    A date that can not be fetched is not queued again for
+    EXCHANGE_RATES_FAILED_TTL seconds.
+    """
+    if rate_dates is None:
+        rate_dates = cache.get(MISSING_KEY) or set()
+        cache.delete(MISSING_KEY)
+    stored = []
+    for rate_date in sorted(rate_dates):
+        try:
+            _, rates = fetch_rates(rate_date)
+        except (requests.RequestException, KeyError, ValueError) as e:
+            logger.error('Unable to fetch the exchange rates of %s: %s', rate_date, e)
+            cache.set(_failed_key(rate_date), True, settings.EXCHANGE_RATES_FAILED_TTL)
+            continue
+        # Stored under the date asked for, the one the offer or order was priced with
+        store_rates(rate_date, rates)
+        # Drop the lookups that resolved the date to an earlier one
+        cache.delete_many([
+            '{}:{}:{}'.format(CACHE_PREFIX, base, rate_date)
+            for base in set(rates) | {BASE_CURRENCY}
+        ])
+        stored.append(rate_date)
+    return stored
+
+
+def get_rates(base, rate_date='latest'):
+    """Return (rates, rate_date) with the rates of every currency against base.
+
+    A date that is not stored resolves to the closest stored date before it,
+    and is queued to be fetched if EXCHANGE_RATES_HTTP_FALLBACK is set.
+    Return (None, None) if there is none.
+    """
+    base = base.upper()
+    if not rate_date or rate_date == 'latest':
+        rate_date = get_latest_rate_date()
+        if not rate_date:
+            return None, None
+
+    key = (base, rate_date)
+    if key in _local_rates:
+        return _local_rates[key], rate_date
+
+    cache_key = '{}:{}:{}'.format(CACHE_PREFIX, base, rate_date)
+    cached = cache.get(cache_key)
+    if cached:
+        rates, effective_date = cached
+    else:
+        try:
+            effective_date, usd_rates = _load_usd_rates(date.fromisoformat(rate_date))
+        except ValueError:
+            return None, None
+        if effective_date != rate_date and settings.EXCHANGE_RATES_HTTP_FALLBACK:
+            _queue_missing_date(rate_date)
+        if not usd_rates or base not in usd_rates:
+            return None, None
+        base_rate = usd_rates[base]
+        rates = {currency: float(value / base_rate) for currency, value in usd_rates.items()}
+        # A missing date resolved to an earlier one may be seeded later on
+        timeout = None if effective_date == rate_date else settings.EXCHANGE_RATES_LATEST_TTL
+        cache.set(cache_key, (rates, effective_date), timeout)
+
+    if effective_date == rate_date:
+        with _local_lock:
+            if len(_local_rates) >= LOCAL_CACHE_SIZE:
+                _local_rates.clear()
+            _local_rates[key] = rates
+    return rates, effective_date
+
+
+def clear_cache():
+    """Drop the in-process cache and the cached latest rate date."""
+    global _latest_date
+    with _local_lock:
+        _local_rates.clear()
+    _latest_date = (0, None)
+    cache.delete('{}:latest'.format(CACHE_PREFIX))
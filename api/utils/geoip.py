@@ -0,0 +1,125 @@
+"""GeoIP country and currency resolver.
+
+Resolves the country of an IP address against the GeoLite2 database shipped
+in GEOIP_PATH. The reader is memory-mapped once per process and the
+IP -> country results that were found are kept in an LRU cache, so a lookup
+is an in-process dictionary hit in the common case.
+"""
+
+# Django
+from django.conf import settings
+
+# Utilities
+from functools import lru_cache
+from maxminddb import MODE_MMAP
+import geoip2.database
+import geoip2.errors
+import threading
+import logging
+import ccy
+import os
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COUNTRY = 'US'
+DEFAULT_CURRENCY = 'USD'
+
+_reader = None
+_reader_lock = threading.Lock()
+_plan_currencies = None
+
+
+def get_reader():
+    """Return the process-wide GeoLite2 reader, opening it on first use."""
+    global _reader
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                path = os.path.join(settings.GEOIP_PATH, settings.GEOIP_COUNTRY)
+                try:
+                    _reader = geoip2.database.Reader(path, mode=MODE_MMAP)
+                except (IOError, ValueError) as e:
+                    logger.error('Unable to open the GeoIP database %s: %s', path, e)
+                    return None
+    return _reader
+
+
+@lru_cache(maxsize=None)
+def get_country_currency(country_code):
+    """Return the ISO currency of a country, None if unknown."""
+    try:
+        return ccy.countryccy(country_code)
+    except Exception:
+        return None
+
+
+def get_plan_currencies():
+    """Return the set of currencies that have a basic plan.
+
+    The set is computed once per process and dropped by clear_cache() every
+    time a plan is saved or deleted.
+    """
+    global _plan_currencies
+    if _plan_currencies is None:
+        from api.plans.models import Plan
+        _plan_currencies = frozenset(
+            Plan.objects.filter(type=Plan.BASIC).values_list('currency', flat=True)
+        )
+    return _plan_currencies
+
+
+def get_currency(country_code):
+    """Return the plan currency used for a country, USD by default."""
+    currency = get_country_currency(country_code)
+    if currency and currency in get_plan_currencies():
+        return currency
+    return DEFAULT_CURRENCY
+
+
+def lookup_country(ip):
+    """Return the ISO country code of an IP address, None if not found."""
+    reader = get_reader()
+    if reader is not None:
+        try:
+            return reader.country(ip).country.iso_code
+        except (geoip2.errors.AddressNotFoundError, ValueError):
+            pass
+
+    if settings.GEOIP_HTTP_FALLBACK:
+        try:
+            r = requests.get('http://ip-api.com/json/{}'.format(ip), timeout=3)
+            if r.status_code == 200:
+                return r.json().get('countryCode') or None
+        except (requests.RequestException, ValueError) as e:
+            logger.warning('GeoIP HTTP fallback failed for %s: %s', ip, e)
+    return None
+
+
+@lru_cache(maxsize=settings.GEOIP_CACHE_SIZE)
+def get_cached_country(ip):
+    """Return the country of an IP address, LookupError if it is not found.
+
+    Misses raise instead of returning, so lru_cache does not keep them and a
+    transient failure of the lookup is retried on the next request.
+    """
+    country_code = lookup_country(ip)
+    if not country_code:
+        raise LookupError(ip)
+    return country_code
+
+
+def get_currency_and_country(ip):
+    """Return the (currency, country_code) tuple of an IP address."""
+    try:
+        country_code = get_cached_country(ip)
+    except LookupError:
+        country_code = DEFAULT_COUNTRY
+    return get_currency(country_code), country_code
+
+
+def clear_cache():
+    """Drop the cached plan currencies and IP lookups."""
+    global _plan_currencies
+    _plan_currencies = None
+    get_cached_country.cache_clear()
@@ -7,13 +7,14 @@ from django.template.loader import render_to_string
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.db.models import Sum
+from django.core.cache import cache
 
 # DRF
 from rest_framework import serializers
 
 # Models
 from api.plans.models import Plan
-from api.users.models import User, Earning
+from api.users.models import User, Earning, PaymentMethod
 from api.activities.models import (
     Activity,
     CancelOrderActivity,
@@ -27,20 +28,12 @@ from api.chats.models import Chat
 from api.notifications.models import Notification, NotificationUser
 
 
-# Serializers
-from api.activities.serializers import (
-    OfferActivityModelSerializer,
-    DeliveryActivityModelSerializer,
-    CancelOrderActivityModelSerializer,
-    RevisionActivityModelSerializer
-)
-
 # Utilities
+from api.utils import geoip, exchange_rates
 import jwt
+import json
+import time
 from datetime import timedelta
-import geoip2.database
-import ccy
-import requests
 import environ
 env = environ.Env()
 
@@ -121,71 +114,57 @@ def get_user_token(user_id):
 
 
 def get_payment_methods(stripe, stripe_customer_id):
+    """Return the card payment methods of a customer from their local mirror.
+
+    Only a customer never mirrored is listed from Stripe in the request. A
+    mirror older than PAYMENT_METHODS_TTL is served as is and refreshed by
+    the refresh_payment_methods task.
+    """
     if stripe_customer_id != None and stripe_customer_id != '':
-        payment_methods = stripe.PaymentMethod.list(
-            customer=stripe_customer_id,
-            type="card"
-        )
-        return payment_methods.data
+        synced_at = cache.get('payment_methods:synced:{}'.format(stripe_customer_id))
+        if synced_at is None:
+            return refresh_payment_methods(stripe, stripe_customer_id)
+        if time.time() - synced_at > settings.PAYMENT_METHODS_TTL and cache.add(
+            'payment_methods:refreshing:{}'.format(stripe_customer_id), 1, 60
+        ):
+            from api.taskapp.tasks import refresh_payment_methods as refresh_task
+            refresh_task.delay(stripe_customer_id)
+        return [
+            stripe.PaymentMethod.construct_from(json.loads(payload), stripe.api_key)
+            for payload in PaymentMethod.objects.filter(
+                stripe_customer_id=stripe_customer_id
+            ).order_by('-stripe_created').values_list('payload', flat=True)
+        ]
     else:
         return None
 
 
+def refresh_payment_methods(stripe, stripe_customer_id):
+    """List the card payment methods of a customer from Stripe into their mirror."""
+    payment_methods = stripe.PaymentMethod.list(
+        customer=stripe_customer_id,
+        type="card"
+    ).data
+    PaymentMethod.objects.sync(stripe_customer_id, payment_methods)
+    cache.set('payment_methods:synced:{}'.format(stripe_customer_id), time.time(), None)
+    return payment_methods
+
+
 def get_currency_api(current_login_ip):
+    currency, _ = geoip.get_currency_and_country(current_login_ip)
+    return currency
 
-    r = requests.get('http://ip-api.com/json/{}'.format(current_login_ip))
-    status = r.status_code
-    if status == 200:
-        data = r.json()
-        country_code = data['countryCode']
-        if not country_code:
-            country_code = "US"
-
-        try:
-            currency = ccy.countryccy(country_code)
-            if Plan.objects.filter(type=Plan.BASIC, currency=currency).exists():
-                return currency
-        except Exception as e:
-            print(e)
-            pass
-        return "USD"
-    else:
-        raise serializers.ValidationError("Get currency issue, try it later")
 
+def get_request_ip(request):
+    current_login_ip = get_client_ip(request)
+    # Remove this line in production
+    if env.bool("DEBUG", default=True):
+        current_login_ip = "147.161.106.227"
+    return current_login_ip
 
-def get_currency_and_country_anonymous(request):
-    country_code = None
-    currency = None
-    if not currency:
-        # Get country
-        if not country_code:
-            current_login_ip = get_client_ip(request)
-            # Remove this line in production
-            if env.bool("DEBUG", default=True):
-                current_login_ip = "147.161.106.227"
-            # Get country
-            r = requests.get('http://ip-api.com/json/{}'.format(current_login_ip))
-            status = r.status_code
-            if status == 200:
-                data = r.json()
-                country_code = data['countryCode']
-                if not country_code:
-                    country_code = "US"
-
-            # Get the currency by country
-            if country_code:
-
-                try:
-                    country_currency = ccy.countryccy(country_code)
-                    if Plan.objects.filter(type=Plan.BASIC, currency=country_currency).exists():
-                        currency = country_currency
-                except Exception as e:
-                    print(e)
-                    pass
-            else:
-                currency = "USD"
 
-    return currency, country_code
+def get_currency_and_country_anonymous(request):
+    return geoip.get_currency_and_country(get_request_ip(request))
 
 
 def get_currency_and_country(request):
@@ -193,38 +172,20 @@ def get_currency_and_country(request):
     country_code = user.country
     currency = user.currency
     if not currency:
-        # Get country
-        if not user.country:
-            current_login_ip = get_client_ip(request)
-            # Remove this line in production
-            if env.bool("DEBUG", default=True):
-                current_login_ip = "147.161.106.227"
-            # Get country
-            r = requests.get('http://ip-api.com/json/{}'.format(current_login_ip))
-            status = r.status_code
-            if status == 200:
-                data = r.json()
-                country_code = data['countryCode']
-                if not country_code:
-                    country_code = "US"
-
-            # Get the currency by country
-            if country_code:
-
-                try:
-                    country_currency = ccy.countryccy(country_code)
-                    if Plan.objects.filter(type=Plan.BASIC, currency=country_currency).exists():
-                        currency = country_currency
-                except Exception as e:
-                    print(e)
-                    pass
-            else:
-                currency = "USD"
+        if not country_code:
+            currency, country_code = geoip.get_currency_and_country(get_request_ip(request))
+        else:
+            currency = geoip.get_currency(country_code)
+
+    update_fields = []
     if not user.currency:
         user.currency = currency
+        update_fields.append('currency')
     if not user.country:
         user.country = country_code
-    user.save()
+        update_fields.append('country')
+    if update_fields:
+        user.save(update_fields=update_fields)
     return currency, country_code
 
 
@@ -244,69 +205,88 @@ def get_plan(currency):
     return plan
 
 
-def get_activity_classes(type):
-    switcher = {
-        Activity.OFFER: {
-            "model": OfferActivity,
-            "serializer": OfferActivityModelSerializer
-        },
-        Activity.CHANGE_DELIVERY_TIME: ChangeDeliveryTimeActivity,
-        Activity.INCREASE_AMOUNT: IncreaseAmountActivity,
-        Activity.DELIVERY: {"model": DeliveryActivity, "serializer": DeliveryActivityModelSerializer},
-        Activity.REVISION: {"model": RevisionActivity, "serializer": RevisionActivityModelSerializer},
-        Activity.CANCEL: {
-            "model": CancelOrderActivity,
-            "serializer": CancelOrderActivityModelSerializer
-        },
+# Activity type -> item model
+ACTIVITY_MODELS = {
+    Activity.OFFER: OfferActivity,
+    Activity.CHANGE_DELIVERY_TIME: ChangeDeliveryTimeActivity,
+    Activity.INCREASE_AMOUNT: IncreaseAmountActivity,
+    Activity.DELIVERY: DeliveryActivity,
+    Activity.REVISION: RevisionActivity,
+    Activity.CANCEL: CancelOrderActivity,
+}
 
+
+def get_activity_classes(type):
+    """Return the item model and item serializer of an activity type."""
+    # The serializers import the tasks, which import this module
+    from api.activities.serializers import (
+        OfferActivityModelSerializer,
+        DeliveryActivityModelSerializer,
+        CancelOrderActivityModelSerializer,
+        RevisionActivityModelSerializer
+    )
+
+    item_serializers = {
+        Activity.OFFER: OfferActivityModelSerializer,
+        Activity.DELIVERY: DeliveryActivityModelSerializer,
+        Activity.REVISION: RevisionActivityModelSerializer,
+        Activity.CANCEL: CancelOrderActivityModelSerializer,
     }
-    activity_classes = switcher.get(type, {"model": None, "serializer": None})
-    model = None
-    if "model" in activity_classes:
-        model = activity_classes["model"]
-    serializer = None
-    if "serializer" in activity_classes:
-        serializer = activity_classes["serializer"]
-    return model, serializer
+    return ACTIVITY_MODELS.get(type), item_serializers.get(type)
+
+
+ACTIVITY_ITEM_RELATED = {
+    Activity.OFFER: ("offer__seller", "offer__buyer"),
+    Activity.DELIVERY: ("delivery__order__seller", "delivery__order__buyer"),
+    Activity.REVISION: ("revision__order__seller", "revision__order__buyer"),
+    Activity.CANCEL: ("cancel_order__order__seller", "cancel_order__order__buyer", "cancel_order__issued_by"),
+}
+
+
+def prefetch_activity_items(activities):
+    """Load the items of a list of activities with one query per activity type."""
+    activities_by_type = {}
+    for activity in activities:
+        if activity is not None and not hasattr(activity, '_activity_item'):
+            activities_by_type.setdefault(activity.type, []).append(activity)
+
+    for type, type_activities in activities_by_type.items():
+        model, _ = get_activity_classes(type)
+        items = {}
+        if model:
+            queryset = model.objects.filter(activity_id__in=[activity.pk for activity in type_activities])
+            related = ACTIVITY_ITEM_RELATED.get(type)
+            if related:
+                queryset = queryset.select_related(*related)
+            items = {item.activity_id: item for item in queryset}
+        for activity in type_activities:
+            activity._activity_item = items.get(activity.pk)
+    return activities
 
 
 def get_chat(sent_by, sent_to):
     if not sent_by or not sent_to:
         return False
 
-    chats = Chat.objects.filter(participants=sent_by)
-    chats = chats.filter(participants=sent_to)
-    if chats.exists():
-        for chat in chats:
-            if chat.participants.all().count() == 2:
-                return chat
-    return False
+    return Chat.objects.get_direct(sent_by, sent_to) or False
 
 
 def get_currency_rate(currency, rate_date='latest'):
-    r = requests.get("https://api.exchangerate.host/"+rate_date+"?base=USD")
-    status = r.status_code
-    if status == 200:
-        data = r.json()
-        currency_rate = data['rates'][currency.upper()]
-        currency_conversion_date = data['date']
-        if not currency_rate:
-            raise serializers.ValidationError("Currency rate not allowed")
-    else:
+    rates, currency_conversion_date = exchange_rates.get_rates('USD', rate_date)
+    if not rates:
         raise serializers.ValidationError("Rate conversion issue, try it later")
+    currency_rate = rates.get(currency.upper())
+    if not currency_rate:
+        raise serializers.ValidationError("Currency rate not allowed")
     return currency_rate, currency_conversion_date
 
 
 def convert_currency(currency, base, price, rate_date='latest'):
-    r = requests.get("https://api.exchangerate.host/"+rate_date+"?base="+base.upper())
-    status = r.status_code
-    if status == 200:
-        data = r.json()
-        currency_rate = data['rates'][currency.upper()]
-        currency_conversion_date = data['date']
-        if not currency_rate:
-            raise serializers.ValidationError("Currency rate not allowed")
-        converted_currency = float(price) * currency_rate
-    else:
+    rates, currency_conversion_date = exchange_rates.get_rates(base, rate_date)
+    if not rates:
         raise serializers.ValidationError("Rate conversion issue, try it later")
+    currency_rate = rates.get(currency.upper())
+    if not currency_rate:
+        raise serializers.ValidationError("Currency rate not allowed")
+    converted_currency = float(price) * currency_rate
     return converted_currency, currency_conversion_date
@@ -0,0 +1,164 @@
+"""Outgoing email spool.
+
+Email tasks only render their messages and append them, one per recipient,
+to the Redis list mail:spool. The send_spooled_mail task drains it in
+batches of MAIL_SPOOL_BATCH_SIZE, each one sent over a single backend
+connection, so a burst of transactional email opens one SMTP or ESP session
+per batch instead of one per message. Messages that fail are appended again
+until MAIL_SPOOL_MAX_ATTEMPTS, then kept in mail:dead.
+
+A batch is moved atomically to mail:processing and only removed from there
+once it was sent, so the batch of a flush that crashed is spooled again by
+the next one and may be sent twice, never lost. Flushes hold the mail:drain
+lock, so a single one sends at a time.
+"""
+
+# Django
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+# Utilities
+import threading
+import logging
+import json
+import time
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Messages are pushed on the left and taken from the right, the oldest first
+SPOOL_KEY = 'mail:spool'
+PROCESSING_KEY = 'mail:processing'
+DEAD_KEY = 'mail:dead'
+FLUSH_KEY = 'mail:flush'
+DRAIN_KEY = 'mail:drain'
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(settings.MAIL_SPOOL_REDIS_URL)
+    return _client
+
+
+def spool(subject, html, from_email, recipient_list):
+    """Append an html message for each recipient.
+
+    Return True when no flush is scheduled yet, so the caller schedules one.
+    """
+    pipe = get_client().pipeline()
+    for recipient in recipient_list:
+        pipe.lpush(SPOOL_KEY, json.dumps({
+            'subject': subject,
+            'html': html,
+            'from_email': from_email,
+            'to': recipient,
+            'attempts': 0,
+        }))
+    pipe.set(FLUSH_KEY, 1, nx=True, ex=settings.MAIL_SPOOL_FLUSH_DELAY)
+    return bool(pipe.execute()[-1])
+
+
+def send_batch(messages):
+    """Send spooled messages over one connection. Return the failed ones."""
+    connection = get_connection()
+    failed = []
+    try:
+        connection.open()
+    except Exception as e:
+        logger.exception(e)
+        return messages
+    try:
+        for message in messages:
+            email = EmailMultiAlternatives(
+                message['subject'],
+                message['html'],
+                message['from_email'],
+                [message['to']],
+                connection=connection
+            )
+            email.attach_alternative(message['html'], 'text/html')
+            try:
+                email.send()
+            except Exception as e:
+                logger.warning('Sending email to %s failed: %s', message['to'], e)
+                failed.append(message)
+    finally:
+        connection.close()
+    return failed
+
+
+def respool_processing(client):
+    """Spool again the batch left by a flush that crashed. Return its size."""
+    respooled = 0
+    while client.rpoplpush(PROCESSING_KEY, SPOOL_KEY):
+        respooled += 1
+    if respooled:
+        logger.warning('Spooled again %s messages of an interrupted flush', respooled)
+    return respooled
+
+
+def take_batch(client, batch_size):
+    """Move the oldest spooled messages to the processing list and return them."""
+    pipe = client.pipeline()
+    for _ in range(batch_size):
+        pipe.rpoplpush(SPOOL_KEY, PROCESSING_KEY)
+    return [payload for payload in pipe.execute() if payload]
+
+
+def drain(batch_size=None, time_limit=None):
+    """Send the spooled messages until the spool is empty or time_limit. Return the metrics.
+
+    Return None if another flush is sending.
+    """
+    batch_size = batch_size or settings.MAIL_SPOOL_BATCH_SIZE
+    time_limit = time_limit or settings.MAIL_SPOOL_TIME_LIMIT
+    client = get_client()
+    # The lock outlives a killed worker by a minute at most
+    if not client.set(DRAIN_KEY, 1, nx=True, ex=int(time_limit) + 60):
+        return None
+    try:
+        # Messages spooled from now on schedule their own flush
+        client.delete(FLUSH_KEY)
+        metrics = {'batches': 0, 'sent': 0, 'retried': 0, 'dead': 0}
+        metrics['respooled'] = respool_processing(client)
+        started = time.monotonic()
+        while time.monotonic() - started < time_limit:
+            payloads = take_batch(client, batch_size)
+            if not payloads:
+                break
+
+            messages = [json.loads(payload) for payload in payloads]
+            failed = send_batch(messages)
+            metrics['batches'] += 1
+            metrics['sent'] += len(messages) - len(failed)
+
+            # Done with the batch, the failed messages are spooled again in the same transaction
+            pipe = client.pipeline()
+            pipe.delete(PROCESSING_KEY)
+            for message in failed:
+                message['attempts'] += 1
+                if message['attempts'] < settings.MAIL_SPOOL_MAX_ATTEMPTS:
+                    pipe.lpush(SPOOL_KEY, json.dumps(message))
+                    metrics['retried'] += 1
+                else:
+                    pipe.rpush(DEAD_KEY, json.dumps(message))
+                    metrics['dead'] += 1
+            pipe.execute()
+            if failed:
+                # Failed messages are retried by the next flush
+                break
+    finally:
+        client.delete(DRAIN_KEY)
+
+    elapsed = time.monotonic() - started
+    metrics['seconds'] = round(elapsed, 3)
+    metrics['per_second'] = round(metrics['sent'] / elapsed, 1) if elapsed else 0
+    if metrics['batches']:
+        logger.info('Mail spool drained: %s', metrics)
+    return metrics
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from api.chats.models import Chat, Participant
+from api.chats.models.chats import direct_pair_key
+
+
+class Command(BaseCommand):
+    help = "Set the canonical pair key of the existing direct chats."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        chats = Chat.objects.filter(
+            pair_key__isnull=True
+        ).annotate(
+            participants_count=Count("participants")
+        ).filter(participants_count=2).order_by("-modified")
+
+        chat_ids = list(chats.values_list("id", flat=True))
+        updated = 0
+        duplicated = 0
+        for start in range(0, len(chat_ids), batch_size):
+            batch_ids = chat_ids[start:start + batch_size]
+            participants = {}
+            for room_id, participant_id in Participant.objects.filter(
+                room_id__in=batch_ids
+            ).values_list("room_id", "participant_id"):
+                participants.setdefault(room_id, []).append(participant_id)
+
+            keys = {
+                room_id: direct_pair_key(*users)
+                for room_id, users in participants.items()
+            }
+            used = set(Chat.objects.filter(pair_key__in=keys.values()).values_list("pair_key", flat=True))
+
+            to_update = []
+            # Most recently active chats come first and keep the key
+            for room_id in batch_ids:
+                key = keys.get(room_id)
+                if not key:
+                    continue
+                if key in used:
+                    duplicated += 1
+                    continue
+                used.add(key)
+                to_update.append(Chat(id=room_id, pair_key=key))
+
+            Chat.objects.bulk_update(to_update, ["pair_key"])
+            updated += len(to_update)
+
+        print("{} chats updated, {} duplicated chats skipped".format(updated, duplicated))
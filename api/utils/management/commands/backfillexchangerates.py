@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.utils import exchange_rates
+from datetime import date, timedelta
+
+
+class Command(BaseCommand):
+    help = "Fetch and store the exchange rates of the dates queued by lookups, or of a date range."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First date to fetch (YYYY-MM-DD)")
+        parser.add_argument("--end", help="Last date to fetch (YYYY-MM-DD), the start date by default")
+
+    def handle(self, *args, **options):
+        rate_dates = None
+        if options["start"]:
+            try:
+                start = date.fromisoformat(options["start"])
+                end = date.fromisoformat(options["end"] or options["start"])
+            except ValueError as e:
+                raise CommandError(e)
+            rate_dates = [
+                (start + timedelta(days=days)).isoformat()
+                for days in range((end - start).days + 1)
+            ]
+
+        stored = exchange_rates.fetch_missing_rates(rate_dates)
+        print("{} dates stored".format(len(stored)))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from api.chats.models import Chat, Message, SeenBy, InboxEntry
+from api.chats.models.inbox_entries import get_message_preview
+
+
+class Command(BaseCommand):
+    help = "Rebuild the chat inbox entries from the existing chats."
+
+    def handle(self, *args, **options):
+        chats = Chat.objects.exclude(last_message=None).select_related(
+            "last_message__sent_by",
+            "last_message__activity"
+        ).prefetch_related("participants")
+
+        entries = 0
+        for chat in chats.iterator(chunk_size=500):
+            message = chat.last_message
+            preview, activity_status = get_message_preview(message)
+            participants = list(chat.participants.all())
+            # Keep the current read watermarks, legacy chats fall back to SeenBy
+            seen = {
+                user_id: (message_id, created)
+                for user_id, message_id, created in SeenBy.objects.filter(chat=chat).exclude(
+                    message=None
+                ).values_list("user_id", "message_id", "message__created")
+            }
+            seen.update({
+                user_id: (message_id, created)
+                for user_id, message_id, created in InboxEntry.objects.filter(chat=chat).exclude(
+                    last_read_message=None
+                ).values_list("user_id", "last_read_message_id", "last_read_at")
+            })
+            for user in participants:
+                counterpart = next((p for p in participants if p.pk != user.pk), None)
+                unread_messages = Message.objects.filter(chat=chat).exclude(sent_by=user)
+                last_read_message_id, last_read_at = seen.get(user.pk, (None, None))
+                if last_read_at:
+                    unread_messages = unread_messages.filter(created__gt=last_read_at)
+                InboxEntry.objects.update_or_create(
+                    user=user,
+                    chat=chat,
+                    defaults={
+                        "counterpart": counterpart,
+                        "counterpart_username": counterpart.username if counterpart else None,
+                        "counterpart_picture": counterpart.picture.url if counterpart and counterpart.picture else None,
+                        "last_message": message,
+                        "last_message_preview": preview,
+                        "last_message_activity_status": activity_status,
+                        "last_message_sent_by": message.sent_by,
+                        "last_message_sent_by_username": message.sent_by.username if message.sent_by else None,
+                        "last_message_at": message.created,
+                        "last_read_message_id": last_read_message_id,
+                        "last_read_at": last_read_at,
+                        "unread_count": unread_messages.count(),
+                    }
+                )
+                entries += 1
+
+        print("{} inbox entries rebuilt".format(entries))
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.notifications import outbox
+import time
+
+
+class Command(BaseCommand):
+    help = "Publish the pending outbox events, continuously unless --once or --retry-failed is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument("--retry-failed", action="store_true", help="Publish again the events that gave up")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if options["retry_failed"]:
+            print("{} failed outbox events set to pending".format(outbox.retry_failed()))
+        if options["once"] or options["retry_failed"]:
+            published = 0
+            while True:
+                count = outbox.relay(batch_size)
+                published += count
+                if count < batch_size:
+                    break
+            print("{} outbox events published".format(published))
+            return
+
+        while True:
+            try:
+                count = outbox.relay(batch_size)
+            except Exception as e:
+                print("Outbox relay failed: {}".format(e))
+                count = 0
+            # Keep draining full batches, otherwise wait for new events
+            if count < batch_size:
+                time.sleep(settings.OUTBOX_POLL_INTERVAL)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.users.models import StripeEvent
+from api.users import webhooks
+from datetime import datetime
+import json
+import stripe
+
+
+class Command(BaseCommand):
+    help = "Process the Stripe events again: the failed ones, the given ones, or the ones since a date fetched from Stripe."
+
+    def add_arguments(self, parser):
+        parser.add_argument("event_ids", nargs="*", help="Stored events to process again")
+        parser.add_argument("--failed", action="store_true", help="Process again the events that failed")
+        parser.add_argument("--since", help="Store the events created in Stripe since this date (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        webhooks.set_api_key()
+
+        if options["since"]:
+            since = timezone.make_aware(datetime.strptime(options["since"], "%Y-%m-%d"))
+            events = stripe.Event.list(created={"gte": int(since.timestamp())}, types=list(webhooks.HANDLERS), limit=100)
+            stored = 0
+            for event in events.auto_paging_iter():
+                if webhooks.receive(json.dumps(event.to_dict_recursive())):
+                    stored += 1
+            print("{} missing events stored".format(stored))
+
+        replayed = StripeEvent.objects.none()
+        if options["failed"]:
+            replayed = StripeEvent.objects.filter(status=StripeEvent.FAILED)
+        if options["event_ids"]:
+            replayed = replayed | StripeEvent.objects.filter(event_id__in=options["event_ids"], type__in=webhooks.HANDLERS)
+        count = replayed.update(status=StripeEvent.PENDING, attempts=0)
+        print("{} events set to pending".format(count))
+
+        print("{} events processed".format(webhooks.process_pending()))
@@ -0,0 +1,37 @@
+# Generated by Django 3.0.3 on 2021-04-12 10:21
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Date time on which the object was created.', verbose_name='created at')),
+                ('modified', models.DateTimeField(auto_now=True, help_text='Date time on which the object was last modified.', verbose_name='modified at')),
+                ('base', models.CharField(default='USD', max_length=3)),
+                ('currency', models.CharField(max_length=3)),
+                ('rate_date', models.DateField()),
+                ('value', models.DecimalField(decimal_places=8, max_digits=20)),
+            ],
+            options={
+                'ordering': ['-created', '-modified'],
+                'get_latest_by': 'created',
+                'abstract': False,
+                'unique_together': {('base', 'rate_date', 'currency')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='exchangerate',
+            index=models.Index(fields=['base', '-rate_date'], name='utils_rate_base_date_idx'),
+        ),
+    ]
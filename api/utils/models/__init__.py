@@ -1 +1,2 @@
 from .models import CModel
+from .exchange_rates import ExchangeRate
@@ -0,0 +1,28 @@
+"""Exchange rates model."""
+
+# Django
+from django.db import models
+
+# Utilities
+from .models import CModel
+
+
+class ExchangeRate(CModel):
+    """Exchange rate of a currency against a base currency on a given date.
+
+    Rows are written by the update_exchange_rates task and never modified, so
+    a (base, rate_date) pair always resolves to the same rates.
+    """
+    base = models.CharField(max_length=3, default='USD')
+    currency = models.CharField(max_length=3)
+    rate_date = models.DateField()
+    value = models.DecimalField(max_digits=20, decimal_places=8)
+
+    class Meta(CModel.Meta):
+        unique_together = [['base', 'rate_date', 'currency']]
+        indexes = [
+            models.Index(fields=['base', '-rate_date'], name='utils_rate_base_date_idx'),
+        ]
+
+    def __str__(self):
+        return '{}/{} {}'.format(self.base, self.currency, self.rate_date)
@@ -0,0 +1,53 @@
+"""Sparse fieldsets and expandable embeds.
+
+?fields=id,status limits the fields returned by the serializer of the view
+and ?expand=seller,buyer replaces the compact embeds listed in
+Meta.expandable_fields with their full serializer, at any depth.
+"""
+
+# Django REST Framework
+from rest_framework import serializers
+
+
+def get_query_list(request, param):
+    """Return the set of comma separated values of a query param."""
+    if request is None or not hasattr(request, "query_params"):
+        return set()
+    value = request.query_params.get(param, "")
+    return set(name.strip() for name in value.split(",") if name.strip())
+
+
+def is_expanded(request, name):
+    return name in get_query_list(request, "expand")
+
+
+class DynamicFieldsMixin:
+    """Serializer mixin handling the fields and expand query params."""
+
+    def is_expanded(self, name):
+        return is_expanded(self.context.get("request"), name)
+
+    def is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get("request")
+        if request is None:
+            return fields
+
+        expand = get_query_list(request, "expand")
+        expandable_fields = getattr(self.Meta, "expandable_fields", {})
+        for name in expand.intersection(expandable_fields):
+            if name in fields:
+                fields[name] = expandable_fields[name](read_only=True)
+
+        only = get_query_list(request, "fields")
+        if only and self.is_root():
+            for name in list(fields):
+                if name not in only:
+                    fields.pop(name)
+        return fields
@@ -0,0 +1,27 @@
+# Django REST Framework
+from rest_framework.test import APITestCase
+
+# Models
+from api.users.models import User, Contact
+
+
+class DynamicFieldsAPITestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alex", "alex@gmail.com", "admin321")
+        self.contact = User.objects.create_user("ivan", "ivan@gmail.com", "admin321")
+        Contact.objects.create(from_user=self.user, contact_user=self.contact)
+        self.client.force_authenticate(self.user)
+
+    def test_compact_embed_by_default(self):
+        response = self.client.get("/api/contacts/")
+        contact_user = response.data["results"][0]["contact_user"]
+        self.assertEqual(contact_user["username"], "ivan")
+        self.assertNotIn("stripe_customer_id", contact_user)
+
+    def test_expand(self):
+        response = self.client.get("/api/contacts/", {"expand": "contact_user"})
+        self.assertIn("current_plan_subscription", response.data["results"][0]["contact_user"])
+
+    def test_fields(self):
+        response = self.client.get("/api/contacts/", {"fields": "contact_user"})
+        self.assertEqual(list(response.data["results"][0].keys()), ["contact_user"])
@@ -0,0 +1,74 @@
+# Django
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+# Utils
+from api.utils import exchange_rates, helpers
+
+# Utilities
+from decimal import Decimal
+from unittest import mock
+import requests
+
+
+class ExchangeRatesTestCase(TestCase):
+    def setUp(self):
+
+        exchange_rates.store_rates("2021-04-01", {
+            "USD": Decimal("1"),
+            "EUR": Decimal("0.85"),
+            "GBP": Decimal("0.72"),
+        })
+        exchange_rates.store_rates("2021-04-02", {
+            "USD": Decimal("1"),
+            "EUR": Decimal("0.80"),
+            "GBP": Decimal("0.70"),
+        })
+
+    def test_latest_rate(self):
+        """Latest rate should come from the most recent date"""
+        rate, rate_date = helpers.get_currency_rate("eur")
+        self.assertEqual(rate_date, "2021-04-02")
+        self.assertAlmostEqual(rate, 0.80)
+
+    def test_historical_rate(self):
+        """A stored rate_date should always resolve to its own rates"""
+        rate, rate_date = helpers.get_currency_rate("EUR", "2021-04-01")
+        self.assertEqual(rate_date, "2021-04-01")
+        self.assertAlmostEqual(rate, 0.85)
+
+    def test_cross_rate_conversion(self):
+        """Conversions from a non USD base should use the cross rate"""
+        converted, _ = helpers.convert_currency("USD", "EUR", 85, "2021-04-01")
+        self.assertAlmostEqual(converted, 100)
+
+    def test_stored_rates_are_immutable(self):
+        """Storing a date twice should keep the first rates"""
+        exchange_rates.store_rates("2021-04-01", {"EUR": Decimal("2")})
+        rate, _ = helpers.get_currency_rate("EUR", "2021-04-01")
+        self.assertAlmostEqual(rate, 0.85)
+
+    @override_settings(EXCHANGE_RATES_HTTP_FALLBACK=True)
+    def test_missing_historical_rate_is_queued(self):
+        """A missing rate_date should not be fetched by the lookup but by fetch_missing_rates"""
+        cache.delete(exchange_rates.MISSING_KEY)
+        fetched = ("2021-03-15", {"USD": Decimal("1"), "EUR": Decimal("0.90")})
+        with mock.patch.object(exchange_rates, "fetch_rates", return_value=fetched) as fetch_rates:
+            rate, rate_date = helpers.get_currency_rate("EUR", "2021-04-03")
+            self.assertEqual(rate_date, "2021-04-02")
+            fetch_rates.assert_not_called()
+            self.assertEqual(exchange_rates.fetch_missing_rates(), ["2021-04-03"])
+        fetch_rates.assert_called_once_with("2021-04-03")
+        rate, rate_date = helpers.get_currency_rate("EUR", "2021-04-03")
+        self.assertEqual(rate_date, "2021-04-03")
+        self.assertAlmostEqual(rate, 0.90)
+
+    @override_settings(EXCHANGE_RATES_HTTP_FALLBACK=True)
+    def test_failed_date_is_not_queued_again(self):
+        """A date that could not be fetched should not be queued until its failure expires"""
+        cache.delete(exchange_rates.MISSING_KEY)
+        error = requests.RequestException("down")
+        with mock.patch.object(exchange_rates, "fetch_rates", side_effect=error):
+            self.assertEqual(exchange_rates.fetch_missing_rates(["2021-04-05"]), [])
+        helpers.get_currency_rate("EUR", "2021-04-05")
+        self.assertFalse(cache.get(exchange_rates.MISSING_KEY))
@@ -0,0 +1,35 @@
+# Django
+from django.test import TestCase
+from django.core.management import call_command
+
+# Utils
+from api.utils import geoip
+from unittest import mock
+
+
+class GeoIPTestCase(TestCase):
+    def setUp(self):
+
+        # Create the plans
+        call_command("createplans")
+        geoip.clear_cache()
+
+    def test_private_ip_falls_back_to_default(self):
+        """Unknown addresses should resolve to US and USD"""
+        self.assertEqual(geoip.get_currency_and_country("127.0.0.1"), ("USD", "US"))
+
+    def test_country_with_plan_currency(self):
+        """Countries with a plan in their currency should get that currency"""
+        self.assertEqual(geoip.get_currency("GB"), "GBP")
+        self.assertEqual(geoip.get_currency("ES"), "EUR")
+
+    def test_country_without_plan_currency(self):
+        """Countries without a plan in their currency should get USD"""
+        self.assertEqual(geoip.get_currency("AR"), "USD")
+
+    def test_failed_lookups_are_not_cached(self):
+        """A lookup that failed should be retried on the next request"""
+        with mock.patch.object(geoip, "lookup_country", return_value=None):
+            self.assertEqual(geoip.get_currency_and_country("81.0.0.1"), ("USD", "US"))
+        with mock.patch.object(geoip, "lookup_country", return_value="GB"):
+            self.assertEqual(geoip.get_currency_and_country("81.0.0.1"), ("GBP", "GB"))
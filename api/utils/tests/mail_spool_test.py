@@ -0,0 +1,112 @@
+# Django
+from django.core import mail
+from django.test import TestCase
+
+# Utils
+from api.utils import mail_spool
+from unittest import mock
+import json
+
+
+class FakeRedis:
+    """The few list and string commands used by the mail spool."""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+    def lpush(self, key, value):
+        self.data.setdefault(key, []).insert(0, value)
+
+    def rpush(self, key, value):
+        self.data.setdefault(key, []).append(value)
+
+    def rpoplpush(self, source, destination):
+        if not self.data.get(source):
+            return None
+        value = self.data[source].pop()
+        self.lpush(destination, value)
+        return value
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class MailSpoolTestCase(TestCase):
+
+    def test_send_batch(self):
+        messages = [{
+            'subject': 'Reset your password',
+            'html': '<p>Hi {}</p>'.format(recipient),
+            'from_email': 'Freelanium <no-reply@freelanium.com>',
+            'to': recipient,
+            'attempts': 0,
+        } for recipient in ['alex@gmail.com', 'ivan@gmail.com']]
+
+        self.assertEqual(mail_spool.send_batch(messages), [])
+        self.assertEqual([message.to for message in mail.outbox], [['alex@gmail.com'], ['ivan@gmail.com']])
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>Hi alex@gmail.com</p>', 'text/html')])
+
+
+class MailSpoolDrainTestCase(TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        patcher = mock.patch.object(mail_spool, "get_client", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_drain_sends_the_oldest_first(self):
+        for recipient in ['alex@gmail.com', 'ivan@gmail.com', 'maria@gmail.com']:
+            mail_spool.spool('Welcome', '<p>Welcome</p>', 'Freelanium <no-reply@freelanium.com>', [recipient])
+        metrics = mail_spool.drain(batch_size=2)
+        self.assertEqual((metrics['batches'], metrics['sent']), (2, 3))
+        self.assertEqual(
+            [message.to for message in mail.outbox],
+            [['alex@gmail.com'], ['ivan@gmail.com'], ['maria@gmail.com']]
+        )
+        self.assertFalse(self.redis.data.get(mail_spool.SPOOL_KEY))
+        self.assertFalse(self.redis.data.get(mail_spool.PROCESSING_KEY))
+        self.assertNotIn(mail_spool.DRAIN_KEY, self.redis.data)
+
+    def test_batch_of_an_interrupted_flush_is_sent(self):
+        mail_spool.spool('Welcome', '<p>Welcome</p>', 'Freelanium <no-reply@freelanium.com>', ['alex@gmail.com'])
+        with mock.patch.object(mail_spool, "send_batch", side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                mail_spool.drain()
+        self.assertEqual(len(self.redis.data[mail_spool.PROCESSING_KEY]), 1)
+
+        metrics = mail_spool.drain()
+        self.assertEqual((metrics['respooled'], metrics['sent']), (1, 1))
+        self.assertEqual([message.to for message in mail.outbox], [['alex@gmail.com']])
+
+    def test_failed_messages_are_spooled_again(self):
+        mail_spool.spool('Welcome', '<p>Welcome</p>', 'Freelanium <no-reply@freelanium.com>', ['alex@gmail.com'])
+        with mock.patch.object(mail_spool, "send_batch", side_effect=lambda messages: messages):
+            metrics = mail_spool.drain()
+        self.assertEqual(metrics['retried'], 1)
+        self.assertFalse(self.redis.data.get(mail_spool.PROCESSING_KEY))
+        self.assertEqual(json.loads(self.redis.data[mail_spool.SPOOL_KEY][0])['attempts'], 1)
+
+    def test_single_flush_at_a_time(self):
+        self.redis.set(mail_spool.DRAIN_KEY, 1)
+        self.assertIsNone(mail_spool.drain())
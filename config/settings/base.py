@@ -72,7 +72,7 @@ INSTALLED_APPS = [
     "api.notifications.apps.NotificationsConfig",
     "api.orders.apps.OrdersAppConfig",
     "api.activities.apps.ActivitiesAppConfig",
-    "api.chats",
+    "api.chats.apps.ChatsConfig",
     # THIRD_PARTY_APPS
     "rest_framework",
     "rest_framework.authtoken",
@@ -349,12 +349,67 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERYD_TASK_TIME_LIMIT = 5 * 60
 CELERYD_TASK_SOFT_TIME_LIMIT = 60
+# Queues, routes and rate limits are set in api/taskapp/celery.py. Each
+# worker consumes its queues with the pool and prefetch given by its env
+CELERY_WORKER_PREFETCH_MULTIPLIER = env.int("CELERY_WORKER_PREFETCH_MULTIPLIER", default=1)
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    # Redis consumes the queues of a worker in the order given with -Q, and
+    # the tasks of a queue from priority 0 to 9
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(10)),
+    'visibility_timeout': 60 * 60,
+}
+CELERY_EMAIL_RATE_LIMIT = env("CELERY_EMAIL_RATE_LIMIT", default="10/s")
 
 FILE_UPLOAD_HANDLERS = ["django.core.files.uploadhandler.TemporaryFileUploadHandler"]
 
 # Websockets
 ASGI_APPLICATION = "config.routing.application"
 
+# Chat attachments uploaded in chunks over the chat websocket
+CHAT_UPLOAD_MAX_SIZE = env.int('CHAT_UPLOAD_MAX_SIZE', default=50 * 1024 * 1024)
+CHAT_UPLOAD_CHUNK_SIZE = env.int('CHAT_UPLOAD_CHUNK_SIZE', default=256 * 1024)
+CHAT_UPLOAD_MAX_PENDING = env.int('CHAT_UPLOAD_MAX_PENDING', default=5)
+
+
+# Presence
+PRESENCE_REDIS_URL = env("REDIS_URL")
+PRESENCE_TTL = env.int("PRESENCE_TTL", default=90)
+PRESENCE_HEARTBEAT_INTERVAL = env.int("PRESENCE_HEARTBEAT_INTERVAL", default=30)
+
+# Outbox
+OUTBOX_BATCH_SIZE = env.int("OUTBOX_BATCH_SIZE", default=500)
+OUTBOX_POLL_INTERVAL = env.float("OUTBOX_POLL_INTERVAL", default=0.5)
+OUTBOX_MAX_ATTEMPTS = env.int("OUTBOX_MAX_ATTEMPTS", default=10)
+
+# Mail spool
+MAIL_SPOOL_REDIS_URL = env("REDIS_URL")
+MAIL_SPOOL_BATCH_SIZE = env.int("MAIL_SPOOL_BATCH_SIZE", default=100)
+# Seconds a flush keeps sending, below CELERYD_TASK_SOFT_TIME_LIMIT
+MAIL_SPOOL_TIME_LIMIT = env.float("MAIL_SPOOL_TIME_LIMIT", default=45)
+MAIL_SPOOL_FLUSH_DELAY = env.int("MAIL_SPOOL_FLUSH_DELAY", default=2)
+MAIL_SPOOL_MAX_ATTEMPTS = env.int("MAIL_SPOOL_MAX_ATTEMPTS", default=5)
+
+# New messages emails are sent in a digest this many seconds after the first
+MESSAGES_DIGEST_DELAY = env.int("MESSAGES_DIGEST_DELAY", default=15 * 60)
+MESSAGES_DIGEST_CHUNK_SIZE = env.int("MESSAGES_DIGEST_CHUNK_SIZE", default=500)
+
+# Balances ledger
+# Entries newer than this are left to the next snapshot, so the ones of
+# transactions still open when it is taken are not skipped
+BALANCE_SNAPSHOT_LAG = env.int("BALANCE_SNAPSHOT_LAG", default=300)
+SETTLEMENT_CHUNK_SIZE = env.int("SETTLEMENT_CHUNK_SIZE", default=1000)
+
+# Stripe webhook events are retried every minute up to this many times
+STRIPE_EVENTS_MAX_ATTEMPTS = env.int("STRIPE_EVENTS_MAX_ATTEMPTS", default=10)
+
+# Seconds the local mirror of the payment methods of a customer is served
+# before it is refreshed from Stripe in the background
+PAYMENT_METHODS_TTL = env.int("PAYMENT_METHODS_TTL", default=6 * 60 * 60)
+
+# Subscriptions
+SUBSCRIPTIONS_SWEEP_CHUNK_SIZE = env.int("SUBSCRIPTIONS_SWEEP_CHUNK_SIZE", default=1000)
 
 CHANNEL_LAYERS = {
     "default": {
@@ -368,10 +423,17 @@ CHANNEL_LAYERS = {
 # Exchange
 # OPEN_EXCHANGE_RATES_APP_ID =
 CURRENCIES = ('USD', 'EUR')
-EXCHANGE_BACKEND = 'djmoney.contrib.exchange.backends.FixerBackend'
+EXCHANGE_BACKEND = 'api.utils.exchange_rates.ExchangeRateHostBackend'
+EXCHANGE_RATES_URL = 'https://api.exchangerate.host/{rate_date}'
+EXCHANGE_RATES_LATEST_TTL = env.int('EXCHANGE_RATES_LATEST_TTL', default=300)
+EXCHANGE_RATES_HTTP_FALLBACK = env.bool('EXCHANGE_RATES_HTTP_FALLBACK', default=False)
+EXCHANGE_RATES_FAILED_TTL = env.int('EXCHANGE_RATES_FAILED_TTL', default=3600)
 OPEN_EXCHANGE_RATES_URL = 'https://openexchangerates.org/api/historical/2017-01-01.json?symbols=USD,EUR,NOK,SEK,CZK'
 FIXER_URL = 'http://data.fixer.io/api/2013-12-24?symbols=USD,EUR,NOK,SEK,CZK'
 
 
 # GeoIP2
 GEOIP_PATH = os.path.join(BASE_DIR, 'geolite2-db')
+GEOIP_COUNTRY = 'GeoLite2-Country.mmdb'
+GEOIP_CACHE_SIZE = env.int('GEOIP_CACHE_SIZE', default=10000)
+GEOIP_HTTP_FALLBACK = env.bool('GEOIP_HTTP_FALLBACK', default=False)
@@ -40,3 +40,6 @@ TEMPLATES[0]["OPTIONS"]["loaders"] = [  # NOQA
 EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 EMAIL_HOST = "localhost"
 EMAIL_PORT = 1025
+
+# Celery
+CELERY_TASK_ALWAYS_EAGER = True